@@ -1,13 +1,33 @@
 """Manages PostgreSQL logical replication."""
 
+import argparse
 import asyncio
 import logging
+import signal
 import sys
 from typing import cast, Optional, List
 
 from . import cli
 
 
+async def run(args: argparse.Namespace) -> int:
+    """Run the command, cancelling it on Ctrl-C.
+
+    Commands that run until interrupted catch the cancellation, clean up
+    and exit successfully. Others exit with the usual code for SIGINT.
+    """
+
+    task = asyncio.ensure_future(args.func(args))
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGINT, task.cancel)
+    try:
+        return cast(int, await task)
+    except asyncio.CancelledError:
+        return 128 + signal.SIGINT
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
+
+
 def main(cmdline: Optional[List[str]] = None) -> int:
     parser = cli.make_parser(description=__doc__)
     args = parser.parse_args(cmdline)
@@ -15,8 +35,7 @@ def main(cmdline: Optional[List[str]] = None) -> int:
         format='%(asctime)s | %(levelname)-7s | %(name)-20s | %(message)s',
         level=getattr(logging, args.log_level),
     )
-    coroutine = args.func(args)
-    return cast(int, asyncio.run(coroutine))
+    return asyncio.run(run(args))
 
 
 if __name__ == '__main__':
@@ -1,25 +1,180 @@
 """Pre-flight checks."""
 
 import argparse
-import difflib
+import asyncio
+import logging
 import tempfile
+import time
 from gettext import ngettext
 from ipaddress import ip_network
-from typing import AsyncGenerator, Optional, NamedTuple
+from pathlib import Path
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    NamedTuple,
+    Sequence,
+    Tuple,
+)
 
 import asyncpg  # type: ignore
 
+from ivory.constants import DEFAULT_SUBSCRIPTION_NAME
+from ivory.constants import REPLICATION_APPLICATION_NAME
 from ivory.constants import REPLICATION_USERNAME
+from ivory import db
+from ivory import helpers
+from ivory import plan
 from ivory import schema
+from ivory import schemacache
+from ivory import schemadiff
 
 
-__all__ = ('find_problems',)
+__all__ = ('add_arguments', 'find_problems')
+
+log = logging.getLogger(__name__)
+
+
+Check = Callable[..., Awaitable[Optional[str]]]
 
 
 class CheckResult(NamedTuple):
     checker: str
     description: str
     error: Optional[str]
+    duration: float
+
+
+def check_timeout(value: str) -> Tuple[str, float]:
+    if ':' not in value:
+        raise ValueError("expected colon-separated `check:seconds` value")
+
+    (check, timeout) = value.split(':')
+    if check not in {check.__name__ for check in CHECKS}:
+        raise argparse.ArgumentTypeError(
+            f"unknown check {check!r}, choose from "
+            + ', '.join(check.__name__ for check in CHECKS)
+        )
+    return (check, float(timeout))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add arguments for commands running pre-flight checks."""
+
+    group = parser.add_argument_group('check options')
+    group.add_argument(
+        '--sequential-checks',
+        help=(
+            "Run checks one after another instead of concurrently. "
+            "By default, all checks are started at once and reported "
+            "in the order they finish."
+        ),
+        action='store_true',
+        default=False,
+    )
+    group.add_argument(
+        '--check-timeout',
+        help=(
+            "Fail checks that take longer than this many seconds. "
+            "By default, checks may take as long as they need."
+        ),
+        type=float,
+        default=None,
+    )
+    group.add_argument(
+        '--per-check-timeout',
+        help=(
+            "Specify a timeout on a per-check basis. Timeouts are specified "
+            "in the form `check:seconds`, for example `check_schema_sync:600`. "
+            "Overrides `--check-timeout` for the given check."
+        ),
+        action='append',
+        type=check_timeout,
+        default=[],
+        dest='check_timeouts',
+    )
+    group.add_argument(
+        '--full-schema-check',
+        help=(
+            "Always compare complete `pg_dump` output of both databases. "
+            "By default, schemas are compared by hashing catalog entries "
+            "first, and only objects that differ are dumped. Implies "
+            "`--no-schema-cache`."
+        ),
+        action='store_true',
+        default=False,
+    )
+    group.add_argument(
+        '--schema-diff-format',
+        help=(
+            "Format to write schema differences in. Only objects that "
+            "differ between source and target are included."
+        ),
+        choices=('html', 'unified'),
+        default='html',
+    )
+    group.add_argument(
+        '--huge-table-size',
+        help=(
+            "Warn when more tables of at least this size, for example `10GB`, "
+            "exist than tables can be synchronized in parallel."
+        ),
+        type=helpers.parse_size,
+        default='10GB',
+    )
+    group.add_argument(
+        '--max-apply-scan-size',
+        help=(
+            "Fail when the target needs to scan a table of at least this size, "
+            "for example `64MB`, for each replicated UPDATE or DELETE, because "
+            "no index can be used to look up the row."
+        ),
+        type=helpers.parse_size,
+        default='64MB',
+    )
+    group.add_argument(
+        '--scan-throughput',
+        help=(
+            "Bytes per second the target scans tables with, "
+            "used for estimating the cost of applying a single row."
+        ),
+        type=plan.throughput,
+        default='500MB',
+    )
+    group.add_argument(
+        '--apply-throughput',
+        help=(
+            "Bytes of WAL per second the target can apply, for example `20MB`. "
+            "If given, fail when the source generates WAL faster than this, "
+            "see `--wal-rate`. Note that the source WAL rate includes all databases of the "
+            "cluster, so it is an upper bound of what needs to be replicated."
+        ),
+        type=plan.throughput,
+        default=None,
+    )
+    group.add_argument(
+        '--schema-cache-dir',
+        help=(
+            "Directory to cache schema dumps in. Dumps are reused "
+            "as long as the database catalogs are unchanged."
+        ),
+        type=Path,
+        default=helpers.cache_directory() / 'schemas',
+    )
+    group.add_argument(
+        '--schema-cache-size',
+        help="Maximum total size of cached schema dumps, for example `512MB`.",
+        type=helpers.parse_size,
+        default='256MB',
+    )
+    group.add_argument(
+        '--no-schema-cache',
+        help="Always run `pg_dump` instead of using cached schema dumps.",
+        action='store_true',
+        default=False,
+    )
 
 
 async def find_problems(
@@ -27,22 +182,69 @@ async def find_problems(
     target_db: asyncpg.Connection,
     args: argparse.Namespace,
 ) -> AsyncGenerator[CheckResult, None]:
-    # https://www.cybertec-postgresql.com/en/upgrading-postgres-major-versions-using-logical-replication/
-    checks = (
-        check_has_correct_wal_level,
-        check_allows_replication_connections,
-        check_replica_identity_set,
-        check_schema_sync,
-        check_database_options,
-    )
+    """Run all checks and yield their results.
+
+    Checks still running are cancelled when the generator is closed, so
+    callers that stop iterating early need to close it, for example with
+    `contextlib.aclosing`.
+    """
+
+    if args.sequential_checks:
+        for check in CHECKS:
+            yield await run_check(
+                check, source_db=source_db, target_db=target_db, args=args
+            )
+        return
+
+    # Checks share the connections, so queries need to take turns.
+    # Anything that does not talk to the connections, such as
+    # `pg_dump`, runs in parallel.
+    shared_source_db = db.SerializedConnection(source_db)
+    shared_target_db = db.SerializedConnection(target_db)
+    tasks = [
+        asyncio.ensure_future(
+            run_check(
+                check, source_db=shared_source_db, target_db=shared_target_db, args=args
+            )
+        )
+        for check in CHECKS
+    ]
+
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def run_check(
+    check: Check,
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> CheckResult:
+    """Run a single check, measuring its duration and enforcing its timeout."""
+
+    assert check.__doc__ is not None
 
-    for check in checks:
-        assert check.__doc__ is not None
+    timeout = dict(args.check_timeouts).get(check.__name__, args.check_timeout)
+    started = time.monotonic()
 
-        error = await check(source_db=source_db, target_db=target_db, args=args)
-        yield CheckResult(
-            checker=check.__name__, description=check.__doc__, error=error
+    try:
+        error = await asyncio.wait_for(
+            check(source_db=source_db, target_db=target_db, args=args),
+            timeout=timeout,
         )
+    except asyncio.TimeoutError:
+        error = f"timed out after {timeout} seconds"
+
+    return CheckResult(
+        checker=check.__name__,
+        description=check.__doc__,
+        error=error,
+        duration=time.monotonic() - started,
+    )
 
 
 async def check_has_correct_wal_level(
@@ -140,37 +342,82 @@ async def check_schema_sync(
 ) -> Optional[str]:
     """Source and target database schemas are in sync."""
 
-    source_schema = await schema.dump(
-        host=args.source_host,
-        port=args.source_port,
-        dbname=args.source_dbname,
-        user=args.source_user,
-        password=args.source_password,
-    )
-    target_schema = await schema.dump(
-        host=args.target_host,
-        port=args.target_port,
-        dbname=args.target_dbname,
-        user=args.target_user,
-        password=args.target_password,
-    )
-
-    if source_schema != target_schema:
-        differ = difflib.HtmlDiff(tabsize=4)
-        with tempfile.NamedTemporaryFile(
-            prefix='ivory-schema-diff-', suffix='.html', delete=False, mode='w+'
-        ) as f:
-            content = differ.make_file(
-                fromlines=source_schema.splitlines(),
-                tolines=target_schema.splitlines(),
-                fromdesc="Source schema",
-                todesc="Target schema",
-                context=True,
-            )
-            f.write(content)
-        return f"relation schemas out of sync, see {f.name!r}"
+    source_tables: Optional[Sequence[str]] = None
+    target_tables: Optional[Sequence[str]] = None
+
+    if not args.full_schema_check:
+        source_prints = await schema.fingerprint(source_db)
+        target_prints = await schema.fingerprint(target_db)
+        differing = schema.differing_objects(source_prints, target_prints)
+        if not differing:
+            return None
+
+        source_tables = schema.tables_to_dump(differing, source_prints, target_prints)
+        target_tables = schema.tables_to_dump(differing, target_prints, source_prints)
+        if source_tables is None or target_tables is None:
+            (source_tables, target_tables) = (None, None)
+
+    # A complete comparison does not trust cached dumps either.
+    cache_dir = (
+        None
+        if args.no_schema_cache or args.full_schema_check
+        else args.schema_cache_dir
+    )
 
-    return None
+    async def dump_source() -> str:
+        if source_tables is not None and not source_tables:
+            return ''
+        return await schemacache.dump(
+            source_db,
+            cache_dir=cache_dir,
+            max_size=args.schema_cache_size,
+            host=args.source_host,
+            port=args.source_port,
+            dbname=args.source_dbname,
+            user=args.source_user,
+            password=args.source_password,
+            tables=source_tables,
+        )
+
+    async def dump_target() -> str:
+        if target_tables is not None and not target_tables:
+            return ''
+        return await schemacache.dump(
+            target_db,
+            cache_dir=cache_dir,
+            max_size=args.schema_cache_size,
+            host=args.target_host,
+            port=args.target_port,
+            dbname=args.target_dbname,
+            user=args.target_user,
+            password=args.target_password,
+            tables=target_tables,
+        )
+
+    (source_schema, target_schema) = await asyncio.gather(dump_source(), dump_target())
+
+    result = schemadiff.diff(source_schema, target_schema)
+    if result.empty:
+        return None
+
+    log.warning("Schema differences: %s.", schemadiff.summarize(result))
+    for key in result.removed:
+        log.debug("%s only exists on source.", schemadiff.describe(key))
+    for key in result.added:
+        log.debug("%s only exists on target.", schemadiff.describe(key))
+    for key in result.changed:
+        log.debug("%s differs between source and target.", schemadiff.describe(key))
+
+    if args.schema_diff_format == 'html':
+        (suffix, content) = ('.html', schemadiff.render_html(result))
+    else:
+        (suffix, content) = ('.diff', schemadiff.render_unified(result))
+
+    with tempfile.NamedTemporaryFile(
+        prefix='ivory-schema-diff-', suffix=suffix, delete=False, mode='w+'
+    ) as f:
+        f.write(content)
+    return f"relation schemas out of sync, see {f.name!r}"
 
 
 async def check_database_options(
@@ -210,3 +457,271 @@ async def check_database_options(
         if source_value != target_value:
             return f"database {key} is {source_value!r} on source, but {target_value!r} on target"
     return None
+
+
+def tablesync_patterns(subscription_oid: Optional[int]) -> List[str]:
+    """Return LIKE patterns for the slots of the subscription's table synchronization.
+
+    The slot names, which table synchronization workers also connect
+    with as application name, are `<slot name>_<subscription oid>_sync_<relid>`
+    up to PostgreSQL 13 and `pg_<subscription oid>_sync_<relid>_<system id>`
+    since PostgreSQL 14.
+
+    Example:
+
+        >>> print(*tablesync_patterns(16401))
+        %\\_16401\\_sync\\_% pg\\_16401\\_sync\\_%
+        >>> tablesync_patterns(None)
+        []
+    """
+
+    if subscription_oid is None:
+        return []
+    return [
+        f'%\\_{subscription_oid}\\_sync\\_%',
+        f'pg\\_{subscription_oid}\\_sync\\_%',
+    ]
+
+
+async def check_replication_capacity(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> Optional[str]:
+    """The databases have capacity for replication and parallel table synchronization."""
+
+    # Slots, WAL senders and workers used by an existing ivory replication
+    # would be reused, so they count as free.
+    subscription_name = getattr(args, 'subscription_name', DEFAULT_SUBSCRIPTION_NAME)
+
+    (
+        max_logical_workers,
+        max_worker_processes,
+        used_logical_workers,
+        subscription_oid,
+    ) = await target_db.fetchrow(
+        """
+        SELECT
+            current_setting('max_logical_replication_workers')::int,
+            current_setting('max_worker_processes')::int,
+            (
+                SELECT count(*) FROM pg_catalog.pg_stat_subscription
+                WHERE pid IS NOT NULL AND subname != $1
+            ),
+            (
+                SELECT s.oid FROM pg_catalog.pg_subscription AS s
+                JOIN pg_catalog.pg_database AS d ON d.oid = s.subdbid
+                WHERE s.subname = $1 AND d.datname = current_database()
+            )
+        """,
+        subscription_name,
+    )
+    sync_patterns = tablesync_patterns(subscription_oid)
+    (max_slots, used_slots, max_senders, used_senders) = await source_db.fetchrow(
+        """
+        SELECT
+            current_setting('max_replication_slots')::int,
+            (
+                SELECT count(*) FROM pg_catalog.pg_replication_slots
+                WHERE slot_name != $1 AND NOT slot_name LIKE ANY ($3::text[])
+            ),
+            current_setting('max_wal_senders')::int,
+            (
+                SELECT count(*) FROM pg_catalog.pg_stat_replication
+                WHERE application_name != $2
+                AND NOT application_name LIKE ANY ($3::text[])
+            )
+        """,
+        subscription_name,
+        REPLICATION_APPLICATION_NAME,
+        sync_patterns,
+    )
+
+    free_slots = max_slots - used_slots
+    free_senders = max_senders - used_senders
+    # The logical replication launcher takes up one background worker.
+    free_logical_workers = (
+        min(max_logical_workers, max_worker_processes - 1) - used_logical_workers
+    )
+
+    # The subscription needs one slot, WAL sender and worker for applying
+    # changes. Each table synchronized in parallel needs one more of each.
+    shortages = []
+    if free_slots < 1:
+        shortages.append(
+            f"no free replication slots on source ({used_slots} of "
+            f"max_replication_slots = {max_slots} in use)"
+        )
+    if free_senders < 1:
+        shortages.append(
+            f"no free WAL senders on source ({used_senders} of "
+            f"max_wal_senders = {max_senders} in use)"
+        )
+    if free_logical_workers < 1:
+        shortages.append(
+            f"no free logical replication workers on target ({used_logical_workers} of "
+            f"max_logical_replication_workers = {max_logical_workers} in use, "
+            f"max_worker_processes = {max_worker_processes})"
+        )
+    if shortages:
+        return ', '.join(shortages)
+
+    sync_workers = await plan.sync_workers(target_db)
+    parallelism = max(
+        0,
+        min(sync_workers, free_slots - 1, free_senders - 1, free_logical_workers - 1),
+    )
+    if parallelism < 1:
+        return (
+            "no capacity left for table synchronization workers, need at least "
+            "one more free replication slot and WAL sender on source and "
+            "logical replication worker on target"
+        )
+    if parallelism < sync_workers:
+        log.warning(
+            "Only %d of %d tables can be synchronized in parallel due to "
+            "limited free slots, WAL senders or workers.",
+            parallelism,
+            sync_workers,
+        )
+
+    tables = await plan.table_sizes(source_db, await plan.publication_tables(source_db))
+    huge_tables = [table for table in tables if table.size >= args.huge_table_size]
+    if len(huge_tables) > parallelism:
+        log.warning(
+            "%d tables are larger than %s, but only %d tables can be synchronized "
+            "in parallel, some of them will be copied one after another: %s.",
+            len(huge_tables),
+            helpers.format_size(args.huge_table_size),
+            parallelism,
+            ', '.join(table.name for table in huge_tables),
+        )
+
+    return None
+
+
+async def check_apply_lookup_index(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> Optional[str]:
+    """The target can look up rows via an index when applying UPDATE and DELETE."""
+
+    tables = await plan.publication_tables(source_db)
+    source_rows = await source_db.fetch(
+        """
+        SELECT
+            name,
+            c.relreplident,
+            pg_table_size(c.oid)
+        FROM
+            unnest($1::text[]) AS name
+            JOIN pg_catalog.pg_class AS c ON (c.oid = name::regclass)
+        """,
+        tables,
+    )
+    # Without a usable index, the target scans the whole table for every
+    # replicated UPDATE or DELETE. Before PostgreSQL 16, only the primary
+    # key or replica identity index is used. Since then, any B-tree index
+    # on a plain column is used for tables with REPLICA IDENTITY FULL.
+    target_rows = await target_db.fetch(
+        """
+        SELECT
+            name,
+            EXISTS (
+                SELECT FROM pg_catalog.pg_index AS i
+                WHERE i.indrelid = c.oid
+                AND i.indisvalid AND i.indisready AND i.indislive
+                AND (i.indisprimary OR i.indisreplident)
+            ),
+            current_setting('server_version_num')::int >= 160000 AND EXISTS (
+                SELECT FROM pg_catalog.pg_index AS i
+                JOIN pg_catalog.pg_class AS ic ON (ic.oid = i.indexrelid)
+                JOIN pg_catalog.pg_am AS am ON (am.oid = ic.relam)
+                WHERE i.indrelid = c.oid
+                AND i.indisvalid AND i.indisready AND i.indislive
+                AND am.amname = 'btree'
+                AND i.indpred IS NULL
+                AND i.indkey[0] != 0
+            )
+        FROM
+            unnest($1::text[]) AS name
+            JOIN pg_catalog.pg_class AS c ON (c.oid = to_regclass(name))
+        """,
+        tables,
+    )
+    target_indexes = {
+        name: (identity_index, btree_index)
+        for (name, identity_index, btree_index) in target_rows
+    }
+
+    problems = []
+    for (name, replident, size) in source_rows:
+        if name not in target_indexes or replident == b'n':
+            # Missing tables are reported by the schema check, and
+            # tables with REPLICA IDENTITY NOTHING do not replicate
+            # UPDATE or DELETE at all.
+            continue
+
+        (identity_index, btree_index) = target_indexes[name]
+        if identity_index or (replident == b'f' and btree_index):
+            continue
+        if size < args.max_apply_scan_size:
+            continue
+
+        if replident == b'f':
+            reason = "REPLICA IDENTITY FULL"
+        else:
+            reason = "no primary key or replica identity index on target"
+
+        seconds_per_row = size / args.scan_throughput
+        problems.append(
+            f"{name} ({reason}, {helpers.format_size(size)}, "
+            f"~{seconds_per_row:.2f}s per row)"
+        )
+
+    if problems:
+        return (
+            "target scans the whole table for each replicated UPDATE/DELETE on "
+            f"table{ngettext('', 's', len(problems))} {', '.join(problems)}"
+        )
+    return None
+
+
+async def check_wal_generation_rate(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> Optional[str]:
+    """The target can apply WAL as fast as the source generates it."""
+
+    if args.apply_throughput is None:
+        # Sampling takes a while, only do it when there is something to compare.
+        return None
+
+    rate = await plan.source_wal_rate(source_db, args)
+    log.info(
+        "Source generates %s/s of WAL, replication needs "
+        "to sustain that throughput to catch up.",
+        helpers.format_size(rate),
+    )
+
+    if rate > args.apply_throughput:
+        return (
+            f"source generates {helpers.format_size(rate)}/s of WAL, but target "
+            f"applies only {helpers.format_size(args.apply_throughput)}/s"
+        )
+    return None
+
+
+# https://www.cybertec-postgresql.com/en/upgrading-postgres-major-versions-using-logical-replication/
+CHECKS: Tuple[Check, ...] = (
+    check_has_correct_wal_level,
+    check_allows_replication_connections,
+    check_replica_identity_set,
+    check_schema_sync,
+    check_database_options,
+    check_replication_capacity,
+    check_apply_lookup_index,
+    check_wal_generation_rate,
+)
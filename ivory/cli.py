@@ -4,6 +4,7 @@ from typing import Any
 
 from ivory.commands import check
 from ivory.commands import copyschema
+from ivory.commands import exporter
 from ivory.commands import replication
 from ivory.commands import syncsequences
 
@@ -102,6 +103,11 @@ def make_parser(**kwargs: Any) -> argparse.ArgumentParser:
     parser_copyschema.set_defaults(func=copyschema.run)
     copyschema.add_arguments(parser_copyschema)
 
+    parser_exporter = subparsers.add_parser('exporter', help=exporter.__doc__)
+    parser_exporter.description = exporter.run.__doc__
+    parser_exporter.set_defaults(func=exporter.run)
+    exporter.add_arguments(parser_exporter)
+
     parser_replication = subparsers.add_parser(
         'replication', help="Manage logical replication."
     )
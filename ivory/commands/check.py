@@ -2,12 +2,14 @@
 
 import argparse
 import ast
+import contextlib
 import logging
 import sys
 import webbrowser
 
 from ivory import check
 from ivory import db
+from ivory import plan
 
 
 log = logging.getLogger(__name__)
@@ -26,6 +28,8 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
         action='store_true',
         default=not sys.stdout.isatty(),
     )
+    check.add_arguments(parser)
+    plan.add_wal_rate_arguments(parser.add_argument_group('WAL rate options'))
 
 
 async def run(args: argparse.Namespace) -> int:
@@ -33,7 +37,8 @@ async def run(args: argparse.Namespace) -> int:
 
     This runs a collection of checks that report any issues. By default,
     passed checks are not reported, use logging level DEBUG to view the
-    output of passed checks.
+    output of passed checks. Checks run concurrently and are reported in
+    the order they finish, together with the time they took.
 
     If a difference is found in the Schema, a webbrowser will be opened
     to inspect it. See the `--no-webbrowser` flag for details.
@@ -45,18 +50,28 @@ async def run(args: argparse.Namespace) -> int:
 
     (source_db, target_db) = await db.connect(args)
 
-    async for result in check.find_problems(
-        source_db=source_db, target_db=target_db, args=args
-    ):
-        if result.error is None:
-            log.debug(result.description)
-        else:
-            if result.checker == 'check_schema_sync' and not args.no_webbrowser:
-                *_, quoted_filename = result.error.split()
-                filename = ast.literal_eval(quoted_filename)
-                webbrowser.open(filename)
-
-            log.error("%s: %s.", result.checker, result.error)
-            rc = 1
+    async with contextlib.aclosing(
+        check.find_problems(source_db=source_db, target_db=target_db, args=args)
+    ) as results:
+        async for result in results:
+            if result.error is None:
+                log.debug("%s (%.2f seconds)", result.description, result.duration)
+            else:
+                if (
+                    result.checker == 'check_schema_sync'
+                    and args.schema_diff_format == 'html'
+                    and not args.no_webbrowser
+                ):
+                    *_, quoted_filename = result.error.split()
+                    filename = ast.literal_eval(quoted_filename)
+                    webbrowser.open(filename)
+
+                log.error(
+                    "%s: %s (%.2f seconds).",
+                    result.checker,
+                    result.error,
+                    result.duration,
+                )
+                rc = 1
 
     return rc
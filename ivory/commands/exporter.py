@@ -0,0 +1,243 @@
+"""Export replication status metrics."""
+
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import asyncpg  # type: ignore
+
+from ivory import constants
+from ivory import db
+from ivory import metrics
+from ivory import status
+
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Seconds a client may take to send its request.
+REQUEST_TIMEOUT = 10
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add exporter command-specific arguments."""
+
+    parser.add_argument(
+        '--subscription-name',
+        help="The name of the subscription on the target database.",
+        default=constants.DEFAULT_SUBSCRIPTION_NAME,
+    )
+    parser.add_argument(
+        '--listen-address',
+        help="Address to serve metrics on at `/metrics`.",
+        default='127.0.0.1',
+    )
+    parser.add_argument(
+        '--port',
+        help="Port to serve metrics on.",
+        type=int,
+        default=9188,
+    )
+    parser.add_argument(
+        '--textfile',
+        help=(
+            "Write metrics once to this file for the node_exporter textfile "
+            "collector and exit, instead of serving them."
+        ),
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        '--cache-seconds',
+        help=(
+            "Serve collected metrics for this many seconds, so that multiple "
+            "scrapers do not multiply the load on the databases."
+        ),
+        type=float,
+        default=15.0,
+    )
+    parser.add_argument(
+        '--collect-timeout',
+        help=(
+            "Give up collecting metrics after this many seconds and report "
+            "`ivory_up 0`. Keep this below the scrape interval."
+        ),
+        type=float,
+        default=10.0,
+    )
+    parser.add_argument(
+        '--estimate-sizes',
+        help="Estimate copy progress cheaply, see `replication status`.",
+        default=False,
+        action='store_true',
+    )
+
+
+class Collector:
+    """Collect metrics over persistent connections, cached for a while.
+
+    Concurrent scrapes wait for a single collection. Lost connections
+    are reestablished on the next collection.
+    """
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self._args = args
+        self._lock = asyncio.Lock()
+        self._connections: Optional[
+            Tuple[asyncpg.Connection, asyncpg.Connection]
+        ] = None
+        self._previous: Optional[status.Status] = None
+        self._cached: Optional[Tuple[float, str]] = None
+
+    async def get(self) -> str:
+        async with self._lock:
+            now = time.monotonic()
+            if (
+                self._cached is not None
+                and now - self._cached[0] < self._args.cache_seconds
+            ):
+                return self._cached[1]
+
+            text = metrics.render(await self._collect())
+            self._cached = (now, text)
+            return text
+
+    async def _collect(self) -> List[metrics.Metric]:
+        try:
+            if self._connections is None:
+                self._connections = await db.connect(self._args)
+            (source_db, target_db) = self._connections
+
+            result = await asyncio.wait_for(
+                status.collect(
+                    source_db,
+                    target_db,
+                    subscription_name=self._args.subscription_name,
+                    estimate_sizes=self._args.estimate_sizes,
+                ),
+                timeout=self._args.collect_timeout,
+            )
+        except asyncio.TimeoutError:
+            log.error(
+                "Collecting the replication status timed out after %s seconds.",
+                self._args.collect_timeout,
+            )
+            # The connections may still be busy with the cancelled queries.
+            await self.close()
+            return [up(False)]
+        except (
+            OSError,
+            asyncpg.exceptions.PostgresError,
+            asyncpg.InterfaceError,
+        ) as err:
+            log.error("Unable to collect replication status: %s", err)
+            await self.close()
+            return [up(False)]
+
+        rates = (
+            status.copy_rates(self._previous, result)
+            if self._previous is not None
+            else None
+        )
+        self._previous = result
+        return [
+            up(True),
+            *metrics.status_metrics(
+                result, subscription_name=self._args.subscription_name, rates=rates
+            ),
+        ]
+
+    async def close(self) -> None:
+        if self._connections is not None:
+            for connection in self._connections:
+                connection.terminate()
+            self._connections = None
+
+
+def up(value: bool) -> metrics.Metric:
+    return metrics.Metric(
+        'ivory_up', "Whether the replication status could be collected.", [({}, value)]
+    )
+
+
+def write_textfile(path: Path, text: str) -> None:
+    """Atomically replace the given file, so that it is never read half-written."""
+
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f'.{path.name}.', mode='w', delete=False
+    ) as f:
+        f.write(text)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+async def handle(
+    collector: Collector, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    """Answer a single HTTP request, serving metrics at `/metrics`."""
+
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+        # Skip the request headers.
+        while (await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)).strip():
+            pass
+
+        (method, path, *_) = request_line.decode('latin-1').split() + ['', '']
+        if method in ('GET', 'HEAD') and path.split('?')[0] == '/metrics':
+            body = (await collector.get()).encode()
+            (status_line, content_type) = ('200 OK', CONTENT_TYPE)
+        else:
+            body = b'Not found, see /metrics.\n'
+            (status_line, content_type) = ('404 Not Found', 'text/plain')
+
+        writer.write(
+            f'HTTP/1.0 {status_line}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: close\r\n'
+            '\r\n'.encode() + (body if method != 'HEAD' else b'')
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as err:
+        log.debug("Dropping metrics request: %r", err)
+    finally:
+        writer.close()
+
+
+async def run(args: argparse.Namespace) -> int:
+    """Export replication status metrics in the OpenMetrics format.
+
+    Serves the metrics `replication status` computes on a local HTTP
+    port, or writes them to a file for the node_exporter textfile
+    collector.
+    """
+
+    collector = Collector(args)
+
+    if args.textfile is not None:
+        text = await collector.get()
+        await collector.close()
+        write_textfile(args.textfile, text)
+        log.info("Wrote metrics to %r.", str(args.textfile))
+        return 0 if 'ivory_up 1\n' in text else 1
+
+    server = await asyncio.start_server(
+        functools.partial(handle, collector), host=args.listen_address, port=args.port
+    )
+    log.info("Serving metrics on http://%s:%d/metrics.", args.listen_address, args.port)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        # Serving ends with Ctrl-C.
+        return 0
+    finally:
+        await collector.close()
+    return 0
@@ -1,6 +1,7 @@
 import argparse
 
 from ivory.commands.replication import create
+from ivory.commands.replication import plan
 from ivory.commands.replication import start
 from ivory.commands.replication import status
 from ivory.commands.replication import stop
@@ -15,6 +16,11 @@ def configure_parser(parser: argparse.ArgumentParser) -> None:
     parser_create.set_defaults(func=create.run)
     create.add_arguments(parser_create)
 
+    parser_plan = subparsers.add_parser('plan', help=plan.__doc__)
+    parser_plan.description = plan.run.__doc__
+    parser_plan.set_defaults(func=plan.run)
+    plan.add_arguments(parser_plan)
+
     parser_start = subparsers.add_parser('start', help=start.__doc__)
     parser_start.description = start.run.__doc__
     parser_start.set_defaults(func=start.run)
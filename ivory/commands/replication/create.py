@@ -1,6 +1,7 @@
 """Set up logical replication from the source to the target database."""
 
 import argparse
+import contextlib
 import logging
 import os
 import os.path
@@ -13,6 +14,7 @@ from ivory import constants
 from ivory import check
 from ivory import db
 from ivory import helpers
+from ivory import plan
 from ivory import secrets
 
 
@@ -59,6 +61,8 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
         ),
         default=os.getenv('REPLICATION_PASSWORD'),
     )
+    check.add_arguments(parser)
+    plan.add_arguments(parser)
 
 
 async def run(args: argparse.Namespace) -> int:
@@ -71,14 +75,33 @@ async def run(args: argparse.Namespace) -> int:
 
     # not specified = your loss
     if not args.skip_checks:
-        async for result in check.find_problems(
-            source_db=source_db, target_db=target_db, args=args
-        ):
-            if result.error is not None:
-                log.error("%s: %s.", result.checker, result.error)
-                return 1
+        if args.wal_rate is None and args.apply_throughput is not None:
+            # Sample once for both the checks and the estimate.
+            args.wal_rate = await plan.sample_wal_rate(
+                source_db, pause=args.wal_sample_pause
+            )
+
+        async with contextlib.aclosing(
+            check.find_problems(source_db=source_db, target_db=target_db, args=args)
+        ) as results:
+            async for result in results:
+                if result.error is not None:
+                    log.error(
+                        "%s: %s (%.2f seconds).",
+                        result.checker,
+                        result.error,
+                        result.duration,
+                    )
+                    return 1
+
+                log.debug("%s (%.2f seconds)", result.description, result.duration)
 
         log.debug("Pre-flight checks successful.")
+
+        estimate = await plan.estimate(
+            source_db=source_db, target_db=target_db, args=args
+        )
+        plan.report(estimate, largest=args.largest_tables)
     else:
         log.warning("Pre-flight checks skipped.")
 
@@ -208,17 +231,7 @@ async def create_publication(
     )
 
     if active_publication is None:
-        (tables,) = await source_db.fetchrow(
-            """
-            SELECT
-                array_agg(quote_ident(table_schema) || '.' || quote_ident(table_name))
-            FROM
-                information_schema.tables
-            WHERE
-                table_schema NOT IN ('pg_catalog', 'information_schema')
-                AND table_type = 'BASE TABLE';
-            """
-        )
+        tables = await plan.publication_tables(source_db)
         joined_tables = ', '.join(tables)
         await source_db.execute(
             f"CREATE PUBLICATION {shlex.quote(publication_name)} FOR TABLE {joined_tables}"
@@ -0,0 +1,36 @@
+"""Estimate the initial table synchronization of logical replication."""
+
+import argparse
+import logging
+
+from ivory import db
+from ivory import plan
+
+
+log = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add plan command-specific arguments."""
+
+    plan.add_arguments(parser)
+
+
+async def run(args: argparse.Namespace) -> int:
+    """Estimate how long the initial table synchronization will take.
+
+    Reads the size of every table that would be published from the source
+    database and distributes them over the sync workers of the target
+    database. Reports the largest tables, the projected duration of the
+    initial synchronization and the WAL the source retains meanwhile.
+    """
+
+    (source_db, target_db) = await db.connect(args)
+
+    estimate = await plan.estimate(source_db=source_db, target_db=target_db, args=args)
+    plan.report(estimate, largest=args.largest_tables)
+
+    await source_db.close()
+    await target_db.close()
+
+    return 0
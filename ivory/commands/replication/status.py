@@ -1,11 +1,21 @@
 """Display replication status."""
 
 import argparse
+import asyncio
 import logging
+import sys
+import time
 from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import asyncpg  # type: ignore
 
 from ivory import constants
 from ivory import db
+from ivory import helpers
+from ivory import history
+from ivory import status
 
 
 log = logging.getLogger(__name__)
@@ -26,178 +36,200 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
             "instead of printing them one-by-one. Useful for progress "
             "displays, such as when running `ivory` through `watch`. "
             "Relations in initializing state will be printed at the end "
-            "of output."
+            "of output. See also `--watch`."
+        ),
+        default=False,
+        action='store_true',
+    )
+    parser.add_argument(
+        '--estimate-sizes',
+        help=(
+            "Estimate the progress of relations being copied from the "
+            "planner statistics on the source and the size of the main fork "
+            "on the target, instead of the total relation sizes. Much "
+            "cheaper on schemas with many partitions, but ignores indexes "
+            "and TOAST data."
+        ),
+        default=False,
+        action='store_true',
+    )
+    parser.add_argument(
+        '--rate-sample-pause',
+        help=(
+            "Take a second status sample this many seconds after the first "
+            "to determine copy rates and ETAs while relations are being "
+            "copied. By default, only a single sample is taken, `--watch` "
+            "determines rates between its redraws."
+        ),
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        '--watch',
+        help=(
+            "Keep the database connections open and redraw a compact status "
+            "view every this many seconds, until interrupted."
+        ),
+        type=float,
+        metavar='INTERVAL',
+        default=None,
+    )
+    parser.add_argument(
+        '--max-retained-wal',
+        help=(
+            "Fail if the replication slot retains more WAL on the source "
+            "than this, for example `50GB`."
+        ),
+        type=helpers.parse_size,
+        metavar='SIZE',
+        default=None,
+    )
+    parser.add_argument(
+        '--max-xmin-age',
+        help=(
+            "Fail if the xmin or catalog xmin of the replication slot is older "
+            "than this many transactions, as it holds back vacuum on the source."
+        ),
+        type=int,
+        metavar='TRANSACTIONS',
+        default=None,
+    )
+    parser.add_argument(
+        '--history-file',
+        help=(
+            "File to keep a bounded history of status samples in, used to "
+            "report lag trends and regressions. Defaults to a file per "
+            "replication in the ivory cache directory."
         ),
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        '--no-history',
+        help="Neither record nor report the history of status samples.",
         default=False,
         action='store_true',
     )
 
 
+def record(args: argparse.Namespace, result: status.Status) -> Optional[history.Trend]:
+    """Add the given status to the history and return the lag trend."""
+
+    if args.no_history:
+        return None
+
+    path = args.history_file or history.default_path(args, args.subscription_name)
+    try:
+        with history.History(path) as ring:
+            ring.append(history.sample(result))
+            return history.trend(
+                ring.samples(since=datetime.now(timezone.utc) - history.TREND_WINDOW)
+            )
+    except OSError as err:
+        log.warning("Unable to record replication history in %r: %s", str(path), err)
+        return None
+
+
+# Moves the cursor to the top left and clears the terminal.
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+
+
+async def watch(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> int:
+    """Redraw the replication status every `--watch` seconds until interrupted."""
+
+    previous = None
+
+    try:
+        while True:
+            started = time.monotonic()
+            result = await status.collect(
+                source_db,
+                target_db,
+                subscription_name=args.subscription_name,
+                estimate_sizes=args.estimate_sizes,
+            )
+            rates = (
+                status.copy_rates(previous, result) if previous is not None else None
+            )
+            previous = result
+            view = status.render(
+                result, subscription_name=args.subscription_name, rates=rates
+            )
+            trend = record(args, result)
+            if trend is not None:
+                view += '\n' + '\n'.join(
+                    [f"trend: {history.describe(trend)}"]
+                    + [f"regression: {regression}" for regression in trend.regressions]
+                )
+
+            if sys.stdout.isatty():
+                sys.stdout.write(CLEAR_SCREEN + view + '\n')
+            else:
+                sys.stdout.write(view + '\n\n')
+            sys.stdout.flush()
+
+            await asyncio.sleep(max(0.0, args.watch - (time.monotonic() - started)))
+    except asyncio.CancelledError:
+        # Watching ends with Ctrl-C.
+        return 0
+    finally:
+        await source_db.close()
+        await target_db.close()
+
+
 async def run(args: argparse.Namespace) -> int:
     """Display the current status of replication."""
 
-    rc = 0
     (source_db, target_db) = await db.connect(args)
-    replication_stats = await source_db.fetchrow(
-        """
-        SELECT
-            *
-        FROM
-            pg_stat_replication
-        WHERE
-            application_name = $1
-            AND state IN ('catchup', 'streaming')
-        """,
-        constants.REPLICATION_APPLICATION_NAME,
-    )
-
-    if replication_stats is None:
-        log.error("No active replication found.")
-        return 1
-
-    (my_lsn,) = await source_db.fetchrow('SELECT pg_current_wal_lsn()')
-
-    if 'reply_time' in replication_stats:
-        # "The `dt` argument is ignored." But if you don't pass it, it crashes.
-        reply_utcoffset = replication_stats['reply_time'].tzinfo.utcoffset(None)
-
-        # timezones and unicode
-        # horror
-        sane_reply_time = replication_stats['reply_time'] - reply_utcoffset
-        last_reply_delta = datetime.now(timezone.utc) - sane_reply_time
-    else:
-        last_reply_delta = replication_stats['replay_lag']
-
-    if last_reply_delta is None:
-        log.info("No replay lag detected.")
-    elif last_reply_delta > timedelta(minutes=5):
-        log.error(
-            "Last reply from standby received more than 5 minutes ago: %r.",
-            last_reply_delta,
-        )
-        rc = 1
-    else:
-        log.info(
-            "Last reply from standby received %d seconds ago.",
-            last_reply_delta.total_seconds(),
-        )
 
-    if my_lsn == replication_stats['flush_lsn']:
-        log.info("LSN matches.")
-    else:
-        log.warning(
-            "Source is at LSN %x, standby at %x (diff %s).",
-            my_lsn,
-            replication_stats['flush_lsn'],
-            my_lsn - replication_stats['flush_lsn'],
-        )
+    if args.watch is not None:
+        return await watch(source_db, target_db, args)
 
-    slot = await source_db.fetchrow(
-        "SELECT * FROM pg_replication_slots WHERE slot_name = $1",
-        args.subscription_name,
+    result = await status.collect(
+        source_db,
+        target_db,
+        subscription_name=args.subscription_name,
+        estimate_sizes=args.estimate_sizes,
     )
 
-    if slot is None:
-        log.error("Missing replication slot with name %r.", args.subscription_name)
-        rc = 1
-    elif not slot['active']:
-
-        # See src/backend/replication/logical/tablesync.c
-        # at 5832396432b1ce8349a0028b52295a9874014416:
-        # PostgreSQL creates a temporary slot to synchronize tables with.
-        sync_slot = await source_db.fetchrow(
-            "SELECT * FROM pg_replication_slots WHERE slot_name LIKE $1 || '%_sync_%'",
-            args.subscription_name,
+    rates = None
+    if args.rate_sample_pause and any(r.state == b'd' for r in result.relations):
+        await asyncio.sleep(args.rate_sample_pause)
+        (previous, result) = (
+            result,
+            await status.collect(
+                source_db,
+                target_db,
+                subscription_name=args.subscription_name,
+                estimate_sizes=args.estimate_sizes,
+            ),
         )
+        rates = status.copy_rates(previous, result)
+
+    rc = status.report(
+        result,
+        subscription_name=args.subscription_name,
+        collapse_initializing_relations=args.collapse_initializing_relations,
+        rates=rates,
+        max_retained_wal=args.max_retained_wal,
+        max_xmin_age=args.max_xmin_age,
+    )
 
-        if sync_slot is not None and sync_slot['active']:
+    trend = record(args, result)
+    if trend is not None:
+        log.info("Replication %s.", history.describe(trend))
+        for regression in trend.regressions:
+            log.warning("Regression: %s.", regression)
+
+        usage = result.slot_usage
+        if trend.retained_rate > 0 and usage is not None and usage.safe_wal_size:
             log.warning(
-                "Replication slot %r is not active, but active sync slot %r was found.",
-                args.subscription_name,
-                sync_slot['slot_name'],
-            )
-        else:
-            log.error("Replication slot %r is not active.", args.subscription_name)
-            rc = 1
-    else:
-        log.info("Replication slot is active.")
-
-    state_sql = """
-    SELECT
-        quote_ident(psut.schemaname) || '.' || quote_ident(psut.relname) AS "name",
-        psr.srsubstate AS "state"
-    FROM
-        pg_catalog.pg_subscription_rel AS psr
-        JOIN pg_catalog.pg_subscription AS ps ON (psr.srsubid = ps.oid)
-        JOIN pg_catalog.pg_stat_user_tables AS psut ON (psr.srrelid = psut.relid)
-    WHERE
-        ps.subname = $1
-    """
-
-    states = await target_db.fetch(state_sql, args.subscription_name)
-    initializing_relations = []
-
-    for (name, state) in states:
-        if state == b'd':
-            # If we're on the initial sync, display how far in.
-            query = """
-            SELECT
-                pg_total_relation_size($1),
-                pg_size_pretty(pg_total_relation_size($1))
-            """
-
-            (target, target_pretty) = await source_db.fetchrow(query, name)
-            (current, current_pretty) = await target_db.fetchrow(query, name)
-            log.error(
-                "Relation %r is being copied over: %s / %s (%.2f %%).",
-                name,
-                current_pretty,
-                target_pretty,
-                # There was at least one instance of an edge case
-                # spotted here where `target` was zero. In that case,
-                # let's just make up the fact that we're at 0% for now.
-                (current / target if target else 0) * 100,
+                "At this rate, the replication slot loses WAL in %s.",
+                timedelta(seconds=round(usage.safe_wal_size / trend.retained_rate)),
             )
-            rc = 1
-
-        elif state == b'i' and args.collapse_initializing_relations:
-            initializing_relations.append(name)
-            rc = 1
-
-        elif state != b'r':
-            log.error(
-                "Relation %r is not ready: %s (srsubstate=%r).",
-                name,
-                substate_to_human(state),
-                state.decode(),
-            )
-            rc = 1
 
-    if initializing_relations:
-        log.error("%d relations are still initializing.", len(initializing_relations))
     return rc
-
-
-def substate_to_human(value: bytes) -> str:
-    """Convert PostgreSQL `srsubstate` to a human-readable value.
-
-    Example:
-
-        >>> substate_to_human(b'd')
-        'data is being copied'
-        >>> substate_to_human(b'x')  # doctest: +ELLIPSIS
-        Traceback (most recent call last):
-            ...
-        ValueError: unknown value: b'x'
-    """
-
-    mapping = {
-        b'i': 'initializing',
-        b'd': 'data is being copied',
-        b'f': 'finished table copy',
-        b's': 'synchronized',
-        b'r': 'ready (normal replication)',
-    }
-    if value in mapping:
-        return mapping[value]
-    raise ValueError(f"unknown value: {value!r}")
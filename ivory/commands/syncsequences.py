@@ -3,13 +3,21 @@
 import asyncio
 import argparse
 import logging
-from typing import Tuple
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import asyncpg  # type: ignore
 
 from ivory import db
+from ivory import helpers
 
 
 log = logging.getLogger(__name__)
 
+# Weight of the latest rate in the moving average of `--follow`.
+FOLLOW_SMOOTHING = 0.3
+
 
 def sequence_offset(value: str) -> Tuple[str, int]:
     if ':' not in value:
@@ -19,6 +27,249 @@ def sequence_offset(value: str) -> Tuple[str, int]:
     return (sequence, int(offset))
 
 
+async def sequence_names(source_db: asyncpg.Connection) -> List[str]:
+    rows = await source_db.fetch(
+        """
+        SELECT quote_ident(schemaname) || '.' || quote_ident(sequencename)
+        FROM pg_catalog.pg_sequences
+        """
+    )
+    return [relname for (relname,) in rows]
+
+
+async def sample(
+    source_db: asyncpg.Connection, sequences: Sequence[str]
+) -> Dict[str, int]:
+    """Advance all given sequences in a single query and return their values.
+
+    Sampling all sequences at once avoids a round trip per sequence and
+    samples them at nearly the same point in time.
+    """
+
+    rows = await source_db.fetch(
+        "SELECT name, nextval(name::regclass) FROM unnest($1::text[]) AS name",
+        list(sequences),
+    )
+    return {name: nextval for (name, nextval) in rows}
+
+
+async def read_last_values(
+    source_db: asyncpg.Connection, sequences: Sequence[str]
+) -> Dict[str, Optional[int]]:
+    """Read the last value of all given sequences without advancing them.
+
+    Sequences that have never been used have no last value.
+    """
+
+    rows = await source_db.fetch(
+        """
+        SELECT name, pg_sequence_last_value(name::regclass)
+        FROM unnest($1::text[]) AS name
+        """,
+        list(sequences),
+    )
+    return {name: last_value for (name, last_value) in rows}
+
+
+async def project_values(
+    source_db: asyncpg.Connection, sequences: Sequence[str], args: argparse.Namespace
+) -> Dict[str, int]:
+    """Project the values of the given sequences at the cutover horizon.
+
+    Takes `--samples` samples over `--sample-window` seconds and fits a
+    growth rate per sequence. The projection adds the expected growth
+    until `--horizon`, increased by `--safety-margin`, plus the fixed
+    offsets. Sequences that have never been used are left out.
+    """
+
+    samples: Dict[str, List[Tuple[float, int]]] = {name: [] for name in sequences}
+    count = 1 if args.equal else max(2, args.samples)
+
+    for i in range(count):
+        if i:
+            await asyncio.sleep(args.sample_window / (count - 1))
+        started = time.monotonic()
+        values = await read_last_values(source_db, sequences)
+        # Attribute the values to the middle of the query.
+        sampled_at = (started + time.monotonic()) / 2
+        for name, value in values.items():
+            if value is not None:
+                samples[name].append((sampled_at, value))
+
+    fixed_offsets = dict(args.fixed_offsets)
+    projected = {}
+    for name, points in samples.items():
+        if not points:
+            log.debug("Sequence %r has not been used yet, skipping.", name)
+            continue
+
+        (_, last_value) = points[-1]
+        if args.equal:
+            projected[name] = last_value
+            continue
+
+        if name in fixed_offsets:
+            offset = fixed_offsets[name]
+        else:
+            rate = helpers.fit_rate(points)
+            offset = math.ceil(rate * args.horizon * (1 + args.safety_margin))
+            log.debug(
+                "Sequence %r grows by %.2f per second, offset at %r.",
+                name,
+                rate,
+                offset,
+            )
+        projected[name] = last_value + offset + args.fixed_offset
+
+    return projected
+
+
+async def follow(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> int:
+    """Keep pushing target sequences ahead of the source until interrupted.
+
+    Every `--follow` seconds, the last values of the source sequences are
+    read without advancing them. Sequences that moved since the previous
+    pass are set on the target to their value plus the growth expected
+    until the next pass, based on a moving average of their rate and
+    increased by `--safety-margin`, plus the fixed offsets.
+    """
+
+    fixed_offsets = dict(args.fixed_offsets)
+    rates: Dict[str, float] = {}
+    previous: Dict[str, Tuple[float, int]] = {}
+
+    try:
+        while True:
+            started = time.monotonic()
+            values = await read_last_values(source_db, await sequence_names(source_db))
+            sampled_at = (started + time.monotonic()) / 2
+
+            moved = {}
+            for name, value in values.items():
+                if value is None:
+                    continue
+
+                if name in previous:
+                    (previous_sampled_at, previous_value) = previous[name]
+                    rate = (value - previous_value) / (sampled_at - previous_sampled_at)
+                    rates[name] = (
+                        FOLLOW_SMOOTHING * rate + (1 - FOLLOW_SMOOTHING) * rates[name]
+                        if name in rates
+                        else rate
+                    )
+                    if value == previous_value:
+                        continue
+                previous[name] = (sampled_at, value)
+
+                if name in fixed_offsets:
+                    offset = fixed_offsets[name]
+                else:
+                    offset = math.ceil(
+                        rates.get(name, 0.0) * args.follow * (1 + args.safety_margin)
+                    )
+                moved[name] = value + offset + args.fixed_offset
+
+            if moved:
+                await set_values(target_db, moved, is_called=True, dry_run=args.dry_run)
+            else:
+                log.debug("No sequences moved on source.")
+
+            await asyncio.sleep(max(0.0, args.follow - (time.monotonic() - started)))
+    except asyncio.CancelledError:
+        # Following ends with Ctrl-C.
+        return 0
+    finally:
+        await source_db.close()
+        await target_db.close()
+
+
+# Compares the value each target sequence returns next with the one it
+# would return after `setval`, respecting the direction of the sequence.
+# Only sequences behind are set, all within a single statement. The
+# current values are read from the sequences themselves: a sequence set
+# with `is_called = false` has no `pg_sequence_last_value`, but still
+# continues at its `last_value`. `query_to_xml` reads them with the
+# same statement text for any set of sequences, so it stays prepared.
+SET_VALUES_SQL = r"""
+WITH
+states AS (
+    SELECT
+        d.name,
+        d.value,
+        query_to_xml(
+            format('SELECT last_value, is_called FROM %s', d.name::regclass),
+            false,
+            true,
+            ''
+        )::text AS state
+    FROM
+        unnest($1::text[], $2::bigint[]) AS d (name, value)
+),
+desired AS (
+    SELECT
+        c.name,
+        c.value,
+        substring(c.state FROM '<last_value>(-?\d+)</last_value>')::bigint
+            AS current_value,
+        substring(c.state FROM '<is_called>(\w+)</is_called>')::boolean AS is_called,
+        s.seqincrement AS increment
+    FROM
+        states AS c
+        JOIN pg_catalog.pg_sequence AS s ON (s.seqrelid = c.name::regclass)
+)
+SELECT
+    name,
+    value,
+    current_value,
+    CASE WHEN NOT $4 THEN setval(name::regclass, value, $3) END
+FROM
+    desired
+WHERE
+    sign(increment) * (
+        (current_value::numeric + CASE WHEN is_called THEN increment ELSE 0 END)
+        - (value::numeric + CASE WHEN $3 THEN increment ELSE 0 END)
+    ) < 0
+"""
+
+
+async def set_values(
+    target_db: asyncpg.Connection,
+    values: Dict[str, int],
+    is_called: bool,
+    dry_run: bool,
+) -> int:
+    """Set the given target sequences in a single statement.
+
+    Sequences already at or past the given value are skipped. `is_called`
+    has the meaning of the corresponding `setval` argument. Returns the
+    number of sequences set.
+    """
+
+    rows = await target_db.fetch(
+        SET_VALUES_SQL, list(values), list(values.values()), is_called, dry_run
+    )
+    for (sequence, value, current_value, _) in rows:
+        log.debug(
+            "%s target sequence %r value to %r (currently %r).",
+            "Would set" if dry_run else "Set",
+            sequence,
+            value,
+            current_value,
+        )
+
+    log.info(
+        "%s %d target sequences, skipped %d already at or past their value.",
+        "Would set" if dry_run else "Set",
+        len(rows),
+        len(values) - len(rows),
+    )
+    return len(rows)
+
+
 def add_arguments(parser: argparse.ArgumentParser) -> None:
     """Add syncsequences command-specific arguments."""
 
@@ -50,6 +301,55 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
         default=1,
     )
 
+    estimate_group = parser.add_argument_group('non-consuming options')
+    estimate_group.add_argument(
+        '--non-consuming',
+        help=(
+            "Read the last values of the source sequences instead of "
+            "advancing them with `nextval`. Offsets are projected from the "
+            "growth rate fitted over multiple samples, see `--samples`, "
+            "`--horizon` and `--safety-margin`."
+        ),
+        action='store_true',
+        default=False,
+    )
+    estimate_group.add_argument(
+        '--samples',
+        help="Number of samples to fit the growth rate of each sequence with.",
+        type=int,
+        default=5,
+    )
+    estimate_group.add_argument(
+        '--sample-window',
+        help="Seconds over which the samples are spread.",
+        type=float,
+        default=10.0,
+    )
+    estimate_group.add_argument(
+        '--horizon',
+        help="Seconds until the cutover, over which sequence growth is projected.",
+        type=float,
+        default=60.0,
+    )
+    estimate_group.add_argument(
+        '--safety-margin',
+        help="Fraction added to the projected growth, for example 0.5 for 50%%.",
+        type=float,
+        default=0.5,
+    )
+
+    parser.add_argument(
+        '--follow',
+        help=(
+            "Keep running and push target sequences ahead of the source "
+            "every this many seconds. Only sequences that moved are written, "
+            "with offsets adapted to their observed rate. Source sequences "
+            "are not advanced."
+        ),
+        type=float,
+        metavar='INTERVAL',
+        default=None,
+    )
     parser.add_argument(
         '--equal',
         help=(
@@ -67,7 +367,7 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
             "Only print values being set, do not set any sequence "
             "values. Note that the source database sequences will "
             "still be incremented since the current value needs to "
-            "be fetched via `nextval`."
+            "be fetched via `nextval`, unless `--non-consuming` is used."
         ),
         action='store_true',
         default=False,
@@ -87,7 +387,8 @@ async def run(args: argparse.Namespace) -> int:
     values on the source database to the target database, plus a fixed offset.
 
     Note that running this command will always consume at least one sequence
-    item on both databases via the `nextval` function of PostgreSQL.
+    item on both databases via the `nextval` function of PostgreSQL, unless
+    `--non-consuming` is used.
 
     Using log level DEBUG here will allow you to see current and target
     sequence values.
@@ -95,67 +396,58 @@ async def run(args: argparse.Namespace) -> int:
 
     (source_db, target_db) = await db.connect(args)
 
-    sequences = await source_db.fetch(
-        """
-        SELECT quote_ident(schemaname) || '.' || quote_ident(sequencename)
-        FROM pg_catalog.pg_sequences
-        """
-    )
+    if args.follow is not None:
+        return await follow(source_db, target_db, args)
+
+    sequences = await sequence_names(source_db)
+    if not sequences:
+        log.warning("No sequences found.")
+        return 0
+
+    if args.non_consuming:
+        projected = await project_values(source_db, sequences, args)
+        await set_values(target_db, projected, is_called=True, dry_run=args.dry_run)
+        return 0
 
-    source_sequence_values = {}
     sequence_offsets = dict(args.fixed_offsets)
 
-    for (relname,) in sequences:
-        (nextval,) = await source_db.fetchrow("SELECT nextval($1)", relname)
+    source_sequence_values = await sample(source_db, sequences)
+    for relname, nextval in source_sequence_values.items():
         log.debug("Last value of sequence %r on first sample is %r.", relname, nextval)
-        source_sequence_values[relname] = nextval
 
     if args.equal:
-        for sequence, lastval in source_sequence_values.items():
-            if args.dry_run:
-                log.debug(
-                    "Would set target sequence %r value to %r.", sequence, lastval
-                )
-            else:
-                await target_db.execute(
-                    "SELECT setval($1::regclass, $2, false)", sequence, lastval
-                )
-                log.debug("Set target sequence %r value to %r.", sequence, lastval)
+        await set_values(
+            target_db, source_sequence_values, is_called=False, dry_run=args.dry_run
+        )
 
     else:
         await asyncio.sleep(args.sample_pause)
 
-        for sequence, lastval in source_sequence_values.items():
-            if sequence not in sequence_offsets:
-                (nextval,) = await source_db.fetchrow("SELECT nextval($1)", sequence)
-
-                offset = nextval - source_sequence_values[sequence]
-                log.debug(
-                    "Last value of sequence %r on second sample is %r, offset at %r.",
-                    sequence,
-                    nextval,
-                    offset,
-                )
-                sequence_offsets[sequence] = offset
-                source_sequence_values[sequence] = lastval
+        second_sample = await sample(
+            source_db,
+            [
+                sequence
+                for sequence in source_sequence_values
+                if sequence not in sequence_offsets
+            ],
+        )
+        for sequence, nextval in second_sample.items():
+            offset = nextval - source_sequence_values[sequence]
+            log.debug(
+                "Last value of sequence %r on second sample is %r, offset at %r.",
+                sequence,
+                nextval,
+                offset,
+            )
+            sequence_offsets[sequence] = offset
 
         sequence_values = {
             sequence: lastval + sequence_offsets[sequence] + args.fixed_offset
             for sequence, lastval in source_sequence_values.items()
         }
 
-        for sequence, lastval in sequence_values.items():
-            if args.dry_run:
-                log.debug(
-                    "Would set target sequence %r value to %r.", sequence, lastval
-                )
-            else:
-                await target_db.execute(
-                    "SELECT setval($1::regclass, $2)", sequence, lastval
-                )
-                log.debug("Set target sequence %r value to %r.", sequence, lastval)
-
-    if not sequences:
-        log.warning("No sequences found.")
+        await set_values(
+            target_db, sequence_values, is_called=True, dry_run=args.dry_run
+        )
 
     return 0
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 from typing import Any, Dict, Tuple
 
 import asyncpg  # type: ignore
@@ -34,3 +35,36 @@ async def connect(
     await target.execute("SET application_name = 'ivory'")
 
     return (source, target)
+
+
+class SerializedConnection:
+    """Share a single connection between concurrently running tasks.
+
+    asyncpg connections can only process one operation at a time. Queries
+    sent through this wrapper wait for their turn instead of failing with
+    an `InterfaceError`. Any other attribute is looked up on the wrapped
+    connection.
+    """
+
+    def __init__(self, connection: asyncpg.Connection) -> None:
+        self._connection = connection
+        self._lock = asyncio.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    async def execute(self, *args: Any, **kwargs: Any) -> Any:
+        async with self._lock:
+            return await self._connection.execute(*args, **kwargs)
+
+    async def fetch(self, *args: Any, **kwargs: Any) -> Any:
+        async with self._lock:
+            return await self._connection.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args: Any, **kwargs: Any) -> Any:
+        async with self._lock:
+            return await self._connection.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args: Any, **kwargs: Any) -> Any:
+        async with self._lock:
+            return await self._connection.fetchval(*args, **kwargs)
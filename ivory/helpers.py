@@ -1,4 +1,9 @@
+import os
+import os.path
+import re
 import shlex
+from pathlib import Path
+from typing import Sequence, Tuple
 
 
 def quote(value: str) -> str:
@@ -15,3 +20,99 @@ def quote(value: str) -> str:
     if "'" not in maybe_quoted:
         return f"'{value}'"
     return maybe_quoted
+
+
+def cache_directory() -> Path:
+    """Return the directory ivory keeps cached data in.
+
+    Follows the XDG base directory specification.
+
+    Example:
+        >>> cache_directory().name
+        'ivory'
+    """
+
+    base = os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return Path(base) / 'ivory'
+
+
+def parse_size(value: str) -> int:
+    """Parse a human-readable size in bytes, as used in PostgreSQL settings.
+
+    Example:
+        >>> parse_size('512')
+        512
+        >>> parse_size('64kB')
+        65536
+        >>> parse_size('1.5 GB')
+        1610612736
+        >>> parse_size('lots')
+        Traceback (most recent call last):
+            ...
+        ValueError: invalid size: 'lots'
+    """
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kMGT]?B)?\s*', value)
+    if match is None:
+        raise ValueError(f"invalid size: {value!r}")
+
+    (amount, unit) = match.groups()
+    exponent = ('B', 'kB', 'MB', 'GB', 'TB').index(unit or 'B')
+    return int(float(amount) * 1024**exponent)
+
+
+def format_size(value: float) -> str:
+    """Format a size in bytes for humans, like `pg_size_pretty`.
+
+    Example:
+        >>> format_size(512)
+        '512 bytes'
+        >>> format_size(65536)
+        '64 kB'
+        >>> format_size(1610612736)
+        '1.5 GB'
+        >>> format_size(1000)
+        '1000 bytes'
+    """
+
+    if abs(value) < 1024:
+        return f'{value:.0f} bytes'
+
+    for unit in ('kB', 'MB', 'GB', 'TB'):
+        value /= 1024
+        if abs(value) < 1024:
+            break
+
+    amount = f'{value:.1f}'
+    if amount.endswith('.0'):
+        amount = amount[:-2]
+    return f'{amount} {unit}'
+
+
+def fit_rate(samples: Sequence[Tuple[float, float]]) -> float:
+    """Fit the growth rate of `(time, value)` samples with least squares.
+
+    Uses all samples instead of just the first and last, so that bursts
+    in between are accounted for.
+
+    Example:
+        >>> fit_rate([(0, 10), (1, 12), (2, 14)])
+        2.0
+        >>> fit_rate([(0, 0), (1, 10), (2, 10), (3, 30)])
+        9.0
+        >>> fit_rate([(0, 5)])
+        0.0
+    """
+
+    if len(samples) < 2:
+        return 0.0
+
+    mean_time = sum(time for (time, _) in samples) / len(samples)
+    mean_value = sum(value for (_, value) in samples) / len(samples)
+    covariance = sum(
+        (time - mean_time) * (value - mean_value) for (time, value) in samples
+    )
+    variance = sum((time - mean_time) ** 2 for (time, _) in samples)
+    if not variance:
+        return 0.0
+    return covariance / variance
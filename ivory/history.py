@@ -0,0 +1,343 @@
+"""Bounded on-disk history of replication status samples.
+
+Samples are kept in a fixed-size ring buffer file. The file is
+memory-mapped and its records are accessed as an array of 64-bit
+integers, so appending a sample is cheap and the file never grows.
+"""
+
+import argparse
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import TracebackType
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from ivory import helpers
+from ivory import status
+
+
+__all__ = ('History', 'Sample', 'Trend', 'default_path', 'describe', 'sample', 'trend')
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'IVORYHST'
+# Bump whenever the record layout changes. Files of other versions are
+# discarded instead of misread.
+VERSION = 2
+# Magic, version, record size in bytes, capacity in records and the total
+# number of records ever appended, which determines the next slot.
+HEADER = struct.Struct('=8sIIQQ')
+# Timestamp in milliseconds, source LSN, flush LSN, reply delta in
+# milliseconds, bytes left to copy and WAL retained by the slot.
+FIELDS = 6
+RECORD_SIZE = FIELDS * 8
+# Stored for values that are not known.
+MISSING = -1
+# About 640 kB, a day of samples taken every 5 seconds.
+CAPACITY = 16384
+
+# How far back to look when determining trends.
+TREND_WINDOW = timedelta(minutes=15)
+
+
+class Sample(NamedTuple):
+    collected_at: datetime
+    source_lsn: int
+    flush_lsn: Optional[int]
+    reply_delta: Optional[timedelta]
+    # Bytes left to copy by the initial table synchronization.
+    copy_remaining: int
+    retained_bytes: Optional[int] = None
+
+
+class Trend(NamedTuple):
+    # Bytes per second, negative while the target is catching up.
+    lag_rate: float
+    catch_up: Optional[timedelta]
+    regressions: List[str]
+    # Growth of the WAL retained by the replication slot in bytes per second.
+    retained_rate: float = 0.0
+
+
+def sample(result: status.Status) -> Sample:
+    """Extract the history sample from the given status."""
+
+    return Sample(
+        collected_at=result.collected_at,
+        source_lsn=result.source_lsn,
+        flush_lsn=result.flush_lsn,
+        reply_delta=result.last_reply_delta,
+        copy_remaining=round(
+            sum(
+                status.remaining_size(relation)
+                for relation in result.relations
+                if relation.state in (b'i', b'd')
+            )
+        ),
+        retained_bytes=(
+            result.slot_usage.retained_bytes if result.slot_usage is not None else None
+        ),
+    )
+
+
+def encode(value: Sample) -> Tuple[int, ...]:
+    """Encode the given sample as a record.
+
+    Example:
+
+        >>> start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        >>> encode(Sample(start, 2048, None, timedelta(seconds=1.5), 0))
+        (1704067200000, 2048, -1, 1500, 0, -1)
+        >>> decode(encode(Sample(start, 2048, None, timedelta(seconds=1.5), 0)))
+        ... # doctest: +NORMALIZE_WHITESPACE
+        Sample(collected_at=datetime.datetime(2024, 1, 1, 0, 0, tzinfo=datetime.timezone.utc),
+               source_lsn=2048, flush_lsn=None,
+               reply_delta=datetime.timedelta(seconds=1, microseconds=500000),
+               copy_remaining=0, retained_bytes=None)
+    """
+
+    return (
+        round(value.collected_at.timestamp() * 1000),
+        value.source_lsn,
+        value.flush_lsn if value.flush_lsn is not None else MISSING,
+        (
+            round(value.reply_delta.total_seconds() * 1000)
+            if value.reply_delta is not None
+            else MISSING
+        ),
+        value.copy_remaining,
+        value.retained_bytes if value.retained_bytes is not None else MISSING,
+    )
+
+
+def decode(record: Sequence[int]) -> Sample:
+    (timestamp, source_lsn, flush_lsn, reply_delta, copy_remaining, retained) = record
+    return Sample(
+        collected_at=datetime.fromtimestamp(timestamp / 1000, timezone.utc),
+        source_lsn=source_lsn,
+        flush_lsn=flush_lsn if flush_lsn != MISSING else None,
+        reply_delta=(
+            timedelta(milliseconds=reply_delta) if reply_delta != MISSING else None
+        ),
+        copy_remaining=copy_remaining,
+        retained_bytes=retained if retained != MISSING else None,
+    )
+
+
+class History:
+    """A ring buffer of samples in the given file.
+
+    Concurrent ivory processes may share the file, access is serialized
+    with advisory locks. Files of another version or capacity are reset.
+    """
+
+    def __init__(self, path: Path, capacity: int = CAPACITY) -> None:
+        self.path = path
+        self.capacity = capacity
+
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._initialize()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(self._fd, HEADER.size + capacity * RECORD_SIZE)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        header_size = HEADER.size
+        self._records = memoryview(self._map)[header_size:].cast('q')
+
+    def _initialize(self) -> None:
+        size = HEADER.size + self.capacity * RECORD_SIZE
+        header = os.pread(self._fd, HEADER.size, 0)
+
+        if len(header) == HEADER.size and os.fstat(self._fd).st_size == size:
+            (magic, version, record_size, capacity, _) = HEADER.unpack(header)
+            if (magic, version, record_size, capacity) == (
+                MAGIC,
+                VERSION,
+                RECORD_SIZE,
+                self.capacity,
+            ):
+                return
+            log.warning(
+                "Discarding incompatible replication history %r.", str(self.path)
+            )
+
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, size)
+        os.pwrite(
+            self._fd, HEADER.pack(MAGIC, VERSION, RECORD_SIZE, self.capacity, 0), 0
+        )
+
+    def _appended(self) -> int:
+        (_, _, _, _, appended) = HEADER.unpack_from(self._map)
+        return int(appended)
+
+    def append(self, value: Sample) -> None:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            appended = self._appended()
+            offset = appended % self.capacity * FIELDS
+            for (index, field) in enumerate(encode(value)):
+                self._records[offset + index] = field
+            HEADER.pack_into(
+                self._map, 0, MAGIC, VERSION, RECORD_SIZE, self.capacity, appended + 1
+            )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def samples(self, since: Optional[datetime] = None) -> List[Sample]:
+        """Return the samples in the order they were appended.
+
+        With `since`, only the samples collected since then are read.
+        """
+
+        cutoff = round(since.timestamp() * 1000) if since is not None else None
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            appended = self._appended()
+            result = []
+            for position in reversed(range(max(0, appended - self.capacity), appended)):
+                offset = position % self.capacity * FIELDS
+                if cutoff is not None and self._records[offset] < cutoff:
+                    break
+                result.append(
+                    decode([self._records[offset + index] for index in range(FIELDS)])
+                )
+            result.reverse()
+            return result
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._records.release()
+        self._map.close()
+        os.close(self._fd)
+
+    def __enter__(self) -> 'History':
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+def default_path(args: argparse.Namespace, subscription_name: str) -> Path:
+    """Return the history file for the replication the given arguments refer to."""
+
+    key = '\0'.join(
+        str(getattr(args, f'{kind}_{option}'))
+        for kind in ('source', 'target')
+        for option in ('host', 'port', 'dbname')
+    )
+    digest = hashlib.sha256(f'{key}\0{subscription_name}'.encode()).hexdigest()[:16]
+    return helpers.cache_directory() / 'history' / f'{subscription_name}-{digest}.hist'
+
+
+def trend(
+    samples: Sequence[Sample], window: timedelta = TREND_WINDOW
+) -> Optional[Trend]:
+    """Determine the lag trend over the last `window` of the given samples.
+
+    Example:
+
+        >>> start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        >>> trend([
+        ...     Sample(start + timedelta(seconds=s), 10000, 10000 - lag, None, copy)
+        ...     for (s, lag, copy) in ((0, 3000, 500), (10, 2000, 400), (20, 1000, 800))
+        ... ])  # doctest: +NORMALIZE_WHITESPACE
+        Trend(lag_rate=-100.0, catch_up=datetime.timedelta(seconds=10),
+              regressions=['bytes left to copy grew from 400 bytes to 800 bytes'],
+              retained_rate=0.0)
+    """
+
+    if not samples:
+        return None
+    since = samples[-1].collected_at - window
+    recent = [
+        value
+        for value in samples
+        if value.collected_at >= since and value.flush_lsn is not None
+    ]
+    if len(recent) < 2:
+        return None
+
+    start = recent[0].collected_at
+    lags = [(value.source_lsn - (value.flush_lsn or 0)) for value in recent]
+    lag_rate = helpers.fit_rate(
+        [
+            ((value.collected_at - start).total_seconds(), lag)
+            for (value, lag) in zip(recent, lags)
+        ]
+    )
+
+    catch_up = None
+    if lag_rate < 0 and lags[-1] > 0:
+        catch_up = timedelta(seconds=round(lags[-1] / -lag_rate))
+
+    regressions = []
+    if lag_rate > 0 and lags[-1] > lags[0]:
+        regressions.append(f"lag grows by {helpers.format_size(lag_rate)}/s")
+    for (earlier, later) in zip(recent, recent[1:]):
+        if (later.flush_lsn or 0) < (earlier.flush_lsn or 0):
+            regressions.append(
+                f"flush LSN moved back from {earlier.flush_lsn:x} to {later.flush_lsn:x}"
+            )
+        if later.copy_remaining > earlier.copy_remaining:
+            # A table synchronization was restarted, or more tables were added.
+            regressions.append(
+                "bytes left to copy grew from "
+                f"{helpers.format_size(earlier.copy_remaining)} to "
+                f"{helpers.format_size(later.copy_remaining)}"
+            )
+
+    retained_rate = helpers.fit_rate(
+        [
+            ((value.collected_at - start).total_seconds(), value.retained_bytes)
+            for value in recent
+            if value.retained_bytes is not None
+        ]
+    )
+
+    return Trend(
+        lag_rate=lag_rate,
+        catch_up=catch_up,
+        regressions=regressions,
+        retained_rate=retained_rate,
+    )
+
+
+def describe(result: Trend, window: timedelta = TREND_WINDOW) -> str:
+    """Describe the given trend for humans.
+
+    Example:
+
+        >>> describe(Trend(-2048.0, timedelta(seconds=90), []))
+        'lag shrinks by 2 kB/s over the last 0:15:00, caught up in 0:01:30'
+    """
+
+    if result.lag_rate < 0:
+        text = f"lag shrinks by {helpers.format_size(-result.lag_rate)}/s"
+    elif result.lag_rate > 0:
+        text = f"lag grows by {helpers.format_size(result.lag_rate)}/s"
+    else:
+        text = "lag is steady"
+    text += f" over the last {window}"
+    if result.catch_up is not None:
+        text += f", caught up in {result.catch_up}"
+    if result.retained_rate > 0:
+        text += f", retained WAL grows by {helpers.format_size(result.retained_rate)}/s"
+    return text
@@ -0,0 +1,238 @@
+"""OpenMetrics exposition of the replication status."""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from ivory import status
+
+
+__all__ = ('Metric', 'render', 'status_metrics')
+
+Labels = Dict[str, str]
+
+
+class Metric(NamedTuple):
+    name: str
+    help: str
+    samples: List[Tuple[Labels, float]]
+    type: str = 'gauge'
+
+
+def escape(value: str) -> str:
+    """Escape a label value.
+
+    Example:
+
+        >>> print(escape('public."a\\\\b"'))
+        public.\\"a\\\\b\\"
+    """
+
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    """Format a sample value.
+
+    Example:
+
+        >>> format_value(3.0), format_value(0.25)
+        ('3', '0.25')
+    """
+
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(metrics: Sequence[Metric]) -> str:
+    """Render the given metrics in the OpenMetrics text format.
+
+    The output is understood by Prometheus text format parsers as well,
+    such as the node_exporter textfile collector.
+
+    Example:
+
+        >>> print(render([Metric('ivory_up', "Whether ivory works.", [({}, 1)])]), end='')
+        # HELP ivory_up Whether ivory works.
+        # TYPE ivory_up gauge
+        ivory_up 1
+        # EOF
+    """
+
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for labels, value in metric.samples:
+            label_text = ','.join(
+                f'{key}="{escape(label)}"' for key, label in labels.items()
+            )
+            name = f'{metric.name}{{{label_text}}}' if label_text else metric.name
+            lines.append(f'{name} {format_value(value)}')
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def known_gauges(
+    labels: Labels, *gauges: Tuple[str, str, Optional[float]]
+) -> List[Metric]:
+    """Return the given `(name, help, value)` gauges whose value is known."""
+
+    return [
+        Metric(name, help, [(labels, value)])
+        for (name, help, value) in gauges
+        if value is not None
+    ]
+
+
+def status_metrics(
+    result: status.Status,
+    subscription_name: str,
+    rates: Optional[Dict[str, status.Rate]] = None,
+) -> List[Metric]:
+    """Build metrics from a replication status snapshot.
+
+    `rates` are the copy rates of relations, see `status.copy_rates`.
+    """
+
+    labels = {'subscription': subscription_name}
+
+    counts = {label: 0 for label in status.STATE_LABELS.values()}
+    for relation in result.relations:
+        label = status.STATE_LABELS.get(relation.state, relation.state.decode())
+        counts[label] = counts.get(label, 0) + 1
+
+    metrics = [
+        Metric(
+            'ivory_replication_active',
+            "Whether the replication connection is streaming or catching up.",
+            [(labels, float(result.replication_state is not None))],
+        ),
+        Metric(
+            'ivory_source_lsn_bytes',
+            "Current WAL position of the source.",
+            [(labels, result.source_lsn)],
+        ),
+        Metric(
+            'ivory_slot_active',
+            "Whether the replication slot exists and is active.",
+            [(labels, float(bool(result.slot_active)))],
+        ),
+        Metric(
+            'ivory_relations',
+            "Number of subscribed relations per synchronization state.",
+            [({**labels, 'state': label}, count) for label, count in counts.items()],
+        ),
+        Metric(
+            'ivory_post_data_pending',
+            "Whether indexes or constraint validations deferred by copyschema are missing.",
+            [(labels, float(status.post_data_pending(result)))],
+        ),
+    ]
+
+    if result.last_reply_delta is not None:
+        metrics.append(
+            Metric(
+                'ivory_last_reply_seconds',
+                "Time since the last reply from the target.",
+                [(labels, result.last_reply_delta.total_seconds())],
+            )
+        )
+    if result.flush_lsn is not None:
+        metrics.append(
+            Metric(
+                'ivory_lag_bytes',
+                "WAL the target has not flushed yet.",
+                [(labels, result.source_lsn - result.flush_lsn)],
+            )
+        )
+
+    lag = result.lag
+    if lag is not None:
+        metrics += known_gauges(
+            labels,
+            (
+                'ivory_network_delay_seconds',
+                "Transit time of the last message to the apply worker.",
+                lag.network_delay.total_seconds()
+                if lag.network_delay is not None
+                else None,
+            ),
+            (
+                'ivory_network_backlog_bytes',
+                "WAL sent by the source, but not received by the target yet.",
+                lag.network_bytes,
+            ),
+            (
+                'ivory_apply_delay_seconds',
+                "Time between the target receiving and applying changes.",
+                lag.apply_delay.total_seconds()
+                if lag.apply_delay is not None
+                else None,
+            ),
+            (
+                'ivory_apply_backlog_bytes',
+                "WAL received by the target, but not applied yet.",
+                lag.apply_bytes,
+            ),
+        )
+
+    usage = result.slot_usage
+    if usage is not None:
+        metrics += known_gauges(
+            labels,
+            (
+                'ivory_slot_retained_wal_bytes',
+                "WAL the source retains for the replication slot.",
+                usage.retained_bytes,
+            ),
+            (
+                'ivory_slot_safe_wal_size_bytes',
+                "WAL that can be written before the replication slot is lost.",
+                usage.safe_wal_size,
+            ),
+            (
+                'ivory_slot_xmin_age',
+                "Age of the xmin of the replication slot in transactions.",
+                usage.xmin_age,
+            ),
+            (
+                'ivory_slot_catalog_xmin_age',
+                "Age of the catalog xmin of the replication slot in transactions.",
+                usage.catalog_xmin_age,
+            ),
+        )
+
+    copying = [relation for relation in result.relations if relation.state == b'd']
+    metrics.append(
+        Metric(
+            'ivory_relation_copy_progress_ratio',
+            "Copy progress of relations being copied.",
+            [
+                ({**labels, 'relation': relation.name}, status.progress(relation) / 100)
+                for relation in copying
+            ],
+        )
+    )
+
+    if rates:
+        metrics.append(
+            Metric(
+                'ivory_relation_copy_bytes_per_second',
+                "Bytes of relations being copied per second.",
+                [
+                    ({**labels, 'relation': name}, rate.bytes_per_second)
+                    for name, rate in rates.items()
+                ],
+            )
+        )
+        total = status.total_rate(result, rates)
+        if total.eta is not None:
+            metrics.append(
+                Metric(
+                    'ivory_initial_sync_eta_seconds',
+                    "Estimated time until the initial synchronization is done.",
+                    [(labels, total.eta.total_seconds())],
+                )
+            )
+
+    return metrics
@@ -0,0 +1,330 @@
+"""Initial table synchronization estimates."""
+
+import argparse
+import asyncio
+import heapq
+import logging
+import time
+from datetime import timedelta
+from typing import List, NamedTuple, Optional, Sequence
+
+import asyncpg  # type: ignore
+
+from ivory import helpers
+
+
+__all__ = (
+    'add_arguments',
+    'add_wal_rate_arguments',
+    'estimate',
+    'publication_tables',
+    'report',
+    'source_wal_rate',
+)
+
+log = logging.getLogger(__name__)
+
+# Seconds the sample copy may take at most. The rows copied until then
+# still yield a throughput.
+COPY_SAMPLE_TIMEOUT = 5
+
+
+class TableSize(NamedTuple):
+    name: str
+    size: int
+
+
+class Estimate(NamedTuple):
+    tables: List[TableSize]
+    total_size: int
+    throughput: Optional[float]
+    # Whether the throughput was measured instead of given by the user.
+    measured: bool
+    workers: int
+    duration: timedelta
+    wal_rate: float
+    wal_retention: int
+
+
+def throughput(value: str) -> float:
+    """Parse a throughput in bytes per second, such as `50MB`.
+
+    Example:
+
+        >>> throughput('50MB')
+        52428800.0
+    """
+
+    return float(helpers.parse_size(value))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add arguments for commands estimating the initial synchronization."""
+
+    group = parser.add_argument_group('estimate options')
+    group.add_argument(
+        '--copy-throughput',
+        help=(
+            "Bytes per second a single table synchronization worker copies, "
+            "for example `50MB`. By default, this is approximated by copying "
+            "a sample of the largest table from the source to ivory, which "
+            "neither includes writing to the target nor the network path "
+            "between the databases."
+        ),
+        type=throughput,
+        default=None,
+    )
+    group.add_argument(
+        '--copy-sample-rows',
+        help=(
+            "Rows to copy from the largest table when measuring copy "
+            f"throughput. The copy is stopped after {COPY_SAMPLE_TIMEOUT} seconds."
+        ),
+        type=int,
+        default=10_000,
+    )
+    add_wal_rate_arguments(group)
+    group.add_argument(
+        '--largest-tables',
+        help="Number of largest tables to report.",
+        type=int,
+        default=5,
+    )
+
+
+def add_wal_rate_arguments(group: argparse._ArgumentGroup) -> None:
+    """Add arguments for determining the WAL rate of the source."""
+
+    group.add_argument(
+        '--wal-rate',
+        help=(
+            "Bytes of WAL per second the source generates, for example `5MB`. "
+            "By default, this is measured by sampling the current WAL position."
+        ),
+        type=throughput,
+        default=None,
+    )
+    group.add_argument(
+        '--wal-sample-pause',
+        help="Seconds between the WAL position samples used for measuring the WAL rate.",
+        type=float,
+        default=1.0,
+    )
+
+
+async def publication_tables(source_db: asyncpg.Connection) -> List[str]:
+    """Return the qualified names of all tables ivory publishes."""
+
+    (tables,) = await source_db.fetchrow(
+        """
+        SELECT
+            array_agg(quote_ident(table_schema) || '.' || quote_ident(table_name))
+        FROM
+            information_schema.tables
+        WHERE
+            table_schema NOT IN ('pg_catalog', 'information_schema')
+            AND table_type = 'BASE TABLE';
+        """
+    )
+    return list(tables or ())
+
+
+async def table_sizes(
+    source_db: asyncpg.Connection, tables: Sequence[str]
+) -> List[TableSize]:
+    """Return the size of the given tables without indexes, largest first."""
+
+    rows = await source_db.fetch(
+        """
+        SELECT
+            name,
+            pg_table_size(name::regclass)
+        FROM
+            unnest($1::text[]) AS name
+        ORDER BY
+            2 DESC
+        """,
+        tables,
+    )
+    return [TableSize(name=name, size=size) for (name, size) in rows]
+
+
+async def sync_workers(target_db: asyncpg.Connection) -> int:
+    """Return how many tables the target synchronizes in parallel."""
+
+    (per_subscription, logical_workers) = await target_db.fetchrow(
+        """
+        SELECT
+            current_setting('max_sync_workers_per_subscription')::int,
+            current_setting('max_logical_replication_workers')::int
+        """
+    )
+    # One of the logical replication workers is the apply worker.
+    return max(1, min(int(per_subscription), int(logical_workers) - 1))
+
+
+async def sample_wal_rate(source_db: asyncpg.Connection, pause: float) -> float:
+    """Measure the bytes of WAL per second the source generates."""
+
+    (start_lsn,) = await source_db.fetchrow('SELECT pg_current_wal_lsn()')
+    started = time.monotonic()
+    await asyncio.sleep(pause)
+    (end_lsn,) = await source_db.fetchrow('SELECT pg_current_wal_lsn()')
+    return float(end_lsn - start_lsn) / (time.monotonic() - started)
+
+
+async def source_wal_rate(
+    source_db: asyncpg.Connection, args: argparse.Namespace
+) -> float:
+    """Return the WAL rate given by `--wal-rate`, or sample it."""
+
+    if args.wal_rate is not None:
+        return float(args.wal_rate)
+    return await sample_wal_rate(source_db, pause=args.wal_sample_pause)
+
+
+async def measure_copy_throughput(
+    source_db: asyncpg.Connection, table: str, rows: int
+) -> Optional[float]:
+    """Measure the table bytes per second the source can copy out to this client.
+
+    Copies up to `rows` rows of the given table, for at most
+    `COPY_SAMPLE_TIMEOUT` seconds, and scales the elapsed time by the
+    average row size on disk, so that the result can be compared with
+    table sizes. This only approximates the throughput of
+    a sync worker, which also writes to the target and may be connected
+    to the source over a different network path.
+    """
+
+    (bytes_per_row,) = await source_db.fetchrow(
+        """
+        SELECT
+            pg_table_size(c.oid) / NULLIF(c.reltuples, 0)
+        FROM
+            pg_catalog.pg_class AS c
+        WHERE
+            c.oid = $1::regclass
+        """,
+        table,
+    )
+    if bytes_per_row is None or bytes_per_row <= 0:
+        return None
+
+    copied_rows = 0
+
+    async def count_rows(data: bytes) -> None:
+        nonlocal copied_rows
+        copied_rows += data.count(b'\n')
+
+    started = time.monotonic()
+    try:
+        async with source_db.transaction(readonly=True):
+            await source_db.execute(
+                f"SET LOCAL statement_timeout = {COPY_SAMPLE_TIMEOUT * 1000}"
+            )
+            await source_db.copy_from_query(
+                f'SELECT * FROM {table} LIMIT {int(rows)}', output=count_rows
+            )
+    except asyncpg.exceptions.QueryCanceledError:
+        log.debug(
+            "Stopped copying a sample of %s after %s seconds and %d rows.",
+            table,
+            COPY_SAMPLE_TIMEOUT,
+            copied_rows,
+        )
+    elapsed = time.monotonic() - started
+
+    if not copied_rows or not elapsed:
+        return None
+    return float(copied_rows * bytes_per_row / elapsed)
+
+
+def schedule(sizes: Sequence[int], workers: int) -> List[int]:
+    """Distribute tables over workers, largest first, and return each worker's load.
+
+    This mirrors how sync workers pick up the next table as soon as they
+    finish one.
+
+    Example:
+
+        >>> schedule([10, 7, 5, 3, 1], workers=2)
+        [13, 13]
+        >>> schedule([10, 1, 1], workers=4)
+        [0, 1, 1, 10]
+    """
+
+    loads = [0] * workers
+    for size in sorted(sizes, reverse=True):
+        heapq.heapreplace(loads, loads[0] + size)
+    return sorted(loads)
+
+
+async def estimate(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    args: argparse.Namespace,
+) -> Estimate:
+    """Estimate the initial table synchronization of the publication."""
+
+    tables = await table_sizes(source_db, await publication_tables(source_db))
+    workers = await sync_workers(target_db)
+
+    copy_throughput = args.copy_throughput
+    if copy_throughput is None and tables and tables[0].size:
+        copy_throughput = await measure_copy_throughput(
+            source_db, table=tables[0].name, rows=args.copy_sample_rows
+        )
+
+    wal_rate = await source_wal_rate(source_db, args)
+
+    loads = schedule([table.size for table in tables], workers=workers)
+    seconds = max(loads) / copy_throughput if copy_throughput else 0.0
+
+    return Estimate(
+        tables=tables,
+        total_size=sum(table.size for table in tables),
+        throughput=copy_throughput,
+        measured=args.copy_throughput is None,
+        workers=workers,
+        duration=timedelta(seconds=round(seconds)),
+        wal_rate=wal_rate,
+        # The subscription's slot retains all WAL generated until the
+        # initial synchronization is done.
+        wal_retention=int(wal_rate * seconds),
+    )
+
+
+def report(result: Estimate, largest: int) -> None:
+    """Log the given estimate."""
+
+    log.info(
+        "Initial synchronization copies %d tables with %s of data "
+        "using %d sync workers.",
+        len(result.tables),
+        helpers.format_size(result.total_size),
+        result.workers,
+    )
+    for table in result.tables[:largest]:
+        log.info("Table %s: %s.", table.name, helpers.format_size(table.size))
+
+    if result.throughput is None:
+        log.warning("Unable to determine copy throughput, no estimate available.")
+        return
+
+    if result.measured:
+        log.info(
+            "Copying from the source to ivory runs at %s/s. This approximates "
+            "the throughput of a sync worker, which also writes to the target, "
+            "pass `--copy-throughput` to use a known throughput instead.",
+            helpers.format_size(result.throughput),
+        )
+    log.info(
+        "At %s/s per sync worker, the initial synchronization takes about %s.",
+        helpers.format_size(result.throughput),
+        result.duration,
+    )
+    log.info(
+        "At %s/s of WAL, the source retains about %s of WAL in the meantime.",
+        helpers.format_size(result.wal_rate),
+        helpers.format_size(result.wal_retention),
+    )
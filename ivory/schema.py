@@ -1,13 +1,668 @@
+import asyncio
+import contextlib
+import locale
 import logging
 import os
 import re
 import subprocess
 import tempfile
-from typing import Optional
+import time
+from typing import (
+    AsyncGenerator,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import asyncpg  # type: ignore
 
 
 log = logging.getLogger(__name__)
 
+# Function bodies and view definitions may end up on a single, long line.
+MAX_LINE_LENGTH = 2**24
+
+# Seconds between progress reports while restoring archives.
+RESTORE_PROGRESS_INTERVAL = 5
+
+# Above this many relations, restricting `pg_dump` via `--table` is not
+# worth the risk of overly long command lines.
+MAX_DUMP_TABLES = 500
+
+FINGERPRINT_SQL = r"""
+WITH
+extension_members AS (
+    SELECT classid, objid FROM pg_catalog.pg_depend WHERE deptype = 'e'
+),
+namespaces AS (
+    SELECT
+        oid,
+        quote_ident(nspname) AS name
+    FROM
+        pg_catalog.pg_namespace
+    WHERE
+        nspname NOT IN ('pg_catalog', 'information_schema')
+        AND nspname NOT LIKE 'pg\_toast%'
+        AND nspname NOT LIKE 'pg\_temp\_%'
+),
+relations AS (
+    SELECT
+        c.oid,
+        n.name || '.' || quote_ident(c.relname) AS name,
+        c.relkind,
+        c.relpersistence,
+        c.relreplident,
+        c.relispartition,
+        c.reloptions,
+        c.relpartbound,
+        c.relowner,
+        c.relacl,
+        c.relrowsecurity,
+        c.relforcerowsecurity
+    FROM
+        pg_catalog.pg_class AS c
+        JOIN namespaces AS n ON (n.oid = c.relnamespace)
+    WHERE
+        c.relkind IN ('r', 'p', 'v', 'm', 'f', 'c', 'S')
+        AND NOT EXISTS (
+            SELECT FROM extension_members AS d
+            WHERE d.classid = 'pg_catalog.pg_class'::regclass AND d.objid = c.oid
+        )
+)
+-- Composite types cannot be dumped with `pg_dump --table`, so they are
+-- compared like other types.
+SELECT
+    CASE WHEN r.relkind = 'c' THEN 'type' ELSE 'relation' END AS kind,
+    r.name AS identity,
+    CASE WHEN r.relkind != 'c' THEN r.name END AS relation,
+    md5(concat_ws(
+        ' ',
+        r.relkind,
+        r.relpersistence,
+        r.relreplident,
+        r.relispartition,
+        r.reloptions::text,
+        pg_get_expr(r.relpartbound, r.oid),
+        CASE WHEN r.relkind IN ('v', 'm') THEN pg_get_viewdef(r.oid) END,
+        pg_get_userbyid(r.relowner),
+        r.relacl::text,
+        r.relrowsecurity,
+        r.relforcerowsecurity,
+        obj_description(r.oid, 'pg_class')
+    )) AS hash
+FROM
+    relations AS r
+WHERE
+    r.relkind != 'S'
+UNION ALL
+SELECT
+    'columns',
+    r.name,
+    CASE WHEN r.relkind != 'c' THEN r.name END,
+    md5(string_agg(
+        concat_ws(
+            ' ',
+            quote_ident(a.attname),
+            format_type(a.atttypid, a.atttypmod),
+            a.attnotnull,
+            a.attidentity,
+            co.collname,
+            pg_get_expr(ad.adbin, ad.adrelid),
+            a.attacl::text,
+            a.attstorage,
+            a.attstattarget,
+            a.attoptions::text,
+            col_description(r.oid, a.attnum)
+        ),
+        ', '
+        ORDER BY a.attnum
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_attribute AS a ON (a.attrelid = r.oid)
+    LEFT JOIN pg_catalog.pg_attrdef AS ad
+        ON (ad.adrelid = a.attrelid AND ad.adnum = a.attnum)
+    LEFT JOIN pg_catalog.pg_collation AS co ON (co.oid = a.attcollation)
+WHERE
+    a.attnum > 0
+    AND NOT a.attisdropped
+    AND r.relkind != 'S'
+GROUP BY
+    r.name,
+    r.relkind
+UNION ALL
+SELECT
+    'sequence',
+    r.name,
+    r.name,
+    md5(concat_ws(
+        ' ',
+        format_type(s.seqtypid, NULL),
+        s.seqstart,
+        s.seqincrement,
+        s.seqmin,
+        s.seqmax,
+        s.seqcache,
+        s.seqcycle,
+        pg_get_userbyid(r.relowner),
+        r.relacl::text,
+        obj_description(r.oid, 'pg_class')
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_sequence AS s ON (s.seqrelid = r.oid)
+UNION ALL
+SELECT
+    'constraint',
+    r.name || '.' || quote_ident(co.conname),
+    r.name,
+    md5(concat_ws(
+        ' ',
+        pg_get_constraintdef(co.oid),
+        obj_description(co.oid, 'pg_constraint')
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_constraint AS co ON (co.conrelid = r.oid)
+UNION ALL
+SELECT
+    'index',
+    n.name || '.' || quote_ident(ic.relname),
+    r.name,
+    md5(concat_ws(
+        ' ',
+        pg_get_indexdef(i.indexrelid),
+        obj_description(i.indexrelid, 'pg_class')
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_index AS i ON (i.indrelid = r.oid)
+    JOIN pg_catalog.pg_class AS ic ON (ic.oid = i.indexrelid)
+    JOIN namespaces AS n ON (n.oid = ic.relnamespace)
+UNION ALL
+SELECT
+    'trigger',
+    r.name || '.' || quote_ident(t.tgname),
+    r.name,
+    md5(concat_ws(
+        ' ',
+        pg_get_triggerdef(t.oid),
+        t.tgenabled,
+        obj_description(t.oid, 'pg_trigger')
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_trigger AS t ON (t.tgrelid = r.oid)
+WHERE
+    NOT t.tgisinternal
+UNION ALL
+SELECT
+    'type',
+    n.name || '.' || quote_ident(t.typname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        t.typtype,
+        format_type(t.typbasetype, t.typtypmod),
+        t.typnotnull,
+        t.typdefault,
+        (
+            SELECT string_agg(e.enumlabel, ', ' ORDER BY e.enumsortorder)
+            FROM pg_catalog.pg_enum AS e
+            WHERE e.enumtypid = t.oid
+        ),
+        (
+            SELECT string_agg(pg_get_constraintdef(co.oid), ', ' ORDER BY co.conname)
+            FROM pg_catalog.pg_constraint AS co
+            WHERE co.contypid = t.oid
+        ),
+        pg_get_userbyid(t.typowner),
+        t.typacl::text,
+        obj_description(t.oid, 'pg_type')
+    ))
+FROM
+    pg_catalog.pg_type AS t
+    JOIN namespaces AS n ON (n.oid = t.typnamespace)
+WHERE
+    t.typtype IN ('b', 'd', 'e', 'r')
+    AND NOT EXISTS (
+        SELECT FROM pg_catalog.pg_type AS element WHERE element.typarray = t.oid
+    )
+    AND NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_type'::regclass AND d.objid = t.oid
+    )
+UNION ALL
+SELECT
+    'function',
+    n.name || '.' || quote_ident(p.proname)
+        || '(' || pg_get_function_identity_arguments(p.oid) || ')',
+    NULL,
+    md5(concat_ws(
+        ' ',
+        pg_get_function_result(p.oid),
+        l.lanname,
+        p.prosrc,
+        p.probin,
+        p.provolatile,
+        p.proisstrict,
+        p.prosecdef,
+        p.proleakproof,
+        p.proconfig::text,
+        pg_get_userbyid(p.proowner),
+        p.proacl::text,
+        obj_description(p.oid, 'pg_proc')
+    ))
+FROM
+    pg_catalog.pg_proc AS p
+    JOIN namespaces AS n ON (n.oid = p.pronamespace)
+    JOIN pg_catalog.pg_language AS l ON (l.oid = p.prolang)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_proc'::regclass AND d.objid = p.oid
+    )
+UNION ALL
+SELECT
+    'policy',
+    r.name || '.' || quote_ident(p.polname),
+    r.name,
+    md5(concat_ws(
+        ' ',
+        p.polcmd,
+        p.polpermissive,
+        (
+            SELECT string_agg(
+                CASE
+                    WHEN grantee = 0 THEN 'public'
+                    ELSE pg_get_userbyid(grantee)::text
+                END,
+                ', '
+                ORDER BY grantee
+            )
+            FROM unnest(p.polroles) AS grantee
+        ),
+        pg_get_expr(p.polqual, p.polrelid),
+        pg_get_expr(p.polwithcheck, p.polrelid),
+        obj_description(p.oid, 'pg_policy')
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_policy AS p ON (p.polrelid = r.oid)
+UNION ALL
+SELECT
+    'rule',
+    r.name || '.' || quote_ident(ru.rulename),
+    r.name,
+    md5(concat_ws(
+        ' ',
+        pg_get_ruledef(ru.oid),
+        ru.ev_enabled,
+        obj_description(ru.oid, 'pg_rewrite')
+    ))
+FROM
+    relations AS r
+    JOIN pg_catalog.pg_rewrite AS ru ON (ru.ev_class = r.oid)
+WHERE
+    -- Views are implemented by this rule.
+    ru.rulename != '_RETURN'
+UNION ALL
+-- `pg_dump --table` leaves out extended statistics, so differences
+-- cause a complete dump.
+SELECT
+    'statistics',
+    n.name || '.' || quote_ident(s.stxname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        pg_get_statisticsobjdef(s.oid),
+        pg_get_userbyid(s.stxowner),
+        obj_description(s.oid, 'pg_statistic_ext')
+    ))
+FROM
+    pg_catalog.pg_statistic_ext AS s
+    JOIN namespaces AS n ON (n.oid = s.stxnamespace)
+UNION ALL
+SELECT
+    'schema',
+    n.name,
+    NULL,
+    md5(concat_ws(
+        ' ',
+        pg_get_userbyid(ns.nspowner),
+        ns.nspacl::text,
+        obj_description(ns.oid, 'pg_namespace')
+    ))
+FROM
+    namespaces AS n
+    JOIN pg_catalog.pg_namespace AS ns ON (ns.oid = n.oid)
+UNION ALL
+-- `pg_dump` does not dump extension versions.
+SELECT
+    'extension',
+    quote_ident(e.extname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        n.nspname,
+        obj_description(e.oid, 'pg_extension')
+    ))
+FROM
+    pg_catalog.pg_extension AS e
+    JOIN pg_catalog.pg_namespace AS n ON (n.oid = e.extnamespace)
+UNION ALL
+-- Collation versions depend on the C or ICU library, `pg_dump` leaves
+-- them out.
+SELECT
+    'collation',
+    n.name || '.' || quote_ident(c.collname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        (
+            to_jsonb(c)
+            - ARRAY['oid', 'collname', 'collnamespace', 'collowner', 'collversion']
+        )::text,
+        pg_get_userbyid(c.collowner),
+        obj_description(c.oid, 'pg_collation')
+    ))
+FROM
+    pg_catalog.pg_collation AS c
+    JOIN namespaces AS n ON (n.oid = c.collnamespace)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_collation'::regclass AND d.objid = c.oid
+    )
+UNION ALL
+SELECT
+    'cast',
+    format_type(c.castsource, NULL) || ' AS ' || format_type(c.casttarget, NULL),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        c.castfunc::regprocedure::text,
+        c.castcontext,
+        c.castmethod,
+        obj_description(c.oid, 'pg_cast')
+    ))
+FROM
+    pg_catalog.pg_cast AS c
+WHERE
+    -- Casts are not part of a schema, but built-in ones have lower oids.
+    c.oid >= 16384
+    AND NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_cast'::regclass AND d.objid = c.oid
+    )
+UNION ALL
+SELECT
+    'operator',
+    n.name || '.' || o.oprname || '(' || format_type(o.oprleft, NULL)
+        || ', ' || format_type(o.oprright, NULL) || ')',
+    NULL,
+    md5(concat_ws(
+        ' ',
+        o.oprkind,
+        o.oprcanmerge,
+        o.oprcanhash,
+        format_type(o.oprresult, NULL),
+        o.oprcom::regoperator::text,
+        o.oprnegate::regoperator::text,
+        o.oprcode::regprocedure::text,
+        o.oprrest::regprocedure::text,
+        o.oprjoin::regprocedure::text,
+        pg_get_userbyid(o.oprowner),
+        obj_description(o.oid, 'pg_operator')
+    ))
+FROM
+    pg_catalog.pg_operator AS o
+    JOIN namespaces AS n ON (n.oid = o.oprnamespace)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_operator'::regclass AND d.objid = o.oid
+    )
+UNION ALL
+SELECT
+    'operator family',
+    n.name || '.' || quote_ident(f.opfname) || ' USING ' || am.amname,
+    NULL,
+    md5(concat_ws(
+        ' ',
+        (
+            SELECT string_agg(member, ', ' ORDER BY member)
+            FROM (
+                SELECT concat_ws(
+                    ' ',
+                    'OPERATOR',
+                    ao.amopstrategy,
+                    ao.amopopr::regoperator::text,
+                    ao.amoppurpose,
+                    (
+                        SELECT sf.opfname
+                        FROM pg_catalog.pg_opfamily AS sf
+                        WHERE sf.oid = ao.amopsortfamily
+                    )
+                ) AS member
+                FROM pg_catalog.pg_amop AS ao
+                WHERE ao.amopfamily = f.oid
+                UNION ALL
+                SELECT concat_ws(
+                    ' ',
+                    'FUNCTION',
+                    ap.amprocnum,
+                    format_type(ap.amproclefttype, NULL),
+                    format_type(ap.amprocrighttype, NULL),
+                    ap.amproc::regprocedure::text
+                )
+                FROM pg_catalog.pg_amproc AS ap
+                WHERE ap.amprocfamily = f.oid
+            ) AS members
+        ),
+        pg_get_userbyid(f.opfowner),
+        obj_description(f.oid, 'pg_opfamily')
+    ))
+FROM
+    pg_catalog.pg_opfamily AS f
+    JOIN namespaces AS n ON (n.oid = f.opfnamespace)
+    JOIN pg_catalog.pg_am AS am ON (am.oid = f.opfmethod)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_opfamily'::regclass AND d.objid = f.oid
+    )
+UNION ALL
+SELECT
+    'operator class',
+    n.name || '.' || quote_ident(c.opcname) || ' USING ' || am.amname,
+    NULL,
+    md5(concat_ws(
+        ' ',
+        (
+            SELECT fn.nspname || '.' || f.opfname
+            FROM pg_catalog.pg_opfamily AS f
+            JOIN pg_catalog.pg_namespace AS fn ON (fn.oid = f.opfnamespace)
+            WHERE f.oid = c.opcfamily
+        ),
+        format_type(c.opcintype, NULL),
+        c.opcdefault,
+        format_type(c.opckeytype, NULL),
+        pg_get_userbyid(c.opcowner),
+        obj_description(c.oid, 'pg_opclass')
+    ))
+FROM
+    pg_catalog.pg_opclass AS c
+    JOIN namespaces AS n ON (n.oid = c.opcnamespace)
+    JOIN pg_catalog.pg_am AS am ON (am.oid = c.opcmethod)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_opclass'::regclass AND d.objid = c.oid
+    )
+UNION ALL
+SELECT
+    'text search configuration',
+    n.name || '.' || quote_ident(c.cfgname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        (
+            SELECT pn.nspname || '.' || tp.prsname
+            FROM pg_catalog.pg_ts_parser AS tp
+            JOIN pg_catalog.pg_namespace AS pn ON (pn.oid = tp.prsnamespace)
+            WHERE tp.oid = c.cfgparser
+        ),
+        (
+            SELECT string_agg(
+                concat_ws(' ', m.maptokentype, m.mapseqno, m.mapdict::regdictionary),
+                ', '
+                ORDER BY m.maptokentype, m.mapseqno
+            )
+            FROM pg_catalog.pg_ts_config_map AS m
+            WHERE m.mapcfg = c.oid
+        ),
+        pg_get_userbyid(c.cfgowner),
+        obj_description(c.oid, 'pg_ts_config')
+    ))
+FROM
+    pg_catalog.pg_ts_config AS c
+    JOIN namespaces AS n ON (n.oid = c.cfgnamespace)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_ts_config'::regclass AND d.objid = c.oid
+    )
+UNION ALL
+SELECT
+    'text search dictionary',
+    n.name || '.' || quote_ident(t.dictname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        (
+            SELECT tn.nspname || '.' || tt.tmplname
+            FROM pg_catalog.pg_ts_template AS tt
+            JOIN pg_catalog.pg_namespace AS tn ON (tn.oid = tt.tmplnamespace)
+            WHERE tt.oid = t.dicttemplate
+        ),
+        t.dictinitoption,
+        pg_get_userbyid(t.dictowner),
+        obj_description(t.oid, 'pg_ts_dict')
+    ))
+FROM
+    pg_catalog.pg_ts_dict AS t
+    JOIN namespaces AS n ON (n.oid = t.dictnamespace)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_ts_dict'::regclass AND d.objid = t.oid
+    )
+UNION ALL
+SELECT
+    'foreign data wrapper',
+    quote_ident(w.fdwname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        w.fdwhandler::regproc::text,
+        w.fdwvalidator::regproc::text,
+        w.fdwoptions::text,
+        pg_get_userbyid(w.fdwowner),
+        w.fdwacl::text,
+        obj_description(w.oid, 'pg_foreign_data_wrapper')
+    ))
+FROM
+    pg_catalog.pg_foreign_data_wrapper AS w
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_foreign_data_wrapper'::regclass
+        AND d.objid = w.oid
+    )
+UNION ALL
+SELECT
+    'server',
+    quote_ident(s.srvname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        w.fdwname,
+        s.srvtype,
+        s.srvversion,
+        s.srvoptions::text,
+        pg_get_userbyid(s.srvowner),
+        s.srvacl::text,
+        obj_description(s.oid, 'pg_foreign_server')
+    ))
+FROM
+    pg_catalog.pg_foreign_server AS s
+    JOIN pg_catalog.pg_foreign_data_wrapper AS w ON (w.oid = s.srvfdw)
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_foreign_server'::regclass
+        AND d.objid = s.oid
+    )
+UNION ALL
+-- Options are only visible to their owners and superusers.
+SELECT
+    'user mapping',
+    quote_ident(um.usename) || ' SERVER ' || quote_ident(um.srvname),
+    NULL,
+    md5(coalesce(um.umoptions::text, ''))
+FROM
+    pg_catalog.pg_user_mappings AS um
+UNION ALL
+SELECT
+    'default privileges',
+    concat_ws(
+        ' ',
+        pg_get_userbyid(da.defaclrole),
+        quote_ident(dn.nspname),
+        da.defaclobjtype
+    ),
+    NULL,
+    md5(da.defaclacl::text)
+FROM
+    pg_catalog.pg_default_acl AS da
+    LEFT JOIN pg_catalog.pg_namespace AS dn ON (dn.oid = da.defaclnamespace)
+UNION ALL
+SELECT
+    'event trigger',
+    quote_ident(et.evtname),
+    NULL,
+    md5(concat_ws(
+        ' ',
+        et.evtevent,
+        et.evtfoid::regprocedure::text,
+        et.evtenabled,
+        et.evttags::text,
+        pg_get_userbyid(et.evtowner),
+        obj_description(et.oid, 'pg_event_trigger')
+    ))
+FROM
+    pg_catalog.pg_event_trigger AS et
+WHERE
+    NOT EXISTS (
+        SELECT FROM extension_members AS d
+        WHERE d.classid = 'pg_catalog.pg_event_trigger'::regclass
+        AND d.objid = et.oid
+    )
+"""
+
+
+class Fingerprint(NamedTuple):
+    relation: Optional[str]
+    hash: str
+
+
+Fingerprints = Dict[Tuple[str, str], Fingerprint]
+
 
 def port_from_addr(addr: str) -> str:
     matcher = re.compile(r'(\.s\.PGSQL\.|:)(\d+)')
@@ -15,41 +670,153 @@ def port_from_addr(addr: str) -> str:
     return match.group(2)
 
 
+def is_volatile(line: str) -> bool:
+    """Check whether the given `pg_dump` output line differs between runs.
+
+    Example:
+
+        >>> is_volatile('-- Dumped by pg_dump version 15.1')
+        True
+        >>> is_volatile('\\\\restrict 3hF7WQ')
+        True
+        >>> is_volatile('CREATE TABLE public.foo (bar integer);')
+        False
+    """
+
+    # Ignore the pg_dump version dumped with to allow easier comparisons.
+    # Newer releases also guard their output with a randomly keyed psql
+    # meta-command, which cannot be executed outside of psql either.
+    return line.startswith(('-- Dumped ', '\\restrict ', '\\unrestrict '))
+
+
+def dump_command(
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+    tables: Optional[Sequence[str]] = None,
+) -> List[str]:
+    """Build the `pg_dump` command line for dumping the given database schema.
+
+    Example:
+
+        >>> dump_command(host='db', port=5432, dbname=None, user=None, tables=['a'])
+        ... # doctest: +NORMALIZE_WHITESPACE
+        ['pg_dump', '--schema-only', '--no-publications', '--no-subscriptions',
+         '--host', 'db', '--port', '5432', '--table', 'a']
+    """
+
+    cmdline = [
+        'pg_dump',
+        '--schema-only',
+        '--no-publications',
+        '--no-subscriptions',
+    ]
+
+    cmdline.extend(connection_options(host=host, port=port, dbname=dbname, user=user))
+    for table in tables or ():
+        cmdline.extend(['--table', table])
+
+    return cmdline
+
+
+async def dump_version() -> Optional[str]:
+    """Return the version reported by `pg_dump --version`, if it can be run."""
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'pg_dump',
+            '--version',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError:
+        return None
+    (stdout, _) = await process.communicate()
+    if process.returncode != 0:
+        return None
+    return stdout.decode().strip()
+
+
+async def dump_lines(
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+    password: Optional[str],
+    tables: Optional[Sequence[str]] = None,
+) -> AsyncGenerator[str, None]:
+    """Stream the schema of the given database from `pg_dump`, line by line.
+
+    Lines are yielded as `pg_dump` produces them, without trailing newlines.
+    Raises `subprocess.CalledProcessError` if `pg_dump` fails.
+    """
+
+    cmdline = dump_command(
+        host=host, port=port, dbname=dbname, user=user, tables=tables
+    )
+    encoding = locale.getpreferredencoding(False)
+    process = await asyncio.create_subprocess_exec(
+        *cmdline,
+        stdout=asyncio.subprocess.PIPE,
+        # Passing the password via the child's environment only, instead of
+        # `os.environ`, allows dumping multiple databases at the same time.
+        env={**os.environ, 'PGPASSWORD': password or ''},
+        limit=MAX_LINE_LENGTH,
+    )
+    assert process.stdout is not None
+
+    completed = False
+    try:
+        async for raw_line in process.stdout:
+            line = raw_line.decode(encoding).rstrip('\n')
+            if not is_volatile(line):
+                yield line
+        completed = True
+
+    finally:
+        if not completed:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+        returncode = await process.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmdline)
+
+
 async def dump(
     host: Optional[str],
     port: Optional[int],
     dbname: Optional[str],
     user: Optional[str],
     password: Optional[str],
+    tables: Optional[Sequence[str]] = None,
+    keep_file: bool = False,
 ) -> str:
-    log.debug("Retrieving database schema.")
+    """Dump the schema of the given database via `pg_dump`.
 
-    os.environ['PGPASSWORD'] = password or ''
+    If `tables` is given, only the given relations and the objects
+    belonging to them are dumped. If `keep_file` is set, the schema
+    is additionally written to a temporary file for inspection.
+    """
 
-    try:
-        cmdline = [
-            'pg_dump',
-            '--schema-only',
-            '--no-publications',
-            '--no-subscriptions',
-        ]
+    log.debug("Retrieving database schema.")
 
-        if host:
-            cmdline.extend(['--host', host])
-        if port:
-            cmdline.extend(['--port', str(port)])
-        if user:
-            cmdline.extend(['--user', user])
-        if dbname:
-            cmdline.extend(['--dbname', dbname])
-
-        # Ignore the pg_dump version dumped with to allow easier comparisons.
-        schema = '\n'.join(
+    schema = '\n'.join(
+        [
             line
-            for line in subprocess.check_output(cmdline, text=True).splitlines()
-            if not line.startswith('-- Dumped ')
-        )
+            async for line in dump_lines(
+                host=host,
+                port=port,
+                dbname=dbname,
+                user=user,
+                password=password,
+                tables=tables,
+            )
+        ]
+    )
 
+    if keep_file:
         with tempfile.NamedTemporaryFile(
             prefix='ivory-schema-', mode='w+', suffix='.sql', delete=False
         ) as f:
@@ -58,7 +825,225 @@ async def dump(
         log.debug(
             "Schema SQL statements for %r on port %s copied to %r.", host, port, f.name
         )
-        return schema
 
-    finally:
-        os.unsetenv('PGPASSWORD')
+    return schema
+
+
+def connection_options(
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+) -> List[str]:
+    """Build connection options for PostgreSQL client programs.
+
+    Example:
+
+        >>> connection_options(host='db', port=5432, dbname='ivory', user=None)
+        ['--host', 'db', '--port', '5432', '--dbname', 'ivory']
+    """
+
+    options = []
+    if host:
+        options.extend(['--host', host])
+    if port:
+        options.extend(['--port', str(port)])
+    if user:
+        options.extend(['--user', user])
+    if dbname:
+        options.extend(['--dbname', dbname])
+    return options
+
+
+async def dump_directory(
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+    password: Optional[str],
+    path: str,
+) -> None:
+    """Dump the schema of the given database into a directory-format archive.
+
+    Such archives can be restored with multiple parallel jobs.
+    """
+
+    log.debug("Retrieving database schema into %r.", path)
+    cmdline = [
+        'pg_dump',
+        '--schema-only',
+        '--no-publications',
+        '--no-subscriptions',
+        '--format=directory',
+        '--file',
+        path,
+        *connection_options(host=host, port=port, dbname=dbname, user=user),
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmdline, env={**os.environ, 'PGPASSWORD': password or ''}
+    )
+    returncode = await process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmdline)
+
+
+RESTORE_ITEM = re.compile(
+    r'^pg_restore: (?P<event>launching|finished) item (?P<item>\d+) (?P<desc>.*)$'
+)
+
+
+async def restore(
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+    password: Optional[str],
+    path: str,
+    jobs: int,
+) -> None:
+    """Restore a directory-format archive with `jobs` parallel jobs.
+
+    Progress and the time taken by every object are logged.
+    """
+
+    env = {**os.environ, 'PGPASSWORD': password or ''}
+    listing = await asyncio.create_subprocess_exec(
+        'pg_restore', '--list', path, stdout=asyncio.subprocess.PIPE, env=env
+    )
+    (toc, _) = await listing.communicate()
+    total = sum(
+        1 for line in toc.decode().splitlines() if line and not line.startswith(';')
+    )
+
+    cmdline = [
+        'pg_restore',
+        '--verbose',
+        '--exit-on-error',
+        '--jobs',
+        str(jobs),
+        *connection_options(host=host, port=port, dbname=dbname, user=user),
+        path,
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmdline, stderr=asyncio.subprocess.PIPE, env=env, limit=MAX_LINE_LENGTH
+    )
+    assert process.stderr is not None
+
+    encoding = locale.getpreferredencoding(False)
+    started = {}
+    finished = 0
+    last_report = time.monotonic()
+
+    async for raw_line in process.stderr:
+        line = raw_line.decode(encoding).rstrip('\n')
+        match = RESTORE_ITEM.match(line)
+        if match is None:
+            if 'error' in line or 'warning' in line:
+                log.warning("%s", line)
+            else:
+                log.debug("%s", line)
+            continue
+
+        if match.group('event') == 'launching':
+            started[match.group('item')] = time.monotonic()
+            continue
+
+        finished += 1
+        item_started = started.pop(match.group('item'), None)
+        if item_started is not None:
+            log.debug(
+                "Restored %s in %.2f seconds.",
+                match.group('desc'),
+                time.monotonic() - item_started,
+            )
+
+        if time.monotonic() - last_report >= RESTORE_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            log.info(
+                "Restored %d of %d schema objects, currently running: %d.",
+                finished,
+                total,
+                len(started),
+            )
+
+    returncode = await process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmdline)
+
+
+async def fingerprint(db: asyncpg.Connection) -> Fingerprints:
+    """Hash every schema object in the database from its catalog entries.
+
+    Objects are keyed by their kind and qualified name, so the result of
+    two databases can be compared directly. Objects belonging to a
+    relation remember the relation they belong to.
+    """
+
+    log.debug("Retrieving catalog fingerprints.")
+    rows = await db.fetch(FINGERPRINT_SQL)
+    return {
+        (kind, identity): Fingerprint(relation=relation, hash=hash_)
+        for (kind, identity, relation, hash_) in rows
+    }
+
+
+def differing_objects(
+    source: Fingerprints, target: Fingerprints
+) -> Set[Tuple[str, str]]:
+    """Find objects that are missing on either side or differ.
+
+    Example:
+
+        >>> source = {('index', 'a_idx'): Fingerprint('a', 'x')}
+        >>> differing_objects(source, source)
+        set()
+        >>> sorted(differing_objects(source, {('index', 'b_idx'): Fingerprint('b', 'x')}))
+        [('index', 'a_idx'), ('index', 'b_idx')]
+    """
+
+    return {
+        key
+        for key in source.keys() | target.keys()
+        if source.get(key) != target.get(key)
+    }
+
+
+def tables_to_dump(
+    differing: Set[Tuple[str, str]], fingerprints: Fingerprints, other: Fingerprints
+) -> Optional[Sequence[str]]:
+    """Determine the relations to pass to `pg_dump --table`.
+
+    `fingerprints` are those of the database to be dumped, `other` are
+    those of the database it is compared to. Returns `None` when the
+    complete schema needs to be dumped, because some of the differing
+    objects do not belong to a relation. Relations that do not exist in
+    `fingerprints` are left out, since `pg_dump` cannot dump them.
+
+    Example:
+
+        >>> ours = {('relation', 'a'): Fingerprint('a', 'x')}
+        >>> theirs = {**ours, ('index', 'a_idx'): Fingerprint('a', 'y')}
+        >>> tables_to_dump({('index', 'a_idx')}, ours, theirs)
+        ['a']
+        >>> tables_to_dump({('relation', 'b')}, ours, {('relation', 'b'): Fingerprint('b', 'z')})
+        []
+        >>> tables_to_dump({('type', 'mood')}, ours, {('type', 'mood'): Fingerprint(None, 'z')})
+    """
+
+    existing = {
+        fingerprint.relation
+        for fingerprint in fingerprints.values()
+        if fingerprint.relation is not None
+    }
+    relations = set()
+
+    for key in differing:
+        fingerprint = fingerprints.get(key) or other[key]
+        if fingerprint.relation is None:
+            return None
+        if fingerprint.relation in existing:
+            relations.add(fingerprint.relation)
+
+    if len(relations) > MAX_DUMP_TABLES:
+        return None
+    return sorted(relations)
@@ -0,0 +1,266 @@
+"""On-disk cache for schema dumps."""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import cast, Optional, Sequence
+
+import asyncpg  # type: ignore
+
+from ivory import schema
+
+
+__all__ = ('dump',)
+
+log = logging.getLogger(__name__)
+
+# Any DDL inserts, updates or deletes rows in at least one of these
+# catalogs, which changes their row count or the sum of their row
+# versions. Statistics updates by VACUUM and ANALYZE are done in place
+# and leave the marker untouched. Roles and user mappings are only
+# readable through views without row versions, so their contents are
+# hashed instead. A renamed role changes every `OWNER TO` in the dump.
+CATALOG_MARKER_SQL = """
+SELECT
+    md5(string_agg(marker, ',' ORDER BY marker))
+FROM (
+    SELECT
+        catalog || ':' || tuples || ':' || xmins AS marker
+    FROM (
+        SELECT 'pg_amop' AS catalog, count(*) AS tuples, sum(xmin::text::bigint) AS xmins
+        FROM pg_catalog.pg_amop
+        UNION ALL
+        SELECT 'pg_amproc', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_amproc
+        UNION ALL
+        SELECT 'pg_attrdef', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_attrdef
+        UNION ALL
+        SELECT 'pg_attribute', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_attribute
+        UNION ALL
+        SELECT 'pg_cast', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_cast
+        UNION ALL
+        SELECT 'pg_class', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_class
+        UNION ALL
+        SELECT 'pg_collation', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_collation
+        UNION ALL
+        SELECT 'pg_constraint', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_constraint
+        UNION ALL
+        SELECT 'pg_default_acl', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_default_acl
+        UNION ALL
+        SELECT 'pg_depend', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_depend
+        UNION ALL
+        SELECT 'pg_description', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_description
+        UNION ALL
+        SELECT 'pg_enum', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_enum
+        UNION ALL
+        SELECT 'pg_event_trigger', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_event_trigger
+        UNION ALL
+        SELECT 'pg_extension', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_extension
+        UNION ALL
+        SELECT 'pg_foreign_data_wrapper', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_foreign_data_wrapper
+        UNION ALL
+        SELECT 'pg_foreign_server', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_foreign_server
+        UNION ALL
+        SELECT 'pg_index', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_index
+        UNION ALL
+        SELECT 'pg_namespace', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_namespace
+        UNION ALL
+        SELECT 'pg_opclass', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_opclass
+        UNION ALL
+        SELECT 'pg_operator', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_operator
+        UNION ALL
+        SELECT 'pg_opfamily', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_opfamily
+        UNION ALL
+        SELECT 'pg_policy', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_policy
+        UNION ALL
+        SELECT 'pg_proc', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_proc
+        UNION ALL
+        SELECT 'pg_rewrite', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_rewrite
+        UNION ALL
+        SELECT 'pg_sequence', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_sequence
+        UNION ALL
+        SELECT 'pg_statistic_ext', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_statistic_ext
+        UNION ALL
+        SELECT 'pg_trigger', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_trigger
+        UNION ALL
+        SELECT 'pg_ts_config', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_ts_config
+        UNION ALL
+        SELECT 'pg_ts_config_map', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_ts_config_map
+        UNION ALL
+        SELECT 'pg_ts_dict', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_ts_dict
+        UNION ALL
+        SELECT 'pg_ts_parser', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_ts_parser
+        UNION ALL
+        SELECT 'pg_ts_template', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_ts_template
+        UNION ALL
+        SELECT 'pg_type', count(*), sum(xmin::text::bigint)
+        FROM pg_catalog.pg_type
+        UNION ALL
+        SELECT 'pg_roles', count(*), sum(hashtext(oid || ':' || rolname))
+        FROM pg_catalog.pg_roles
+        UNION ALL
+        SELECT 'pg_user_mappings', count(*), sum(
+            hashtext(concat_ws(':', umid, umuser, srvid, umoptions::text))
+        )
+        FROM pg_catalog.pg_user_mappings
+    ) AS catalogs
+) AS markers
+"""
+
+
+async def server_identifier(db: asyncpg.Connection) -> Optional[int]:
+    """Return the system identifier of the server, if we may read it."""
+
+    try:
+        (identifier,) = await db.fetchrow(
+            "SELECT system_identifier FROM pg_control_system()"
+        )
+    except asyncpg.exceptions.InsufficientPrivilegeError:
+        return None
+    return cast(int, identifier)
+
+
+async def cache_key(
+    db: asyncpg.Connection,
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+    tables: Optional[Sequence[str]],
+) -> str:
+    """Compute the cache key for the schema of the given database.
+
+    The key changes whenever the catalogs of the database or the version
+    of `pg_dump` change.
+    """
+
+    (marker,) = await db.fetchrow(CATALOG_MARKER_SQL)
+    (database,) = await db.fetchrow("SELECT current_database()")
+    identity = {
+        'system_identifier': await server_identifier(db),
+        'database': database,
+        'cmdline': schema.dump_command(
+            host=host, port=port, dbname=dbname, user=user, tables=tables
+        ),
+        'marker': marker,
+        'pg_dump': await schema.dump_version(),
+    }
+    serialized = json.dumps(identity, sort_keys=True).encode()
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def evict(cache_dir: Path, max_size: int) -> None:
+    """Remove the least recently used entries until the cache fits `max_size`."""
+
+    entries = []
+    for path in cache_dir.glob('*.sql'):
+        with contextlib.suppress(FileNotFoundError):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for (_, size, _) in entries)
+    for (_, size, path) in sorted(entries):
+        if total_size <= max_size:
+            break
+
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+            log.debug("Evicted schema cache entry %r.", str(path))
+        total_size -= size
+
+
+def store(cache_dir: Path, path: Path, content: str, max_size: int) -> None:
+    """Atomically write a cache entry and evict old entries."""
+
+    cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=cache_dir, prefix='.ivory-', suffix='.tmp', mode='w', delete=False
+    ) as f:
+        f.write(content)
+    os.replace(f.name, path)
+    evict(cache_dir=cache_dir, max_size=max_size)
+
+
+async def dump(
+    db: asyncpg.Connection,
+    cache_dir: Optional[Path],
+    max_size: int,
+    host: Optional[str],
+    port: Optional[int],
+    dbname: Optional[str],
+    user: Optional[str],
+    password: Optional[str],
+    tables: Optional[Sequence[str]] = None,
+) -> str:
+    """Dump the schema of the given database, reusing a cached dump if possible.
+
+    `db` must be connected to the database that is dumped. Without a
+    `cache_dir`, this always runs `pg_dump`.
+    """
+
+    if cache_dir is None:
+        return await schema.dump(
+            host=host,
+            port=port,
+            dbname=dbname,
+            user=user,
+            password=password,
+            tables=tables,
+        )
+
+    key = await cache_key(
+        db, host=host, port=port, dbname=dbname, user=user, tables=tables
+    )
+    path = cache_dir / f'{key}.sql'
+
+    with contextlib.suppress(FileNotFoundError):
+        content = path.read_text()
+        # Mark the entry as recently used for eviction.
+        os.utime(path)
+        log.debug("Using cached schema %r for %r on port %s.", str(path), host, port)
+        return content
+
+    content = await schema.dump(
+        host=host,
+        port=port,
+        dbname=dbname,
+        user=user,
+        password=password,
+        tables=tables,
+    )
+    store(cache_dir=cache_dir, path=path, content=content, max_size=max_size)
+    return content
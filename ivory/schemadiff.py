@@ -0,0 +1,320 @@
+"""Object-level comparison of `pg_dump` schema output."""
+
+import difflib
+import html
+import re
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+
+__all__ = ('Entry', 'SchemaDiff', 'diff', 'render_html', 'render_unified', 'split')
+
+
+HEADER = re.compile(
+    r'^-- (?:Data for )?Name: (?P<name>.*); Type: (?P<type>.*); '
+    r'Schema: (?P<schema>.*); Owner: (?P<owner>[^;]*)(?:; Tablespace: .*)?$'
+)
+FOOTER = '-- PostgreSQL database dump complete'
+
+Key = Tuple[str, str, str]
+
+
+class Entry(NamedTuple):
+    type: str
+    schema: str
+    name: str
+    sql: str
+
+    @property
+    def key(self) -> Key:
+        return (self.type, self.schema, self.name)
+
+
+class SchemaDiff(NamedTuple):
+    """Differences between a source and a target schema.
+
+    `added` holds objects only present on the target, `removed` holds
+    objects only present on the source, and `changed` holds the source
+    and target SQL of objects present on both sides with differing
+    definitions.
+    """
+
+    added: Dict[Key, str]
+    removed: Dict[Key, str]
+    changed: Dict[Key, Tuple[str, str]]
+
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+
+def describe(key: Key) -> str:
+    """Describe the object with the given key for humans.
+
+    Example:
+
+        >>> describe(('TABLE', 'public', 'foo'))
+        'TABLE public.foo'
+        >>> describe(('EXTENSION', '-', 'hstore'))
+        'EXTENSION hstore'
+    """
+
+    (type_, schema, name) = key
+    if schema == '-':
+        return f'{type_} {name}'
+    return f'{type_} {schema}.{name}'
+
+
+def _finish(lines: List[str]) -> str:
+    # Entries are separated by an empty comment line and blank lines.
+    while lines and lines[-1] in ('', '--'):
+        lines.pop()
+    while lines and lines[0] in ('', '--'):
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def split(sql: str) -> Tuple[str, List[Entry]]:
+    """Split `pg_dump` output into its preamble and per-object entries.
+
+    Entries are returned in dump order. The preamble holds the session
+    setup statements `pg_dump` emits before the first object.
+
+    Example:
+
+        >>> (preamble, entries) = split('''
+        ... SET client_encoding = 'UTF8';
+        ...
+        ... --
+        ... -- Name: foo; Type: TABLE; Schema: public; Owner: postgres
+        ... --
+        ...
+        ... CREATE TABLE public.foo (bar integer);
+        ...
+        ... --
+        ... -- PostgreSQL database dump complete
+        ... --
+        ... ''')
+        >>> preamble
+        "SET client_encoding = 'UTF8';"
+        >>> [(entry.key, entry.sql) for entry in entries]
+        [(('TABLE', 'public', 'foo'), 'CREATE TABLE public.foo (bar integer);')]
+    """
+
+    preamble = None
+    entries = []
+    current = None
+    lines: List[str] = []
+
+    for line in sql.splitlines():
+        match = HEADER.match(line)
+        if match is None and line != FOOTER:
+            lines.append(line)
+            continue
+
+        if current is None:
+            preamble = _finish(lines)
+        else:
+            entries.append(current._replace(sql=_finish(lines)))
+
+        if match is None:
+            break
+
+        current = Entry(
+            type=match.group('type'),
+            schema=match.group('schema'),
+            name=match.group('name'),
+            sql='',
+        )
+        lines = []
+
+    else:
+        if current is None:
+            preamble = _finish(lines)
+        else:
+            entries.append(current._replace(sql=_finish(lines)))
+
+    return (preamble or '', entries)
+
+
+def objects(sql: str) -> Dict[Key, str]:
+    """Map the objects in `pg_dump` output from their key to their SQL.
+
+    Example:
+
+        >>> objects('''
+        ... -- Name: foo; Type: TABLE; Schema: public; Owner: postgres
+        ... CREATE TABLE public.foo (bar integer);
+        ... ''')
+        {('TABLE', 'public', 'foo'): 'CREATE TABLE public.foo (bar integer);'}
+    """
+
+    result: Dict[Key, str] = {}
+    (_, entries) = split(sql)
+
+    for entry in entries:
+        key = entry.key
+        duplicates = 1
+        while key in result:
+            duplicates += 1
+            key = (entry.type, entry.schema, f'{entry.name} #{duplicates}')
+        result[key] = entry.sql
+
+    return result
+
+
+def diff(source_sql: str, target_sql: str) -> SchemaDiff:
+    """Compare two schema dumps object by object.
+
+    Runs in time linear to the size of the dumps, since only objects
+    with the same key are compared with each other.
+
+    Example:
+
+        >>> source = '''
+        ... -- Name: a; Type: TABLE; Schema: public; Owner: postgres
+        ... CREATE TABLE public.a (id integer);
+        ... -- Name: b; Type: TABLE; Schema: public; Owner: postgres
+        ... CREATE TABLE public.b (id integer);
+        ... '''
+        >>> target = '''
+        ... -- Name: a; Type: TABLE; Schema: public; Owner: postgres
+        ... CREATE TABLE public.a (id bigint);
+        ... -- Name: c; Type: TABLE; Schema: public; Owner: postgres
+        ... CREATE TABLE public.c (id integer);
+        ... '''
+        >>> result = diff(source, target)
+        >>> list(result.added), list(result.removed), list(result.changed)
+        ([('TABLE', 'public', 'c')], [('TABLE', 'public', 'b')], [('TABLE', 'public', 'a')])
+        >>> diff(source, source).empty
+        True
+    """
+
+    source = objects(source_sql)
+    target = objects(target_sql)
+
+    return SchemaDiff(
+        added={key: sql for key, sql in target.items() if key not in source},
+        removed={key: sql for key, sql in source.items() if key not in target},
+        changed={
+            key: (sql, target[key])
+            for key, sql in source.items()
+            if key in target and target[key] != sql
+        },
+    )
+
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Schema differences</title>
+<style>
+    body {{ font-family: sans-serif; }}
+    table.diff {{ font-family: monospace; border: medium; }}
+    .diff_header {{ background-color: #e0e0e0; }}
+    td.diff_header {{ text-align: right; }}
+    .diff_next {{ background-color: #c0c0c0; }}
+    .diff_add {{ background-color: #aaffaa; }}
+    .diff_chg {{ background-color: #ffff77; }}
+    .diff_sub {{ background-color: #ffaaaa; }}
+    pre.added {{ background-color: #aaffaa; }}
+    pre.removed {{ background-color: #ffaaaa; }}
+</style>
+</head>
+<body>
+<h1>Schema differences</h1>
+<p>{summary}</p>
+{sections}
+</body>
+</html>
+'''
+
+
+def summarize(result: SchemaDiff) -> str:
+    """Summarize the given differences in a single line.
+
+    Example:
+
+        >>> summarize(SchemaDiff(added={}, removed={('TABLE', 'public', 'a'): ''}, changed={}))
+        '0 objects only on target, 1 objects only on source, 0 objects changed'
+    """
+
+    return (
+        f"{len(result.added)} objects only on target, "
+        f"{len(result.removed)} objects only on source, "
+        f"{len(result.changed)} objects changed"
+    )
+
+
+def render_html(result: SchemaDiff) -> str:
+    """Render the given differences as a standalone HTML document.
+
+    Side-by-side diffs are only computed for changed objects.
+    """
+
+    differ = difflib.HtmlDiff(tabsize=4)
+    sections = []
+
+    for key, (source_sql, target_sql) in sorted(result.changed.items()):
+        table = differ.make_table(
+            fromlines=source_sql.splitlines(),
+            tolines=target_sql.splitlines(),
+            fromdesc="Source schema",
+            todesc="Target schema",
+            context=True,
+        )
+        sections.append(f'<h2>Changed: {html.escape(describe(key))}</h2>\n{table}')
+
+    for title, css_class, changes in (
+        ("Only on source", 'removed', result.removed),
+        ("Only on target", 'added', result.added),
+    ):
+        for key, sql in sorted(changes.items()):
+            sections.append(
+                f'<h2>{title}: {html.escape(describe(key))}</h2>\n'
+                f'<pre class="{css_class}">{html.escape(sql)}</pre>'
+            )
+
+    return HTML_TEMPLATE.format(
+        summary=html.escape(summarize(result)), sections='\n'.join(sections)
+    )
+
+
+def _unified_lines(result: SchemaDiff) -> Iterator[str]:
+    for key, (source_sql, target_sql) in sorted(result.changed.items()):
+        yield from difflib.unified_diff(
+            source_sql.splitlines(),
+            target_sql.splitlines(),
+            fromfile=f'source: {describe(key)}',
+            tofile=f'target: {describe(key)}',
+            lineterm='',
+        )
+    for key, sql in sorted(result.removed.items()):
+        yield from difflib.unified_diff(
+            sql.splitlines(), [], fromfile=f'source: {describe(key)}', lineterm=''
+        )
+    for key, sql in sorted(result.added.items()):
+        yield from difflib.unified_diff(
+            [], sql.splitlines(), tofile=f'target: {describe(key)}', lineterm=''
+        )
+
+
+def render_unified(result: SchemaDiff) -> str:
+    """Render the given differences as a unified diff.
+
+    Example:
+
+        >>> result = SchemaDiff(
+        ...     added={},
+        ...     removed={},
+        ...     changed={('TABLE', 'public', 'a'): ('integer', 'bigint')},
+        ... )
+        >>> print(render_unified(result))
+        --- source: TABLE public.a
+        +++ target: TABLE public.a
+        @@ -1 +1 @@
+        -integer
+        +bigint
+    """
+
+    return '\n'.join(_unified_lines(result))
@@ -0,0 +1,272 @@
+"""Splitting SQL scripts into statements."""
+
+import re
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+
+__all__ = ('Splitter', 'Statement', 'parse_copy', 'split')
+
+
+IDENTIFIER = r'(?:"(?:[^"]|"")*"|[^\s.,()"]+)'
+
+COPY_FROM_STDIN = re.compile(
+    rf'^COPY\s+(?:(?P<schema>{IDENTIFIER})\.)?(?P<table>{IDENTIFIER})\s*'
+    r'(?:\((?P<columns>.*)\))?\s+FROM\s+stdin\b',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Tags of dollar quotes follow the rules of unquoted identifiers.
+DOLLAR_QUOTE = re.compile(r'\$(?:[^\W\d$][\w]*)?\$')
+
+
+class Statement(NamedTuple):
+    sql: str
+    # The rows following a `COPY ... FROM stdin` statement, in text format.
+    data: Optional[str] = None
+
+
+def _is_identifier_char(char: str) -> bool:
+    return char.isalnum() or char in '_$'
+
+
+def unquote(identifier: str) -> str:
+    """Return the name the given identifier refers to.
+
+    Example:
+
+        >>> unquote('"Weird ""name"" here"')
+        'Weird "name" here'
+        >>> unquote('foo')
+        'foo'
+    """
+
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+
+def parse_copy(statement: str) -> Tuple[Optional[str], str, Optional[List[str]]]:
+    """Return schema, table and columns of a `COPY ... FROM stdin` statement.
+
+    Example:
+
+        >>> parse_copy('COPY public."Foo" (id, "Bar") FROM stdin;')
+        ('public', 'Foo', ['id', 'Bar'])
+    """
+
+    match = COPY_FROM_STDIN.match(statement)
+    if match is None:
+        raise ValueError(f"not a COPY FROM stdin statement: {statement!r}")
+
+    schema = match.group('schema')
+    columns = match.group('columns')
+    return (
+        unquote(schema) if schema is not None else None,
+        unquote(match.group('table')),
+        [unquote(column) for column in re.findall(IDENTIFIER, columns)]
+        if columns is not None
+        else None,
+    )
+
+
+class Splitter:
+    """Incrementally split a SQL script, such as `pg_dump` output, into statements.
+
+    Lines are fed one at a time, so that scripts can be split while they
+    are being read. Semicolons within string literals, quoted identifiers,
+    dollar-quoted bodies, comments and `BEGIN ATOMIC ... END` function
+    bodies do not end a statement, and the data
+    of `COPY ... FROM stdin` statements is collected up to its `\\.`
+    terminator. Comments and psql meta-commands between statements are
+    dropped.
+    """
+
+    def __init__(self) -> None:
+        # Lines of the current statement seen so far.
+        self._lines: List[str] = []
+        # The delimiter closing the current string, identifier or dollar quote.
+        self._quote: Optional[str] = None
+        # Whether the current string literal allows backslash escapes.
+        self._escapes = False
+        self._comment_depth = 0
+        # Open `BEGIN ATOMIC` bodies and `CASE` expressions within them,
+        # which both end with `END`.
+        self._block_depth = 0
+        self._previous_word = ''
+        # The pending `COPY` statement and its rows.
+        self._copy: Optional[str] = None
+        self._data: List[str] = []
+
+    def feed(self, line: str) -> List[Statement]:
+        """Feed the next line, without its newline, and return completed statements."""
+
+        if self._copy is not None:
+            if line != '\\.':
+                self._data.append(line)
+                return []
+
+            statement = Statement(
+                sql=self._copy, data=''.join(row + '\n' for row in self._data)
+            )
+            self._copy = None
+            self._data = []
+            return [statement]
+
+        statements = []
+        start = 0
+        i = 0
+        length = len(line)
+
+        if not self._lines and self._quote is None and not self._comment_depth:
+            if line.lstrip().startswith('\\'):
+                return []
+
+        while i < length:
+            if self._comment_depth:
+                if line.startswith('/*', i):
+                    self._comment_depth += 1
+                    i += 2
+                elif line.startswith('*/', i):
+                    self._comment_depth -= 1
+                    i += 2
+                else:
+                    i += 1
+
+            elif self._quote == '\'' or self._quote == '"':
+                char = line[i]
+                if self._escapes and char == '\\':
+                    i += 2
+                elif char == self._quote:
+                    if line.startswith(self._quote, i + 1):
+                        i += 2
+                    else:
+                        self._quote = None
+                        i += 1
+                else:
+                    i += 1
+
+            elif self._quote is not None:
+                end = line.find(self._quote, i)
+                if end < 0:
+                    i = length
+                else:
+                    i = end + len(self._quote)
+                    self._quote = None
+
+            else:
+                char = line[i]
+                if line.startswith('--', i):
+                    if not self._lines and not line[start:i].strip():
+                        # Skip comment lines between statements.
+                        start = length
+                    break
+                elif line.startswith('/*', i):
+                    self._comment_depth = 1
+                    i += 2
+                elif char == '\'':
+                    self._quote = char
+                    self._escapes = (
+                        i > 0
+                        and line[i - 1] in 'eE'
+                        and (i < 2 or not _is_identifier_char(line[i - 2]))
+                    )
+                    i += 1
+                elif char == '"':
+                    self._quote = char
+                    self._escapes = False
+                    i += 1
+                elif char == '$':
+                    match = DOLLAR_QUOTE.match(line, i)
+                    if match is not None and not (
+                        i > 0 and _is_identifier_char(line[i - 1])
+                    ):
+                        self._quote = match.group()
+                        i = match.end()
+                    else:
+                        i += 1
+                elif _is_identifier_char(char):
+                    end = i + 1
+                    while end < length and _is_identifier_char(line[end]):
+                        end += 1
+                    self._keyword(line[i:end].upper())
+                    i = end
+                elif char == ';' and self._block_depth:
+                    i += 1
+                elif char == ';':
+                    i += 1
+                    self._previous_word = ''
+                    text = '\n'.join([*self._lines, line[start:i]]).strip()
+                    self._lines = []
+                    start = i
+                    if COPY_FROM_STDIN.match(text):
+                        self._copy = text
+                    else:
+                        statements.append(Statement(sql=text))
+                else:
+                    i += 1
+
+        rest = line[start:]
+        if (
+            self._lines
+            or self._quote is not None
+            or self._comment_depth
+            or rest.strip()
+        ):
+            self._lines.append(rest)
+
+        return statements
+
+    def _keyword(self, word: str) -> None:
+        if word == 'ATOMIC' and self._previous_word == 'BEGIN':
+            self._block_depth += 1
+        elif word == 'CASE' and self._block_depth:
+            self._block_depth += 1
+        elif word == 'END' and self._block_depth:
+            self._block_depth -= 1
+        self._previous_word = word
+
+    def close(self) -> List[Statement]:
+        """Finish splitting and return the unterminated last statement, if any.
+
+        Raises `ValueError` if the script ends within a quote, comment,
+        function body or `COPY` data.
+        """
+
+        if (
+            self._quote is not None
+            or self._comment_depth
+            or self._block_depth
+            or self._copy is not None
+        ):
+            raise ValueError("SQL script ends in the middle of a statement")
+
+        text = '\n'.join(self._lines).strip()
+        self._lines = []
+        return [Statement(sql=text)] if text else []
+
+
+def split(lines: Iterable[str]) -> List[Statement]:
+    """Split the given lines of a SQL script into statements.
+
+    Example:
+
+        >>> [statement.sql for statement in split([
+        ...     "SET search_path = '';",
+        ...     '-- Name: f; Type: FUNCTION; Schema: public; Owner: postgres',
+        ...     'CREATE FUNCTION public.f() RETURNS text AS $$',
+        ...     "    SELECT ';'; -- not the end",
+        ...     '$$ LANGUAGE sql;',
+        ... ])]  # doctest: +NORMALIZE_WHITESPACE
+        ["SET search_path = '';",
+         "CREATE FUNCTION public.f() RETURNS text AS $$\\n    SELECT ';';
+          -- not the end\\n$$ LANGUAGE sql;"]
+        >>> split(['COPY public.t (id) FROM stdin;', '1', '2', '\\\\.'])
+        [Statement(sql='COPY public.t (id) FROM stdin;', data='1\\n2\\n')]
+    """
+
+    splitter = Splitter()
+    statements = []
+    for line in lines:
+        statements.extend(splitter.feed(line))
+    statements.extend(splitter.close())
+    return statements
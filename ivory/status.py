@@ -0,0 +1,907 @@
+"""Replication status snapshots."""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import asyncpg  # type: ignore
+
+from ivory import constants
+from ivory import helpers
+
+
+__all__ = ('Relation', 'Status', 'collect', 'render', 'report', 'substate_to_human')
+
+log = logging.getLogger(__name__)
+
+
+class Relation(NamedTuple):
+    name: str
+    state: bytes
+    # Only determined for relations waiting for or being copied.
+    source_size: int = 0
+    target_size: int = 0
+    # From `pg_stat_progress_copy` on the source, where available.
+    copied_tuples: Optional[int] = None
+    total_tuples: Optional[int] = None
+
+
+class Rate(NamedTuple):
+    # Bytes of the relation on the source copied per second.
+    bytes_per_second: float
+    tuples_per_second: Optional[float]
+    eta: Optional[timedelta]
+
+
+class SlotUsage(NamedTuple):
+    # WAL the source keeps for the slot, behind its `restart_lsn`.
+    retained_bytes: Optional[int]
+    # Only reported by PostgreSQL 13 and later.
+    wal_status: Optional[str]
+    safe_wal_size: Optional[int]
+    # Transactions since the oldest one the slot holds back vacuum for.
+    xmin_age: Optional[int]
+    catalog_xmin_age: Optional[int]
+
+
+class Worker(NamedTuple):
+    """An apply or table synchronization worker in `pg_stat_subscription`."""
+
+    # `None` for the apply worker, else the relation being synchronized.
+    relation: Optional[str]
+    received_lsn: Optional[int]
+    latest_end_lsn: Optional[int]
+    # Between the source sending and the target receiving the last message.
+    network_delay: Optional[timedelta]
+    # Since the target received the last message.
+    receipt_delta: Optional[timedelta]
+
+
+class Lag(NamedTuple):
+    """Replication lag broken down into its network and subscriber parts."""
+
+    # Transit time of the last message to the apply worker.
+    network_delay: Optional[timedelta]
+    # WAL sent by the source, but not received by the target yet.
+    network_bytes: Optional[int]
+    # Between receiving changes and confirming them as applied, from
+    # `write_lag` and `replay_lag` in `pg_stat_replication`.
+    apply_delay: Optional[timedelta]
+    # WAL received by the target, but not applied and flushed yet.
+    apply_bytes: Optional[int]
+
+
+class Status(NamedTuple):
+    collected_at: datetime
+    # State of the replication connection in `pg_stat_replication`.
+    replication_state: Optional[str]
+    last_reply_delta: Optional[timedelta]
+    source_lsn: int
+    flush_lsn: Optional[int]
+    # `None` if the replication slot is missing.
+    slot_active: Optional[bool]
+    # An active table synchronization slot, if any.
+    sync_slot: Optional[str]
+    relations: List[Relation]
+    source_indexes: int
+    target_indexes: int
+    source_unvalidated: int
+    target_unvalidated: int
+    # `None` if the replication slot is missing.
+    slot_usage: Optional[SlotUsage] = None
+    workers: Tuple[Worker, ...] = ()
+    lag: Optional[Lag] = None
+
+
+STATE_SQL = """
+SELECT
+    quote_ident(psut.schemaname) || '.' || quote_ident(psut.relname) AS "name",
+    psr.srsubstate AS "state"
+FROM
+    pg_catalog.pg_subscription_rel AS psr
+    JOIN pg_catalog.pg_subscription AS ps ON (psr.srsubid = ps.oid)
+    JOIN pg_catalog.pg_stat_user_tables AS psut ON (psr.srrelid = psut.relid)
+WHERE
+    ps.subname = $1
+"""
+
+SLOT_SQL = """
+SELECT
+    *,
+    (pg_current_wal_lsn() - restart_lsn)::bigint AS retained_bytes,
+    age(xmin) AS xmin_age,
+    age(catalog_xmin) AS catalog_xmin_age
+FROM
+    pg_catalog.pg_replication_slots
+WHERE
+    slot_name = $1
+"""
+
+# Intervals are computed by the target, which avoids time zone handling
+# and skew between the clocks of the target and ivory.
+WORKERS_SQL = """
+SELECT
+    quote_ident(n.nspname) || '.' || quote_ident(c.relname) AS "relation",
+    s.received_lsn,
+    s.latest_end_lsn,
+    s.last_msg_receipt_time - s.last_msg_send_time AS "network_delay",
+    now() - s.last_msg_receipt_time AS "receipt_delta"
+FROM
+    pg_catalog.pg_stat_subscription AS s
+    LEFT JOIN pg_catalog.pg_class AS c ON (c.oid = s.relid)
+    LEFT JOIN pg_catalog.pg_namespace AS n ON (n.oid = c.relnamespace)
+WHERE
+    s.subname = $1
+    AND s.pid IS NOT NULL
+ORDER BY
+    s.relid NULLS FIRST
+"""
+
+POST_DATA_SQL = r"""
+SELECT
+    (
+        SELECT count(*)
+        FROM pg_catalog.pg_index AS i
+        JOIN pg_catalog.pg_class AS c ON (c.oid = i.indexrelid)
+        JOIN pg_catalog.pg_namespace AS n ON (n.oid = c.relnamespace)
+        WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+        AND n.nspname NOT LIKE 'pg\_toast%'
+    ),
+    (
+        SELECT count(*)
+        FROM pg_catalog.pg_constraint AS co
+        JOIN pg_catalog.pg_namespace AS n ON (n.oid = co.connamespace)
+        WHERE NOT co.convalidated
+        AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+    )
+"""
+
+# The walsender of each table synchronization worker reports the progress
+# of its `COPY ... TO STDOUT` on PostgreSQL 14 and later.
+COPY_PROGRESS_SQL = """
+SELECT
+    quote_ident(n.nspname) || '.' || quote_ident(c.relname),
+    p.tuples_processed,
+    c.reltuples::bigint
+FROM
+    pg_catalog.pg_stat_progress_copy AS p
+    JOIN pg_catalog.pg_class AS c ON (c.oid = p.relid)
+    JOIN pg_catalog.pg_namespace AS n ON (n.oid = c.relnamespace)
+WHERE
+    p.command = 'COPY TO'
+    AND p.datid = (
+        SELECT oid FROM pg_catalog.pg_database WHERE datname = current_database()
+    )
+"""
+
+# Sizes of relations, looked up for all relations in a single query.
+RELATION_SIZE_SQL = {
+    'total': "pg_total_relation_size(c.oid)",
+    'main': "pg_relation_size(c.oid)",
+    'relpages': "greatest(c.relpages, 0)::bigint * current_setting('block_size')::bigint",
+}
+
+
+async def relation_sizes(
+    connection: asyncpg.Connection, names: Sequence[str], method: str
+) -> Dict[str, int]:
+    """Return the size of the given relations, as determined by `method`.
+
+    See `RELATION_SIZE_SQL` for the available methods.
+    """
+
+    rows = await connection.fetch(
+        f"""
+        SELECT
+            name,
+            {RELATION_SIZE_SQL[method]}
+        FROM
+            unnest($1::text[]) AS name
+            JOIN pg_catalog.pg_class AS c ON (c.oid = name::regclass)
+        """,
+        list(names),
+    )
+    return {name: size for (name, size) in rows}
+
+
+async def collect(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    subscription_name: str,
+    estimate_sizes: bool = False,
+) -> Status:
+    """Take a snapshot of the replication status.
+
+    Queries are sent with the same text on every call, so connections
+    kept open between calls reuse their prepared statements.
+    """
+
+    collected_at = datetime.now(timezone.utc)
+    replication_stats = await source_db.fetchrow(
+        """
+        SELECT
+            *
+        FROM
+            pg_stat_replication
+        WHERE
+            application_name = $1
+            AND state IN ('catchup', 'streaming')
+        """,
+        constants.REPLICATION_APPLICATION_NAME,
+    )
+
+    (source_lsn,) = await source_db.fetchrow('SELECT pg_current_wal_lsn()')
+
+    last_reply_delta = None
+    if replication_stats is not None and 'reply_time' in replication_stats:
+        # "The `dt` argument is ignored." But if you don't pass it, it crashes.
+        reply_utcoffset = replication_stats['reply_time'].tzinfo.utcoffset(None)
+
+        # timezones and unicode
+        # horror
+        sane_reply_time = replication_stats['reply_time'] - reply_utcoffset
+        last_reply_delta = collected_at - sane_reply_time
+    elif replication_stats is not None:
+        last_reply_delta = replication_stats['replay_lag']
+
+    slot = await source_db.fetchrow(SLOT_SQL, subscription_name)
+
+    sync_slot = None
+    if slot is not None and not slot['active']:
+        # See src/backend/replication/logical/tablesync.c
+        # at 5832396432b1ce8349a0028b52295a9874014416:
+        # PostgreSQL creates a temporary slot to synchronize tables with.
+        sync_slot_row = await source_db.fetchrow(
+            "SELECT * FROM pg_replication_slots WHERE slot_name LIKE $1 || '%_sync_%'",
+            subscription_name,
+        )
+        if sync_slot_row is not None and sync_slot_row['active']:
+            sync_slot = sync_slot_row['slot_name']
+
+    states = await target_db.fetch(STATE_SQL, subscription_name)
+
+    copying = [name for (name, state) in states if state == b'd']
+    initializing = [name for (name, state) in states if state == b'i']
+
+    async def source_sizes_of_pending() -> Dict[str, int]:
+        sizes = {}
+        if copying:
+            sizes = await relation_sizes(
+                source_db, copying, 'relpages' if estimate_sizes else 'total'
+            )
+        # Relations not being copied yet only contribute to the ETA, so
+        # planner statistics are good enough and spare the source from
+        # sizing every partition.
+        if initializing:
+            sizes.update(await relation_sizes(source_db, initializing, 'relpages'))
+        return sizes
+
+    source_sizes: Dict[str, int] = {}
+    target_sizes: Dict[str, int] = {}
+    if copying:
+        (source_sizes, target_sizes) = await asyncio.gather(
+            source_sizes_of_pending(),
+            relation_sizes(target_db, copying, 'main' if estimate_sizes else 'total'),
+        )
+    elif initializing:
+        source_sizes = await source_sizes_of_pending()
+
+    copy_progress: Dict[str, Tuple[int, Optional[int]]] = {}
+    if copying and source_db.get_server_version().major >= 14:
+        for (name, copied_tuples, total_tuples) in await source_db.fetch(
+            COPY_PROGRESS_SQL
+        ):
+            # Relations never vacuumed or analyzed have no tuple estimate.
+            copy_progress[name] = (
+                copied_tuples,
+                total_tuples if total_tuples > 0 else None,
+            )
+
+    workers = tuple(
+        Worker(*row) for row in await target_db.fetch(WORKERS_SQL, subscription_name)
+    )
+
+    (source_indexes, source_unvalidated) = await source_db.fetchrow(POST_DATA_SQL)
+    (target_indexes, target_unvalidated) = await target_db.fetchrow(POST_DATA_SQL)
+
+    return Status(
+        collected_at=collected_at,
+        replication_state=(
+            replication_stats['state'] if replication_stats is not None else None
+        ),
+        last_reply_delta=last_reply_delta,
+        source_lsn=source_lsn,
+        flush_lsn=(
+            replication_stats['flush_lsn'] if replication_stats is not None else None
+        ),
+        slot_active=slot['active'] if slot is not None else None,
+        sync_slot=sync_slot,
+        relations=[
+            Relation(
+                name=name,
+                state=state,
+                source_size=source_sizes.get(name, 0),
+                target_size=target_sizes.get(name, 0),
+                copied_tuples=copy_progress.get(name, (None, None))[0],
+                total_tuples=copy_progress.get(name, (None, None))[1],
+            )
+            for (name, state) in states
+        ],
+        source_indexes=source_indexes,
+        target_indexes=target_indexes,
+        source_unvalidated=source_unvalidated,
+        target_unvalidated=target_unvalidated,
+        slot_usage=(
+            SlotUsage(
+                retained_bytes=slot['retained_bytes'],
+                wal_status=slot['wal_status'] if 'wal_status' in slot else None,
+                safe_wal_size=(
+                    slot['safe_wal_size'] if 'safe_wal_size' in slot else None
+                ),
+                xmin_age=slot['xmin_age'],
+                catalog_xmin_age=slot['catalog_xmin_age'],
+            )
+            if slot is not None
+            else None
+        ),
+        workers=workers,
+        lag=(
+            lag_breakdown(replication_stats, workers)
+            if replication_stats is not None
+            else None
+        ),
+    )
+
+
+def lag_breakdown(
+    replication_stats: Mapping[str, Any], workers: Sequence[Worker]
+) -> Lag:
+    """Break the lag of the given replication connection down.
+
+    Example:
+
+        >>> lag_breakdown(
+        ...     {'sent_lsn': 3000, 'flush_lsn': 1000, 'write_lag': timedelta(seconds=1),
+        ...      'replay_lag': timedelta(seconds=4)},
+        ...     [Worker(None, 2500, 2500, timedelta(seconds=0.5), timedelta(0))],
+        ... )  # doctest: +NORMALIZE_WHITESPACE
+        Lag(network_delay=datetime.timedelta(microseconds=500000), network_bytes=500,
+            apply_delay=datetime.timedelta(seconds=3), apply_bytes=1500)
+    """
+
+    apply_worker = next(
+        (
+            worker
+            for worker in workers
+            if worker.relation is None and worker.received_lsn is not None
+        ),
+        None,
+    )
+    received_lsn = apply_worker.received_lsn if apply_worker is not None else None
+    sent_lsn = replication_stats.get('sent_lsn')
+    flush_lsn = replication_stats.get('flush_lsn')
+    write_lag = replication_stats.get('write_lag')
+    replay_lag = replication_stats.get('replay_lag')
+
+    return Lag(
+        network_delay=apply_worker.network_delay if apply_worker is not None else None,
+        network_bytes=(
+            max(0, sent_lsn - received_lsn)
+            if sent_lsn is not None and received_lsn is not None
+            else None
+        ),
+        apply_delay=(
+            max(timedelta(0), replay_lag - write_lag)
+            if write_lag is not None and replay_lag is not None
+            else None
+        ),
+        apply_bytes=(
+            max(0, received_lsn - flush_lsn)
+            if received_lsn is not None and flush_lsn is not None
+            else None
+        ),
+    )
+
+
+def progress(relation: Relation) -> float:
+    """Return the copy progress of the given relation in percent.
+
+    Tuples copied according to `pg_stat_progress_copy` are preferred over
+    comparing relation sizes, which includes indexes and bloat.
+
+    Example:
+
+        >>> progress(Relation('foo', b'd', source_size=200, target_size=50))
+        25.0
+        >>> progress(Relation('foo', b'd', 200, 50, copied_tuples=10, total_tuples=100))
+        10.0
+    """
+
+    if relation.copied_tuples is not None and relation.total_tuples:
+        return min(100.0, relation.copied_tuples / relation.total_tuples * 100)
+
+    # There was at least one instance of an edge case spotted here where
+    # the source size was zero. In that case, let's just make up the fact
+    # that we're at 0% for now.
+    if not relation.source_size:
+        return 0.0
+    return min(100.0, relation.target_size / relation.source_size * 100)
+
+
+def remaining_size(relation: Relation) -> float:
+    """Return the bytes of the given relation left to copy."""
+
+    if relation.state == b'i':
+        return float(relation.source_size)
+    return relation.source_size * (100 - progress(relation)) / 100
+
+
+def copy_rates(previous: Status, current: Status) -> Dict[str, Rate]:
+    """Determine the copy rates of relations being copied in both snapshots.
+
+    Example:
+
+        >>> start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        >>> def snapshot(seconds, target_size):
+        ...     return Status(
+        ...         start + timedelta(seconds=seconds), None, None, 0, None,
+        ...         None, None, [Relation('a', b'd', 1000, target_size)], 0, 0, 0, 0,
+        ...     )
+        >>> copy_rates(snapshot(0, 100), snapshot(10, 300))
+        ... # doctest: +NORMALIZE_WHITESPACE
+        {'a': Rate(bytes_per_second=20.0, tuples_per_second=None,
+                   eta=datetime.timedelta(seconds=35))}
+    """
+
+    elapsed = (current.collected_at - previous.collected_at).total_seconds()
+    if elapsed <= 0:
+        return {}
+
+    before = {relation.name: relation for relation in previous.relations}
+    rates = {}
+
+    for relation in current.relations:
+        earlier = before.get(relation.name)
+        if relation.state != b'd' or earlier is None or earlier.state != b'd':
+            continue
+
+        bytes_per_second = max(
+            0.0, (remaining_size(earlier) - remaining_size(relation)) / elapsed
+        )
+        tuples_per_second = None
+        if relation.copied_tuples is not None and earlier.copied_tuples is not None:
+            tuples_per_second = max(
+                0.0, (relation.copied_tuples - earlier.copied_tuples) / elapsed
+            )
+
+        eta = None
+        if bytes_per_second:
+            eta = timedelta(seconds=round(remaining_size(relation) / bytes_per_second))
+
+        rates[relation.name] = Rate(
+            bytes_per_second=bytes_per_second,
+            tuples_per_second=tuples_per_second,
+            eta=eta,
+        )
+
+    return rates
+
+
+def total_rate(result: Status, rates: Dict[str, Rate]) -> Rate:
+    """Sum up the given copy rates, with an ETA for the whole initial sync.
+
+    Relations waiting to be copied are assumed to be copied at the same
+    total rate.
+    """
+
+    bytes_per_second = sum(rate.bytes_per_second for rate in rates.values())
+    tuple_rates = [
+        rate.tuples_per_second
+        for rate in rates.values()
+        if rate.tuples_per_second is not None
+    ]
+    remaining = sum(
+        remaining_size(relation)
+        for relation in result.relations
+        if relation.state in (b'i', b'd')
+    )
+    return Rate(
+        bytes_per_second=bytes_per_second,
+        tuples_per_second=sum(tuple_rates) if tuple_rates else None,
+        eta=(
+            timedelta(seconds=round(remaining / bytes_per_second))
+            if bytes_per_second
+            else None
+        ),
+    )
+
+
+def describe_rate(rate: Rate) -> str:
+    """Describe the given rate for humans.
+
+    Example:
+
+        >>> describe_rate(Rate(2048.0, 10.0, timedelta(seconds=90)))
+        '2 kB/s, 10 tuples/s, ETA 0:01:30'
+    """
+
+    parts = [f'{helpers.format_size(rate.bytes_per_second)}/s']
+    if rate.tuples_per_second is not None:
+        parts.append(f'{rate.tuples_per_second:.0f} tuples/s')
+    parts.append(f'ETA {rate.eta}' if rate.eta is not None else 'ETA unknown')
+    return ', '.join(parts)
+
+
+def format_delay(value: Optional[timedelta]) -> str:
+    """Format a delay for humans.
+
+    Example:
+
+        >>> format_delay(timedelta(milliseconds=1500)), format_delay(None)
+        ('1.5s', 'unknown')
+    """
+
+    if value is None:
+        return 'unknown'
+    return f'{value.total_seconds():.1f}s'
+
+
+def describe_lag(lag: Lag) -> str:
+    """Describe the given lag breakdown for humans.
+
+    Example:
+
+        >>> describe_lag(Lag(timedelta(seconds=0.2), 0, timedelta(seconds=3), 4096))
+        'network 0.2s, 0 bytes in transit; apply 3.0s, 4 kB received; mostly apply'
+    """
+
+    def size(value: Optional[int]) -> str:
+        return helpers.format_size(value) if value is not None else 'unknown'
+
+    text = (
+        f"network {format_delay(lag.network_delay)}, "
+        f"{size(lag.network_bytes)} in transit; "
+        f"apply {format_delay(lag.apply_delay)}, {size(lag.apply_bytes)} received"
+    )
+
+    # Times are compared if known, as byte counts fluctuate with each message.
+    if lag.network_delay is not None and lag.apply_delay is not None:
+        network_worse = lag.network_delay > lag.apply_delay
+    elif lag.network_bytes is not None and lag.apply_bytes is not None:
+        network_worse = lag.network_bytes > lag.apply_bytes
+    else:
+        return text
+    return text + ('; mostly network' if network_worse else '; mostly apply')
+
+
+def post_data_pending(result: Status) -> bool:
+    return (
+        result.target_indexes < result.source_indexes
+        or result.target_unvalidated > result.source_unvalidated
+    )
+
+
+def report(
+    result: Status,
+    subscription_name: str,
+    collapse_initializing_relations: bool,
+    rates: Optional[Dict[str, Rate]] = None,
+    max_retained_wal: Optional[int] = None,
+    max_xmin_age: Optional[int] = None,
+) -> int:
+    """Log the given status and return the exit code for it.
+
+    `rates` are the copy rates of relations, see `copy_rates`. Exceeding
+    `max_retained_wal` bytes or `max_xmin_age` transactions fails the
+    status, see `report_slot_usage`.
+    """
+
+    rc = 0
+
+    if result.replication_state is None:
+        log.error("No active replication found.")
+        return 1
+
+    if result.last_reply_delta is None:
+        log.info("No replay lag detected.")
+    elif result.last_reply_delta > timedelta(minutes=5):
+        log.error(
+            "Last reply from standby received more than 5 minutes ago: %r.",
+            result.last_reply_delta,
+        )
+        rc = 1
+    else:
+        log.info(
+            "Last reply from standby received %d seconds ago.",
+            result.last_reply_delta.total_seconds(),
+        )
+
+    if result.source_lsn == result.flush_lsn:
+        log.info("LSN matches.")
+    else:
+        assert result.flush_lsn is not None
+        log.warning(
+            "Source is at LSN %x, standby at %x (diff %s).",
+            result.source_lsn,
+            result.flush_lsn,
+            result.source_lsn - result.flush_lsn,
+        )
+
+    if result.lag is not None:
+        log.info("Lag breakdown: %s.", describe_lag(result.lag))
+    for worker in result.workers:
+        if worker.relation is not None and worker.network_delay is not None:
+            log.info(
+                "Synchronization worker for %r received its last message after %s.",
+                worker.relation,
+                format_delay(worker.network_delay),
+            )
+
+    if result.slot_active is None:
+        log.error("Missing replication slot with name %r.", subscription_name)
+        rc = 1
+    elif not result.slot_active:
+        if result.sync_slot is not None:
+            log.warning(
+                "Replication slot %r is not active, but active sync slot %r was found.",
+                subscription_name,
+                result.sync_slot,
+            )
+        else:
+            log.error("Replication slot %r is not active.", subscription_name)
+            rc = 1
+    else:
+        log.info("Replication slot is active.")
+
+    if result.slot_usage is not None:
+        rc = max(
+            rc,
+            report_slot_usage(
+                result.slot_usage,
+                max_retained_wal=max_retained_wal,
+                max_xmin_age=max_xmin_age,
+            ),
+        )
+
+    initializing_relations = []
+
+    for relation in result.relations:
+        if relation.state == b'd':
+            # If we're on the initial sync, display how far in.
+            log.error(
+                "Relation %r is being copied over: %s / %s (%.2f %%)%s.",
+                relation.name,
+                helpers.format_size(relation.target_size),
+                helpers.format_size(relation.source_size),
+                progress(relation),
+                f', {describe_rate(rates[relation.name])}'
+                if rates and relation.name in rates
+                else '',
+            )
+            rc = 1
+
+        elif relation.state == b'i' and collapse_initializing_relations:
+            initializing_relations.append(relation.name)
+            rc = 1
+
+        elif relation.state != b'r':
+            log.error(
+                "Relation %r is not ready: %s (srsubstate=%r).",
+                relation.name,
+                substate_to_human(relation.state),
+                relation.state.decode(),
+            )
+            rc = 1
+
+    if initializing_relations:
+        log.error("%d relations are still initializing.", len(initializing_relations))
+
+    if rates:
+        log.info(
+            "Initial synchronization copies %s.",
+            describe_rate(total_rate(result, rates)),
+        )
+
+    if post_data_pending(result):
+        # See `ivory copyschema --defer-post-data`.
+        log.warning(
+            "Post-data phase pending: %d of %d indexes exist on target, "
+            "%d constraints await validation. Run `ivory copyschema "
+            "--apply-post-data` once all relations are ready.",
+            result.target_indexes,
+            result.source_indexes,
+            max(0, result.target_unvalidated - result.source_unvalidated),
+        )
+    return rc
+
+
+def report_slot_usage(
+    usage: SlotUsage,
+    max_retained_wal: Optional[int] = None,
+    max_xmin_age: Optional[int] = None,
+) -> int:
+    """Log what the replication slot holds back on the source.
+
+    Retained WAL fills the disk of the source, while the xmin horizon of
+    the slot keeps vacuum from removing dead catalog rows. A slot whose
+    WAL was removed is lost for good.
+    """
+
+    rc = 0
+
+    if usage.retained_bytes is not None:
+        log.info(
+            "Replication slot retains %s of WAL%s.",
+            helpers.format_size(usage.retained_bytes),
+            f' ({usage.wal_status})' if usage.wal_status is not None else '',
+        )
+        if max_retained_wal is not None and usage.retained_bytes > max_retained_wal:
+            log.error(
+                "Replication slot retains more WAL than %s.",
+                helpers.format_size(max_retained_wal),
+            )
+            rc = 1
+
+    if usage.wal_status == 'lost':
+        log.error("Replication slot lost required WAL, replication must be recreated.")
+        rc = 1
+    elif usage.wal_status == 'unreserved':
+        log.warning(
+            "Replication slot exceeds max_slot_wal_keep_size, "
+            "its WAL will be removed at the next checkpoint."
+        )
+    elif usage.safe_wal_size is not None:
+        log.info(
+            "Replication slot can fall %s further behind before losing WAL.",
+            helpers.format_size(usage.safe_wal_size),
+        )
+
+    for (kind, age) in (
+        ('xmin', usage.xmin_age),
+        ('catalog xmin', usage.catalog_xmin_age),
+    ):
+        if age is None:
+            continue
+        log.info("Replication slot %s is %d transactions old.", kind, age)
+        if max_xmin_age is not None and age > max_xmin_age:
+            log.error(
+                "Replication slot %s is older than %d transactions and holds back vacuum.",
+                kind,
+                max_xmin_age,
+            )
+            rc = 1
+
+    return rc
+
+
+STATE_LABELS = {
+    b'i': 'initializing',
+    b'd': 'copying',
+    b'f': 'copied',
+    b's': 'synchronized',
+    b'r': 'ready',
+}
+
+
+def render(
+    result: Status,
+    subscription_name: str,
+    rates: Optional[Dict[str, Rate]] = None,
+) -> str:
+    """Render the given status as a compact, multi-line view.
+
+    Example:
+
+        >>> print(render(Status(
+        ...     collected_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        ...     replication_state='streaming',
+        ...     last_reply_delta=timedelta(seconds=1),
+        ...     source_lsn=2048,
+        ...     flush_lsn=1024,
+        ...     slot_active=True,
+        ...     sync_slot=None,
+        ...     relations=[
+        ...         Relation('public.a', b'r'),
+        ...         Relation('public.b', b'd', source_size=4096, target_size=1024),
+        ...     ],
+        ...     source_indexes=2,
+        ...     target_indexes=2,
+        ...     source_unvalidated=0,
+        ...     target_unvalidated=0,
+        ... ), 'ivory_subscription'))
+        ivory replication status at 2024-01-01 00:00:00 UTC
+        replication: streaming, last reply 1.0s ago, 1 kB behind
+        slot ivory_subscription: active
+        relations: 1 ready, 1 copying
+          public.b: 1 kB / 4 kB (25.0 %)
+    """
+
+    lines = [f"ivory replication status at {result.collected_at:%Y-%m-%d %H:%M:%S %Z}"]
+
+    if result.replication_state is None:
+        lines.append("replication: not active")
+    else:
+        reply = (
+            f"last reply {result.last_reply_delta.total_seconds():.1f}s ago"
+            if result.last_reply_delta is not None
+            else "no replay lag"
+        )
+        behind = helpers.format_size(result.source_lsn - (result.flush_lsn or 0))
+        lines.append(
+            f"replication: {result.replication_state}, {reply}, {behind} behind"
+        )
+        if result.lag is not None:
+            lines.append(f"lag: {describe_lag(result.lag)}")
+
+    if result.slot_active is None:
+        slot = "missing"
+    elif result.slot_active:
+        slot = "active"
+    elif result.sync_slot is not None:
+        slot = f"inactive, sync slot {result.sync_slot} active"
+    else:
+        slot = "inactive"
+    usage = result.slot_usage
+    if usage is not None and usage.retained_bytes is not None:
+        slot += f", retains {helpers.format_size(usage.retained_bytes)} WAL"
+        if usage.wal_status is not None:
+            slot += f" ({usage.wal_status})"
+    if usage is not None and usage.catalog_xmin_age is not None:
+        slot += f", catalog xmin age {usage.catalog_xmin_age}"
+    lines.append(f"slot {subscription_name}: {slot}")
+
+    counts: Dict[str, int] = {}
+    for relation in result.relations:
+        label = STATE_LABELS.get(relation.state, relation.state.decode())
+        counts[label] = counts.get(label, 0) + 1
+    lines.append(
+        "relations: "
+        + (', '.join(f'{count} {label}' for label, count in counts.items()) or 'none')
+    )
+    for relation in result.relations:
+        if relation.state == b'd':
+            rate = (rates or {}).get(relation.name)
+            lines.append(
+                f"  {relation.name}: {helpers.format_size(relation.target_size)} / "
+                f"{helpers.format_size(relation.source_size)} "
+                f"({progress(relation):.1f} %)"
+                + (f", {describe_rate(rate)}" if rate is not None else '')
+            )
+    if rates:
+        lines.append(f"initial sync: {describe_rate(total_rate(result, rates))}")
+
+    if post_data_pending(result):
+        lines.append(
+            f"post-data: {result.target_indexes} of {result.source_indexes} "
+            "indexes on target, "
+            f"{max(0, result.target_unvalidated - result.source_unvalidated)} "
+            "constraints to validate"
+        )
+
+    return '\n'.join(lines)
+
+
+def substate_to_human(value: bytes) -> str:
+    """Convert PostgreSQL `srsubstate` to a human-readable value.
+
+    Example:
+
+        >>> substate_to_human(b'd')
+        'data is being copied'
+        >>> substate_to_human(b'x')  # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+            ...
+        ValueError: unknown value: b'x'
+    """
+
+    mapping = {
+        b'i': 'initializing',
+        b'd': 'data is being copied',
+        b'f': 'finished table copy',
+        b's': 'synchronized',
+        b'r': 'ready (normal replication)',
+    }
+    if value in mapping:
+        return mapping[value]
+    raise ValueError(f"unknown value: {value!r}")
@@ -1,6 +1,7 @@
 import argparse
 import os
 import shlex
+from typing import List
 
 import asyncpg  # type: ignore
 import pytest  # type: ignore
@@ -10,6 +11,9 @@ from ivory.commands import copyschema
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize('database', ('copyschema_testdb',))
+@pytest.mark.parametrize(
+    'options', ([], ['--jobs', '2'], ['--stream', '--batch-size', '2'])
+)
 @pytest.mark.skipif(
     os.getenv('CI') == 'true', reason="pg_dump complains about major version mismatch"
 )
@@ -18,6 +22,7 @@ async def test_run_reports_rc_0(
     target_db: asyncpg.Connection,
     cli_parser: argparse.ArgumentParser,
     database: str,
+    options: List[str],
 ) -> None:
     try:
         await source_db.execute(f"CREATE DATABASE {shlex.quote(database)}")
@@ -27,10 +32,232 @@ async def test_run_reports_rc_0(
             f"GRANT CONNECT ON DATABASE {shlex.quote(database)} TO current_user"
         )
         args = cli_parser.parse_args(
-            ["--source-dbname", database, "--target-dbname", database, 'copyschema']
+            [
+                "--source-dbname",
+                database,
+                "--target-dbname",
+                database,
+                'copyschema',
+                *options,
+            ]
         )
         rc = await copyschema.run(args)
         assert rc == 0
     finally:
         await source_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
         await target_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('database', ('copyschema_deferred_testdb',))
+@pytest.mark.skipif(
+    os.getenv('CI') == 'true', reason="pg_dump complains about major version mismatch"
+)
+async def test_deferred_post_data(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+    database: str,
+) -> None:
+    base_params = ["--source-dbname", database, "--target-dbname", database]
+    try:
+        await source_db.execute(f"CREATE DATABASE {shlex.quote(database)}")
+        source = await asyncpg.connect(
+            host=os.getenv('SOURCE_HOST'),
+            port=os.getenv('SOURCE_PORT'),
+            user=os.getenv('SOURCE_USER'),
+            password=os.getenv('SOURCE_PASSWORD'),
+            database=database,
+        )
+        await source.execute(
+            """
+            CREATE TABLE parent (id INT PRIMARY KEY);
+            CREATE TABLE child (id INT PRIMARY KEY, parent_id INT REFERENCES parent);
+            CREATE INDEX child_parent_id_idx ON child (parent_id);
+            ALTER TABLE child ADD CONSTRAINT child_parent_id_key UNIQUE (parent_id);
+            CREATE TABLE event (id INT, parent_id INT REFERENCES parent)
+                PARTITION BY RANGE (id);
+            CREATE TABLE event_1 PARTITION OF event FOR VALUES FROM (0) TO (100);
+            """
+        )
+        await source.close()
+
+        args = cli_parser.parse_args(base_params + ['copyschema', '--defer-post-data'])
+        assert await copyschema.run(args) == 0
+
+        target = await asyncpg.connect(
+            host=os.getenv('TARGET_HOST'),
+            port=os.getenv('TARGET_PORT'),
+            user=os.getenv('TARGET_USER'),
+            password=os.getenv('TARGET_PASSWORD'),
+            database=database,
+        )
+        try:
+            (index,) = await target.fetchrow(
+                "SELECT to_regclass('child_parent_id_idx')"
+            )
+            assert index is None
+            (primary_key,) = await target.fetchrow("SELECT to_regclass('child_pkey')")
+            assert primary_key is not None
+
+            args = cli_parser.parse_args(
+                base_params + ['copyschema', '--apply-post-data']
+            )
+            assert await copyschema.run(args) == 0
+
+            (index,) = await target.fetchrow(
+                "SELECT to_regclass('child_parent_id_idx')"
+            )
+            assert index is not None
+            (unique_key,) = await target.fetchrow(
+                """
+                SELECT count(*)
+                FROM pg_constraint AS c JOIN pg_index AS i ON (i.indexrelid = c.conindid)
+                WHERE c.conname = 'child_parent_id_key' AND i.indisvalid
+                """
+            )
+            assert unique_key == 1
+            (unvalidated,) = await target.fetchrow(
+                """
+                SELECT count(*) FROM pg_constraint
+                WHERE contype = 'f' AND conparentid = 0 AND NOT convalidated
+                """
+            )
+            assert unvalidated == 0
+        finally:
+            await target.close()
+    finally:
+        await source_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
+        await target_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('database', ('copyschema_incremental_testdb',))
+@pytest.mark.skipif(
+    os.getenv('CI') == 'true', reason="pg_dump complains about major version mismatch"
+)
+async def test_incremental(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+    database: str,
+) -> None:
+    base_params = ["--source-dbname", database, "--target-dbname", database]
+    try:
+        await source_db.execute(f"CREATE DATABASE {shlex.quote(database)}")
+        source = await asyncpg.connect(
+            host=os.getenv('SOURCE_HOST'),
+            port=os.getenv('SOURCE_PORT'),
+            user=os.getenv('SOURCE_USER'),
+            password=os.getenv('SOURCE_PASSWORD'),
+            database=database,
+        )
+        try:
+            await source.execute("CREATE TABLE foo (id INT PRIMARY KEY)")
+
+            args = cli_parser.parse_args(base_params + ['copyschema'])
+            assert await copyschema.run(args) == 0
+
+            await source.execute(
+                """
+                ALTER TABLE foo ADD COLUMN note TEXT NOT NULL DEFAULT 'none';
+                ALTER TABLE foo ADD COLUMN serial BIGINT GENERATED ALWAYS AS IDENTITY;
+                CREATE INDEX foo_note_idx ON foo (note);
+                CREATE TABLE bar (id SERIAL PRIMARY KEY);
+                """
+            )
+        finally:
+            await source.close()
+
+        target = await asyncpg.connect(
+            host=os.getenv('TARGET_HOST'),
+            port=os.getenv('TARGET_PORT'),
+            user=os.getenv('TARGET_USER'),
+            password=os.getenv('TARGET_PASSWORD'),
+            database=database,
+        )
+        try:
+            await target.execute("INSERT INTO foo VALUES (1)")
+
+            args = cli_parser.parse_args(base_params + ['copyschema', '--incremental'])
+            assert await copyschema.run(args) == 0
+
+            (note,) = await target.fetchrow("SELECT note FROM foo WHERE id = 1")
+            assert note == 'none'
+            (serial, identity) = await target.fetchrow(
+                """
+                SELECT f.serial, a.attidentity
+                FROM foo AS f, pg_attribute AS a
+                WHERE f.id = 1 AND a.attrelid = 'foo'::regclass AND a.attname = 'serial'
+                """
+            )
+            assert (serial, identity) == (1, b'a')
+            (index,) = await target.fetchrow("SELECT to_regclass('foo_note_idx')")
+            assert index is not None
+            (next_id,) = await target.fetchrow(
+                "INSERT INTO bar DEFAULT VALUES RETURNING id"
+            )
+            assert next_id == 1
+
+            # Running again finds nothing left to do.
+            assert await copyschema.run(args) == 0
+        finally:
+            await target.close()
+    finally:
+        await source_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
+        await target_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'options',
+    (
+        ['--dry-run'],
+        ['--incremental', '--stream'],
+        ['--incremental', '--jobs', '2'],
+        ['--incremental', '--defer-post-data'],
+    ),
+)
+async def test_rejects_unsupported_options(
+    cli_parser: argparse.ArgumentParser, options: List[str]
+) -> None:
+    args = cli_parser.parse_args(['copyschema', *options])
+    assert await copyschema.run(args) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('database', ('copyschema_fanout_testdb',))
+@pytest.mark.parametrize('jobs', ('1', '2'))
+@pytest.mark.skipif(
+    os.getenv('CI') == 'true', reason="pg_dump complains about major version mismatch"
+)
+async def test_additional_targets(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+    database: str,
+    jobs: str,
+) -> None:
+    additional = [f'{database}_{i}' for i in range(2)]
+    try:
+        await source_db.execute(f"CREATE DATABASE {shlex.quote(database)}")
+        args = cli_parser.parse_args(
+            ["--source-dbname", database, "--target-dbname", database]
+            + ['copyschema', '--jobs', jobs, '--max-parallel-targets', '2']
+            + [
+                option
+                for name in additional
+                for option in ('--additional-target', f'postgresql:///{name}')
+            ]
+        )
+        assert await copyschema.run(args) == 0
+
+        (created,) = await target_db.fetchrow(
+            "SELECT count(*) FROM pg_database WHERE datname = ANY($1::text[])",
+            [database, *additional],
+        )
+        assert created == 3
+    finally:
+        await source_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(database)}")
+        for name in [database, *additional]:
+            await target_db.execute(f"DROP DATABASE IF EXISTS {shlex.quote(name)}")
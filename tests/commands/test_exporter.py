@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+from typing import Any, List, Tuple
+from unittest.mock import AsyncMock, MagicMock
+
+import asyncpg  # type: ignore
+import pytest  # type: ignore
+
+from ivory import db
+from ivory import metrics
+from ivory import status
+from ivory.commands import exporter
+
+
+@pytest.fixture
+def connections(monkeypatch: pytest.MonkeyPatch) -> Tuple[MagicMock, MagicMock]:
+    source_db = MagicMock(spec=asyncpg.Connection)
+    target_db = MagicMock(spec=asyncpg.Connection)
+    monkeypatch.setattr(db, 'connect', AsyncMock(return_value=(source_db, target_db)))
+    monkeypatch.setattr(status, 'copy_rates', MagicMock(return_value=None))
+    monkeypatch.setattr(
+        metrics,
+        'status_metrics',
+        MagicMock(
+            return_value=[metrics.Metric('ivory_test', "A test metric.", [({}, 1)])]
+        ),
+    )
+    return (source_db, target_db)
+
+
+@pytest.mark.asyncio
+async def test_collector_caches_metrics(
+    cli_parser: argparse.ArgumentParser,
+    connections: Tuple[MagicMock, MagicMock],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    collect = AsyncMock()
+    monkeypatch.setattr(status, 'collect', collect)
+
+    collector = exporter.Collector(
+        cli_parser.parse_args(['exporter', '--cache-seconds', '60'])
+    )
+    texts = await asyncio.gather(*(collector.get() for _ in range(3)))
+    assert texts[0] == texts[1] == texts[2]
+    assert 'ivory_up 1\n' in texts[0]
+    assert 'ivory_test 1\n' in texts[0]
+    collect.assert_awaited_once()
+
+    collector = exporter.Collector(
+        cli_parser.parse_args(['exporter', '--cache-seconds', '0'])
+    )
+    await collector.get()
+    await collector.get()
+    assert collect.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_collector_gives_up_on_hanging_collection(
+    cli_parser: argparse.ArgumentParser,
+    connections: Tuple[MagicMock, MagicMock],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def hang(*args: Any, **kwargs: Any) -> None:
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(status, 'collect', hang)
+
+    collector = exporter.Collector(
+        cli_parser.parse_args(['exporter', '--collect-timeout', '0.1'])
+    )
+    text = await asyncio.wait_for(collector.get(), timeout=5)
+    assert 'ivory_up 0\n' in text
+    for connection in connections:
+        connection.terminate.assert_called_once()
+
+
+async def request(port: int, request_line: bytes) -> List[bytes]:
+    (reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request_line + b'\r\nHost: localhost\r\n\r\n')
+    response = await reader.read()
+    writer.close()
+    return response.split(b'\r\n')
+
+
+@pytest.mark.asyncio
+async def test_handle_serves_metrics(
+    cli_parser: argparse.ArgumentParser,
+    connections: Tuple[MagicMock, MagicMock],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(status, 'collect', AsyncMock())
+    collector = exporter.Collector(cli_parser.parse_args(['exporter']))
+
+    server = await asyncio.start_server(
+        lambda reader, writer: exporter.handle(collector, reader, writer),
+        host='127.0.0.1',
+        port=0,
+    )
+    async with server:
+        (_, port) = server.sockets[0].getsockname()
+
+        response = await request(port, b'GET /metrics HTTP/1.1')
+        assert response[0] == b'HTTP/1.0 200 OK'
+        assert f'Content-Type: {exporter.CONTENT_TYPE}'.encode() in response
+        assert response[-1].endswith(b'# EOF\n')
+        assert b'ivory_up 1\n' in response[-1]
+
+        response = await request(port, b'HEAD /metrics?format=openmetrics HTTP/1.1')
+        assert response[0] == b'HTTP/1.0 200 OK'
+        assert response[-1] == b''
+
+        response = await request(port, b'GET / HTTP/1.1')
+        assert response[0] == b'HTTP/1.0 404 Not Found'
+
+        response = await request(port, b'POST /metrics HTTP/1.1')
+        assert response[0] == b'HTTP/1.0 404 Not Found'
+
+
+@pytest.mark.asyncio
+async def test_run_ends_on_interrupt(
+    cli_parser: argparse.ArgumentParser,
+    connections: Tuple[MagicMock, MagicMock],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(status, 'collect', AsyncMock())
+    monkeypatch.setattr(exporter, 'handle', AsyncMock())
+
+    task = asyncio.ensure_future(
+        exporter.run(cli_parser.parse_args(['exporter', '--port', '0']))
+    )
+    await asyncio.sleep(0.1)
+    task.cancel()
+    assert await task == 0
@@ -2,11 +2,14 @@ import argparse
 import contextlib
 import os
 import shlex
+from pathlib import Path
 
 import asyncpg  # type: ignore
 import pytest  # type: ignore
 
+from ivory.commands import exporter
 from ivory.commands.replication import create
+from ivory.commands.replication import plan
 from ivory.commands.replication import start
 from ivory.commands.replication import status
 from ivory.commands.replication import stop
@@ -24,6 +27,7 @@ async def test_full_lifecycle(
     target_db: asyncpg.Connection,
     cli_parser: argparse.ArgumentParser,
     database: str,
+    tmp_path: Path,
 ) -> None:
 
     base_params = ['--source-dbname', database, '--target-dbname', database]
@@ -31,6 +35,11 @@ async def test_full_lifecycle(
         await source_db.execute(f"CREATE DATABASE {shlex.quote(database)}")
         await target_db.execute(f"CREATE DATABASE {shlex.quote(database)}")
 
+        args = cli_parser.parse_args(
+            base_params + ['replication', 'plan', '--wal-sample-pause', '0.1']
+        )
+        assert await plan.run(args) == 0
+
         args = cli_parser.parse_args(base_params + ['replication', 'create'])
         assert await create.run(args) == 0
         assert await create.run(args) == 0  # idempotence
@@ -54,8 +63,26 @@ async def test_full_lifecycle(
             base_params + ['replication', 'start', '--fail-on-already-started']
         )
         assert await start.run(args) == 1
+
+        args = cli_parser.parse_args(
+            base_params + ['replication', 'status', '--no-history']
+        )
         assert await status.run(args) == 0
 
+        args = cli_parser.parse_args(
+            base_params
+            + ['replication', 'status', '--history-file', str(tmp_path / 'history')]
+        )
+        assert await status.run(args) == 0
+        assert await status.run(args) == 0  # with a trend
+
+        textfile = tmp_path / 'ivory.prom'
+        args = cli_parser.parse_args(
+            base_params + ['exporter', '--textfile', str(textfile)]
+        )
+        assert await exporter.run(args) == 0
+        assert 'ivory_replication_active' in textfile.read_text()
+
         args = cli_parser.parse_args(base_params + ['replication', 'stop'])
         assert await stop.run(args) == 0
         assert await stop.run(args) == 0  # idempotence
@@ -0,0 +1,33 @@
+import argparse
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import asyncpg  # type: ignore
+import pytest  # type: ignore
+
+from ivory import status
+from ivory.commands.replication import status as status_command
+
+
+@pytest.mark.asyncio
+async def test_watch_ends_on_interrupt(
+    cli_parser: argparse.ArgumentParser,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    monkeypatch.setattr(status, 'collect', AsyncMock())
+    monkeypatch.setattr(status, 'render', MagicMock(return_value='view'))
+    source_db = MagicMock(spec=asyncpg.Connection)
+    target_db = MagicMock(spec=asyncpg.Connection)
+
+    args = cli_parser.parse_args(
+        ['replication', 'status', '--watch', '60', '--no-history']
+    )
+    task = asyncio.ensure_future(status_command.watch(source_db, target_db, args))
+    await asyncio.sleep(0.1)
+    task.cancel()
+
+    assert await task == 0
+    assert 'view' in capsys.readouterr().out
+    source_db.close.assert_awaited_once()
+    target_db.close.assert_awaited_once()
@@ -69,3 +69,116 @@ async def test_sequence_synchronization_with_offsets(
     finally:
         await source_db.execute("DROP SEQUENCE IF EXISTS testseq")
         await target_db.execute("DROP SEQUENCE IF EXISTS testseq")
+
+
+@pytest.mark.asyncio
+async def test_sequence_synchronization_skips_sequences_ahead(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    try:
+        await source_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await target_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await target_db.execute("SELECT setval('testseq', 1000)")
+
+        args = cli_parser.parse_args(['syncsequences', '--equal'])
+        rc = await syncsequences.run(args)
+        assert rc == 0
+
+        (target_value,) = await target_db.fetchrow("SELECT nextval('testseq')")
+        assert target_value == 1001
+    finally:
+        await source_db.execute("DROP SEQUENCE IF EXISTS testseq")
+        await target_db.execute("DROP SEQUENCE IF EXISTS testseq")
+
+
+@pytest.mark.asyncio
+async def test_sequence_synchronization_skips_uncalled_sequences_ahead(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    try:
+        await source_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await target_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        # As left behind by a previous `--equal` run.
+        await target_db.execute("SELECT setval('testseq', 1000, false)")
+
+        for flags in (['--equal'], ['--non-consuming', '--samples', '2']):
+            args = cli_parser.parse_args(
+                ['syncsequences', '--sample-window', '0.1', *flags]
+            )
+            rc = await syncsequences.run(args)
+            assert rc == 0
+
+        (target_value,) = await target_db.fetchrow("SELECT nextval('testseq')")
+        assert target_value == 1000
+    finally:
+        await source_db.execute("DROP SEQUENCE IF EXISTS testseq")
+        await target_db.execute("DROP SEQUENCE IF EXISTS testseq")
+
+
+@pytest.mark.asyncio
+async def test_sequence_synchronization_non_consuming(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    try:
+        await source_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await target_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await source_db.execute("SELECT setval('testseq', 50)")
+
+        args = cli_parser.parse_args(
+            [
+                'syncsequences',
+                '--non-consuming',
+                '--samples',
+                '2',
+                '--sample-window',
+                '0.1',
+                '--fixed-offset',
+                '10',
+            ]
+        )
+        rc = await syncsequences.run(args)
+        assert rc == 0
+
+        (source_value,) = await source_db.fetchrow("SELECT last_value FROM testseq")
+        assert source_value == 50
+        (target_value,) = await target_db.fetchrow("SELECT nextval('testseq')")
+        assert target_value == 61
+    finally:
+        await source_db.execute("DROP SEQUENCE IF EXISTS testseq")
+        await target_db.execute("DROP SEQUENCE IF EXISTS testseq")
+
+
+@pytest.mark.asyncio
+async def test_sequence_synchronization_follow(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    try:
+        await source_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await target_db.execute("CREATE SEQUENCE IF NOT EXISTS testseq")
+        await source_db.execute("SELECT setval('testseq', 50)")
+
+        args = cli_parser.parse_args(
+            ['syncsequences', '--follow', '0.1', '--fixed-offset', '0']
+        )
+
+        task = asyncio.ensure_future(syncsequences.run(args))
+        await asyncio.sleep(0.3)
+        await source_db.execute("SELECT setval('testseq', 80)")
+        await asyncio.sleep(0.3)
+        # Interrupting `--follow` ends it successfully.
+        task.cancel()
+        assert await task == 0
+
+        (target_value,) = await target_db.fetchrow("SELECT last_value FROM testseq")
+        assert target_value >= 80
+    finally:
+        await source_db.execute("DROP SEQUENCE IF EXISTS testseq")
+        await target_db.execute("DROP SEQUENCE IF EXISTS testseq")
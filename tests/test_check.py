@@ -1,4 +1,6 @@
 import argparse
+import asyncio
+import contextlib
 import os
 from unittest.mock import AsyncMock, MagicMock
 
@@ -98,6 +100,91 @@ async def test_complains_about_out_of_sync_schemas(
         await source_db.execute("DROP TABLE unsynced_table")
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ('create', 'drop'),
+    (
+        ("CREATE TYPE unsynced_type AS (bar INT)", "DROP TYPE unsynced_type"),
+        (
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "DROP EXTENSION pg_trgm",
+        ),
+        ("CREATE SCHEMA unsynced_schema", "DROP SCHEMA unsynced_schema"),
+        (
+            "CREATE COLLATION unsynced_collation FROM \"C\"",
+            "DROP COLLATION unsynced_collation",
+        ),
+        ("CREATE CAST (json AS int4) WITH INOUT", "DROP CAST (json AS int4)"),
+        (
+            "CREATE OPERATOR === (FUNCTION = int4eq, LEFTARG = int4, RIGHTARG = int4)",
+            "DROP OPERATOR === (int4, int4)",
+        ),
+        (
+            "CREATE TEXT SEARCH CONFIGURATION unsynced_config (COPY = english)",
+            "DROP TEXT SEARCH CONFIGURATION unsynced_config",
+        ),
+        (
+            "CREATE FOREIGN DATA WRAPPER unsynced_wrapper",
+            "DROP FOREIGN DATA WRAPPER unsynced_wrapper",
+        ),
+        (
+            "ALTER DEFAULT PRIVILEGES GRANT SELECT ON TABLES TO PUBLIC",
+            "ALTER DEFAULT PRIVILEGES REVOKE SELECT ON TABLES FROM PUBLIC",
+        ),
+    ),
+)
+async def test_complains_about_out_of_sync_non_relations(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+    create: str,
+    drop: str,
+) -> None:
+    try:
+        await source_db.execute(create)
+        args = cli_parser.parse_args(["check"])
+        result = await check.check_schema_sync(
+            source_db=source_db, target_db=target_db, args=args
+        )
+        assert result is not None
+    finally:
+        await source_db.execute(drop)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'statement',
+    (
+        "COMMENT ON TABLE partly_synced_table IS 'differs'",
+        "ALTER TABLE partly_synced_table ENABLE ROW LEVEL SECURITY",
+        "CREATE POLICY partly_synced_policy ON partly_synced_table USING (bar > 0)",
+        "CREATE RULE partly_synced_rule AS ON DELETE TO partly_synced_table DO INSTEAD NOTHING",
+        "CREATE STATISTICS partly_synced_stats ON bar, baz FROM partly_synced_table",
+        "ALTER TABLE partly_synced_table ALTER COLUMN baz SET STATISTICS 500",
+        "ALTER TABLE partly_synced_table ALTER COLUMN qux SET STORAGE EXTERNAL",
+    ),
+)
+async def test_complains_about_out_of_sync_table_details(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+    statement: str,
+) -> None:
+    create = "CREATE TABLE partly_synced_table (bar INT PRIMARY KEY, baz INT, qux TEXT)"
+    try:
+        await source_db.execute(create)
+        await target_db.execute(create)
+        await source_db.execute(statement)
+        args = cli_parser.parse_args(["check"])
+        result = await check.check_schema_sync(
+            source_db=source_db, target_db=target_db, args=args
+        )
+        assert result is not None
+    finally:
+        await source_db.execute("DROP TABLE partly_synced_table CASCADE")
+        await target_db.execute("DROP TABLE partly_synced_table CASCADE")
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize('limit', (3,))
 async def test_complains_about_mismatched_database_options(
@@ -130,3 +217,173 @@ async def test_complains_about_mismatched_database_options(
         )
     finally:
         await source_db.execute(f"ALTER DATABASE {dbname} CONNECTION LIMIT {old_limit}")
+
+
+@pytest.mark.asyncio
+async def test_run_check_enforces_per_check_timeout(
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    async def check_sleeps(
+        source_db: asyncpg.Connection,
+        target_db: asyncpg.Connection,
+        args: argparse.Namespace,
+    ) -> None:
+        """Sleeps for a long time."""
+        await asyncio.sleep(60)
+
+    args = cli_parser.parse_args(["check"])
+    args.check_timeouts = [("check_sleeps", 0.1)]
+    result = await check.run_check(
+        check_sleeps,
+        source_db=MagicMock(spec=asyncpg.Connection),
+        target_db=MagicMock(spec=asyncpg.Connection),
+        args=args,
+    )
+    assert result.error == "timed out after 0.1 seconds"
+    assert 0.1 <= result.duration < 60
+
+
+def test_rejects_per_check_timeout_of_unknown_check(
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    args = cli_parser.parse_args(
+        ["check", "--per-check-timeout", "check_schema_sync:600"]
+    )
+    assert args.check_timeouts == [("check_schema_sync", 600.0)]
+
+    with pytest.raises(SystemExit):
+        cli_parser.parse_args(["check", "--per-check-timeout", "check_schema:600"])
+
+
+@pytest.mark.asyncio
+async def test_find_problems_cancels_running_checks_when_closed(
+    cli_parser: argparse.ArgumentParser, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cancelled = asyncio.Event()
+
+    async def check_fails(
+        source_db: asyncpg.Connection,
+        target_db: asyncpg.Connection,
+        args: argparse.Namespace,
+    ) -> str:
+        """Fails right away."""
+        return "failed"
+
+    async def check_sleeps(
+        source_db: asyncpg.Connection,
+        target_db: asyncpg.Connection,
+        args: argparse.Namespace,
+    ) -> None:
+        """Sleeps for a long time."""
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(check, 'CHECKS', (check_fails, check_sleeps))
+    args = cli_parser.parse_args(["check"])
+    async with contextlib.aclosing(
+        check.find_problems(
+            MagicMock(spec=asyncpg.Connection),
+            MagicMock(spec=asyncpg.Connection),
+            args,
+        )
+    ) as results:
+        async for result in results:
+            assert result.error == "failed"
+            break
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_complains_about_missing_replication_capacity(
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    source_db = MagicMock(spec=asyncpg.Connection)
+    # max_replication_slots, used slots, max_wal_senders, used senders
+    source_db.fetchrow = AsyncMock(return_value=(10, 10, 10, 2))
+    target_db = MagicMock(spec=asyncpg.Connection)
+    # max_logical_replication_workers, max_worker_processes, used workers,
+    # subscription oid
+    target_db.fetchrow = AsyncMock(return_value=(4, 8, 0, 16401))
+
+    args = cli_parser.parse_args(["check"])
+    result = await check.check_replication_capacity(
+        source_db=source_db, target_db=target_db, args=args
+    )
+    assert result == (
+        "no free replication slots on source "
+        "(10 of max_replication_slots = 10 in use)"
+    )
+    # Table synchronization slots of the subscription are not counted as used.
+    (*_, patterns) = source_db.fetchrow.call_args.args
+    assert patterns == check.tablesync_patterns(16401)
+
+
+@pytest.mark.asyncio
+async def test_complains_about_full_table_scans_on_apply(
+    source_db: asyncpg.Connection,
+    target_db: asyncpg.Connection,
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    source_tx = source_db.transaction()
+    target_tx = target_db.transaction()
+    try:
+        await source_tx.start()
+        await target_tx.start()
+        for db in (source_db, target_db):
+            await db.execute("CREATE TABLE full_identity (foo INT)")
+            await db.execute("ALTER TABLE full_identity REPLICA IDENTITY FULL")
+
+        args = cli_parser.parse_args(["check", "--max-apply-scan-size", "0"])
+        result = await check.check_apply_lookup_index(
+            source_db=source_db, target_db=target_db, args=args
+        )
+        assert result is not None
+        assert result.startswith(
+            "target scans the whole table for each replicated UPDATE/DELETE "
+            "on table public.full_identity (REPLICA IDENTITY FULL, "
+        )
+    finally:
+        await target_tx.rollback()
+        await source_tx.rollback()
+
+
+@pytest.mark.asyncio
+async def test_complains_about_wal_rate_above_apply_throughput(
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    source_db = MagicMock(spec=asyncpg.Connection)
+    source_db.fetchrow = AsyncMock(side_effect=[(0,), (2**30,)])
+    target_db = MagicMock(spec=asyncpg.Connection)
+
+    args = cli_parser.parse_args(
+        ["check", "--wal-sample-pause", "0.1", "--apply-throughput", "1MB"]
+    )
+    result = await check.check_wal_generation_rate(
+        source_db=source_db, target_db=target_db, args=args
+    )
+    assert result is not None
+    assert result.endswith("but target applies only 1 MB/s")
+
+
+@pytest.mark.asyncio
+async def test_uses_given_wal_rate_without_sampling(
+    cli_parser: argparse.ArgumentParser,
+) -> None:
+    source_db = MagicMock(spec=asyncpg.Connection)
+    target_db = MagicMock(spec=asyncpg.Connection)
+
+    for (arguments, expected) in (
+        (["--wal-rate", "2MB", "--apply-throughput", "1MB"], False),
+        (["--wal-rate", "512kB", "--apply-throughput", "1MB"], True),
+        ([], True),
+    ):
+        args = cli_parser.parse_args(["check", *arguments])
+        result = await check.check_wal_generation_rate(
+            source_db=source_db, target_db=target_db, args=args
+        )
+        assert (result is None) is expected
+    source_db.fetchrow.assert_not_called()
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from ivory import history
+
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_sample(seconds: int) -> history.Sample:
+    return history.Sample(
+        collected_at=START + timedelta(seconds=seconds),
+        source_lsn=1000 + seconds,
+        flush_lsn=1000,
+        reply_delta=None,
+        copy_remaining=0,
+        retained_bytes=2000 + 2 * seconds,
+    )
+
+
+def test_ring_buffer_keeps_latest_samples(tmp_path: Path) -> None:
+    path = tmp_path / 'history'
+    with history.History(path, capacity=3) as ring:
+        for seconds in range(5):
+            ring.append(make_sample(seconds))
+
+    with history.History(path, capacity=3) as ring:
+        assert ring.samples() == [make_sample(2), make_sample(3), make_sample(4)]
+        assert ring.samples(since=START + timedelta(seconds=3)) == [
+            make_sample(3),
+            make_sample(4),
+        ]
+    assert path.stat().st_size == history.HEADER.size + 3 * history.RECORD_SIZE
+
+
+def test_incompatible_file_is_reset(tmp_path: Path) -> None:
+    path = tmp_path / 'history'
+    with history.History(path, capacity=3) as ring:
+        ring.append(make_sample(0))
+
+    with history.History(path, capacity=4) as ring:
+        assert ring.samples() == []
+
+
+def test_trend_reports_growing_lag() -> None:
+    result = history.trend([make_sample(seconds) for seconds in range(0, 60, 10)])
+
+    assert result is not None
+    assert result.lag_rate == 1.0
+    assert result.catch_up is None
+    assert result.regressions == ['lag grows by 1 bytes/s']
+    assert result.retained_rate == 2.0
@@ -1,8 +1,13 @@
+import argparse
+import asyncio
 import os
+import signal
 import subprocess
 
 import pytest  # type: ignore
 
+from ivory import __main__
+
 
 @pytest.mark.skipif(
     os.getenv('CI') == 'true', reason="docker images disallow replication connections"
@@ -11,3 +16,22 @@ def test_invoke_via_entry_point():
     # how the hell does coverage parsing work here?
     # this is pure magic
     subprocess.check_call(['python', '-m', 'ivory', 'check'])
+
+
+@pytest.mark.asyncio
+async def test_run_cancels_command_on_interrupt() -> None:
+    async def until_interrupted(args: argparse.Namespace) -> int:
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            return 0
+        return 1
+
+    async def interrupted(args: argparse.Namespace) -> int:
+        await asyncio.sleep(60)
+        return 0
+
+    for (func, expected) in ((until_interrupted, 0), (interrupted, 130)):
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.1, os.kill, os.getpid(), signal.SIGINT)
+        assert await __main__.run(argparse.Namespace(func=func)) == expected
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from ivory import metrics
+from ivory import status
+
+
+def test_status_metrics_render() -> None:
+    result = status.Status(
+        collected_at=datetime(2024, 1, 1),
+        replication_state='streaming',
+        last_reply_delta=timedelta(seconds=2),
+        source_lsn=1000,
+        flush_lsn=400,
+        slot_active=True,
+        sync_slot=None,
+        relations=[
+            status.Relation('public.foo', b'r'),
+            status.Relation('public."Bar"', b'd', source_size=100, target_size=25),
+        ],
+        source_indexes=2,
+        target_indexes=2,
+        source_unvalidated=0,
+        target_unvalidated=0,
+        slot_usage=status.SlotUsage(
+            retained_bytes=4096,
+            wal_status='reserved',
+            safe_wal_size=None,
+            xmin_age=None,
+            catalog_xmin_age=12,
+        ),
+        lag=status.Lag(
+            network_delay=timedelta(milliseconds=250),
+            network_bytes=100,
+            apply_delay=None,
+            apply_bytes=500,
+        ),
+    )
+
+    text = metrics.render(metrics.status_metrics(result, subscription_name='sub'))
+
+    lines = text.splitlines()
+    assert 'ivory_lag_bytes{subscription="sub"} 600' in lines
+    assert 'ivory_relations{subscription="sub",state="ready"} 1' in lines
+    assert 'ivory_relations{subscription="sub",state="synchronized"} 0' in lines
+    assert (
+        'ivory_relation_copy_progress_ratio'
+        '{subscription="sub",relation="public.\\"Bar\\""} 0.25'
+    ) in lines
+    assert 'ivory_slot_retained_wal_bytes{subscription="sub"} 4096' in lines
+    assert 'ivory_slot_catalog_xmin_age{subscription="sub"} 12' in lines
+    assert not any(line.startswith('ivory_slot_safe_wal_size') for line in lines)
+    assert 'ivory_network_delay_seconds{subscription="sub"} 0.25' in lines
+    assert 'ivory_apply_backlog_bytes{subscription="sub"} 500' in lines
+    assert not any(line.startswith('ivory_apply_delay_seconds') for line in lines)
+    assert lines[-1] == '# EOF'
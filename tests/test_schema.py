@@ -0,0 +1,41 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest  # type: ignore
+
+from ivory import schema
+
+
+@pytest.fixture
+def fake_pg_dump(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    script = tmp_path / 'pg_dump'
+    script.write_text(
+        '#!/bin/sh\n'
+        'echo "-- Dumped from database version 15.1"\n'
+        'echo "CREATE TABLE public.foo (bar integer);"\n'
+        'echo "-- password: $PGPASSWORD"\n'
+        'exit ${FAKE_PG_DUMP_RC:-0}\n'
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.delenv('PGPASSWORD', raising=False)
+    return script
+
+
+@pytest.mark.asyncio
+async def test_dump_normalizes_output(fake_pg_dump: Path) -> None:
+    sql = await schema.dump(
+        host=None, port=None, dbname=None, user=None, password='hunter2'
+    )
+    assert sql == "CREATE TABLE public.foo (bar integer);\n-- password: hunter2"
+    assert 'PGPASSWORD' not in os.environ
+
+
+@pytest.mark.asyncio
+async def test_dump_raises_on_pg_dump_failure(
+    fake_pg_dump: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv('FAKE_PG_DUMP_RC', '1')
+    with pytest.raises(subprocess.CalledProcessError):
+        await schema.dump(host=None, port=None, dbname=None, user=None, password=None)
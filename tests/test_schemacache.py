@@ -0,0 +1,119 @@
+import os
+from pathlib import Path
+from typing import Any, Dict
+from unittest.mock import AsyncMock, MagicMock
+
+import asyncpg  # type: ignore
+import pytest  # type: ignore
+
+from ivory import schema
+from ivory import schemacache
+
+
+def test_evict_removes_least_recently_used_entries(tmp_path: Path) -> None:
+    for age, name in enumerate(('new', 'old', 'older')):
+        path = tmp_path / f'{name}.sql'
+        path.write_text('x' * 10)
+        os.utime(path, (1000 - age, 1000 - age))
+
+    schemacache.evict(cache_dir=tmp_path, max_size=15)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['new.sql']
+
+
+@pytest.mark.asyncio
+async def test_dump_reuses_entry_while_catalog_is_unchanged(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fake_dump = AsyncMock(return_value='CREATE TABLE public.foo (bar integer);')
+    monkeypatch.setattr(schema, 'dump', fake_dump)
+    monkeypatch.setattr(
+        schema, 'dump_version', AsyncMock(return_value='pg_dump (PostgreSQL) 16.0')
+    )
+    db = MagicMock(spec=asyncpg.Connection)
+    db.fetchrow = AsyncMock(return_value=('marker',))
+
+    options: Dict[str, Any] = dict(
+        cache_dir=tmp_path,
+        max_size=1024,
+        host=None,
+        port=None,
+        dbname='ivory',
+        user=None,
+        password=None,
+    )
+    first = await schemacache.dump(db, **options)
+    second = await schemacache.dump(db, **options)
+    assert first == second == fake_dump.return_value
+    assert fake_dump.await_count == 1
+
+    db.fetchrow = AsyncMock(return_value=('changed marker',))
+    await schemacache.dump(db, **options)
+    assert fake_dump.await_count == 2
+
+    monkeypatch.setattr(
+        schema, 'dump_version', AsyncMock(return_value='pg_dump (PostgreSQL) 99.0')
+    )
+    await schemacache.dump(db, **options)
+    assert fake_dump.await_count == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ('create', 'drop'),
+    (
+        (
+            "CREATE COLLATION cached_collation FROM \"C\"",
+            "DROP COLLATION IF EXISTS cached_collation",
+        ),
+        (
+            "CREATE CAST (json AS int4) WITH INOUT",
+            "DROP CAST IF EXISTS (json AS int4)",
+        ),
+        (
+            "CREATE FOREIGN DATA WRAPPER cached_wrapper",
+            "DROP FOREIGN DATA WRAPPER IF EXISTS cached_wrapper",
+        ),
+        (
+            "CREATE TEXT SEARCH CONFIGURATION cached_config (COPY = english)",
+            "DROP TEXT SEARCH CONFIGURATION IF EXISTS cached_config",
+        ),
+    ),
+)
+async def test_cache_key_changes_with_catalogs(
+    source_db: asyncpg.Connection,
+    monkeypatch: pytest.MonkeyPatch,
+    create: str,
+    drop: str,
+) -> None:
+    monkeypatch.setattr(
+        schema, 'dump_version', AsyncMock(return_value='pg_dump (PostgreSQL) 16.0')
+    )
+    options: Dict[str, Any] = dict(
+        host=None, port=None, dbname='ivory', user=None, tables=None
+    )
+    before = await schemacache.cache_key(source_db, **options)
+    try:
+        await source_db.execute(create)
+        assert await schemacache.cache_key(source_db, **options) != before
+    finally:
+        await source_db.execute(drop)
+
+
+@pytest.mark.asyncio
+async def test_cache_key_changes_with_renamed_role(
+    source_db: asyncpg.Connection, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        schema, 'dump_version', AsyncMock(return_value='pg_dump (PostgreSQL) 16.0')
+    )
+    options: Dict[str, Any] = dict(
+        host=None, port=None, dbname='ivory', user=None, tables=None
+    )
+    await source_db.execute("CREATE ROLE cached_role")
+    try:
+        before = await schemacache.cache_key(source_db, **options)
+        await source_db.execute("ALTER ROLE cached_role RENAME TO renamed_role")
+        assert await schemacache.cache_key(source_db, **options) != before
+    finally:
+        await source_db.execute("DROP ROLE IF EXISTS cached_role")
+        await source_db.execute("DROP ROLE IF EXISTS renamed_role")
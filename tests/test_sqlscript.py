@@ -0,0 +1,75 @@
+from typing import List
+
+import pytest  # type: ignore
+
+from ivory import sqlscript
+
+
+@pytest.mark.parametrize(
+    'lines, expected',
+    [
+        (
+            ["SELECT 'a;b', \"c;d\";", 'SELECT 2;'],
+            ["SELECT 'a;b', \"c;d\";", 'SELECT 2;'],
+        ),
+        (["SELECT 'it''s;';"], ["SELECT 'it''s;';"]),
+        (["SELECT E'\\';'; SELECT 2;"], ["SELECT E'\\';';", 'SELECT 2;']),
+        (['SELECT $tag$ $$;', '$tag$;'], ['SELECT $tag$ $$;\n$tag$;']),
+        (['SELECT $1 ; SELECT a$b$c;'], ['SELECT $1 ;', 'SELECT a$b$c;']),
+        (
+            ['/* a /* nested; */ comment; */ SELECT 1;'],
+            ['/* a /* nested; */ comment; */ SELECT 1;'],
+        ),
+        (['--', '-- Name: x', '--', '', 'SELECT 1;', '\\connect foo'], ['SELECT 1;']),
+        (['SELECT 1', ';'], ['SELECT 1\n;']),
+        (
+            [
+                'CREATE FUNCTION public.f(a integer) RETURNS integer',
+                '    LANGUAGE sql',
+                '    BEGIN ATOMIC',
+                '     SELECT CASE WHEN a > 0 THEN 1 ELSE 0 END AS sign;',
+                '     SELECT 2 AS "end";',
+                '    END;',
+                'SELECT 3;',
+            ],
+            [
+                'CREATE FUNCTION public.f(a integer) RETURNS integer\n'
+                '    LANGUAGE sql\n'
+                '    BEGIN ATOMIC\n'
+                '     SELECT CASE WHEN a > 0 THEN 1 ELSE 0 END AS sign;\n'
+                '     SELECT 2 AS "end";\n'
+                '    END;',
+                'SELECT 3;',
+            ],
+        ),
+        (
+            ['BEGIN;', 'SELECT case_value FROM atomic;', 'END;'],
+            ['BEGIN;', 'SELECT case_value FROM atomic;', 'END;'],
+        ),
+        (['SELECT 1'], ['SELECT 1']),
+    ],
+)
+def test_split(lines: List[str], expected: List[str]) -> None:
+    assert [statement.sql for statement in sqlscript.split(lines)] == expected
+
+
+def test_split_copy() -> None:
+    statements = sqlscript.split(
+        ['COPY public.t (id, note) FROM stdin;', '1\tsemi;colon', '\\.', 'SELECT 1;']
+    )
+    assert statements == [
+        sqlscript.Statement(
+            sql='COPY public.t (id, note) FROM stdin;', data='1\tsemi;colon\n'
+        ),
+        sqlscript.Statement(sql='SELECT 1;'),
+    ]
+
+
+def test_split_rejects_unterminated_quote() -> None:
+    with pytest.raises(ValueError):
+        sqlscript.split(["SELECT 'unterminated;"])
+
+
+def test_split_rejects_unterminated_function_body() -> None:
+    with pytest.raises(ValueError):
+        sqlscript.split(['CREATE PROCEDURE p() BEGIN ATOMIC', 'SELECT 1;'])